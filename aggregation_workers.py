@@ -0,0 +1,114 @@
+"""
+Fila de trabalho para os construtores das tabelas de resumo (votos_candidatos, votos_partido).
+
+Em vez de um INSERT ... SELECT por ano numa única conexão, a agregação é quebrada em
+unidades (ano, UF) ou (ano, UF, cargo), executadas em paralelo por um pool limitado
+de conexões. Cada unidade é uma transação pequena (poucos locks, longe do erro 1206)
+e é repetida com backoff em deadlock (1213) ou lock wait timeout (1205).
+
+Usado por create_table_votos_candidatos.py e create_table_votos_partido.py (--workers).
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sqlalchemy import text
+
+MAX_RETRIES = 5
+
+# Colunas que definem cada granularidade de unidade de trabalho
+UNIT_COLUMNS = {
+    'uf': ['ANO_ELEICAO', 'SG_UF'],
+    'cargo': ['ANO_ELEICAO', 'SG_UF', 'CD_CARGO_PERGUNTA'],
+}
+
+_print_lock = threading.Lock()
+
+
+def is_retryable_db_error(exc):
+    s = str(exc)
+    return "1213" in s or "1205" in s  # deadlock / lock wait timeout
+
+
+def slice_filter(alias, columns):
+    """
+    Filtro SQL de uma fatia do boletim_urna: uma comparação NULL-safe por coluna,
+    com parâmetros nomeados pela própria coluna (:ANO_ELEICAO, :SG_UF, ...).
+    """
+    return ' AND '.join(f"{alias}.{c} <=> :{c}" for c in columns)
+
+
+def ensure_unit_index(conn):
+    """Índice que deixa cada unidade ler só a sua fatia do boletim_urna."""
+    try:
+        conn.execute(text("""
+            CREATE INDEX idx_bu_unidade_agregacao
+            ON boletim_urna (ANO_ELEICAO, SG_UF, CD_CARGO_PERGUNTA)
+        """))
+    except Exception as e:
+        msg = str(e).lower()
+        if 'duplicate key name' not in msg and '1061' not in msg:
+            print(f"Aviso ao criar índice de origem: {e}")
+
+
+def get_units(conn, unidade='uf'):
+    """Lista as unidades de trabalho como dicionários {coluna: valor}."""
+    columns = UNIT_COLUMNS[unidade]
+    col_list = ', '.join(columns)
+    rows = conn.execute(text(f"""
+        SELECT DISTINCT {col_list}
+        FROM boletim_urna
+        WHERE ANO_ELEICAO IS NOT NULL
+        ORDER BY {col_list}
+    """)).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def describe(unit):
+    return '/'.join(str(v) for v in unit.values())
+
+
+def run_unit(engine, insert_unit, unit):
+    """Executa uma unidade numa transação própria, com retry em deadlock/lock wait."""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            with engine.begin() as conn:
+                insert_unit(conn, unit)
+            return attempt
+        except Exception as e:
+            if not is_retryable_db_error(e) or attempt == MAX_RETRIES:
+                raise
+            with _print_lock:
+                print(f"  {describe(unit)}: conflito de lock, tentativa {attempt + 1}/{MAX_RETRIES}...")
+            time.sleep(min(8, 0.4 * (2 ** (attempt - 1))) + random.uniform(0, 0.8))
+
+
+def run_units(engine, units, insert_unit, workers):
+    """
+    Executa insert_unit(conn, unit) para cada unidade em até `workers` conexões simultâneas,
+    informando o progresso. Retorna a lista de (unidade, erro) que falharam.
+    """
+    total = len(units)
+    print(f"{total} unidade(s) de trabalho em {workers} conexão(ões).")
+    inicio = time.perf_counter()
+    errors = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_unit, engine, insert_unit, unit): unit
+            for unit in units
+        }
+        for future in as_completed(futures):
+            unit = futures[future]
+            done += 1
+            try:
+                future.result()
+                status = 'ok'
+            except Exception as e:
+                errors.append((unit, e))
+                status = f'ERRO: {e}'
+            elapsed = time.perf_counter() - inicio
+            with _print_lock:
+                print(f"  [{done}/{total}] {describe(unit)} {status} ({elapsed:.0f}s)")
+    return errors
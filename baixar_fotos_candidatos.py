@@ -3,13 +3,29 @@
 Baixa arquivos ZIP com fotos de candidatos do CDN do TSE.
 
 URL: https://cdn.tse.jus.br/estatistica/sead/eleicoes/eleicoes{ano}/fotos/foto_cand{ano}_{uf}_div.zip
+
+Os arquivos são baixados em paralelo (--workers) e gravados em blocos direto no disco,
+num arquivo `.part` ao lado do destino. Um download interrompido é retomado de onde
+parou com uma requisição HTTP Range (If-Range com o ETag, então uma versão nova no
+servidor recomeça do zero). Ao terminar, o tamanho é conferido e o `.part` vira o ZIP.
+
+Ao lado de cada ZIP fica um `.meta.json` com ETag, Last-Modified e tamanho da versão
+baixada. Numa nova execução um HEAD compara esses dados com o servidor: só são
+baixados os arquivos que faltam ou que mudaram.
 """
 
 from __future__ import annotations
 
+import argparse
+import http.client
+import json
 import sys
+import threading
+import time
 import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -28,56 +44,233 @@ URL_TEMPLATE = (
     "eleicoes{ano}/fotos/foto_cand{ano}_{uf}_div.zip"
 )
 
+USER_AGENT = "dados-eleicoes-basicos/1.0"
+TIMEOUT = 120
+# Downloads simultâneos (o CDN limita conexões por cliente; poucos já saturam o link)
+WORKERS = 4
+# Bytes lidos da resposta e gravados no disco por vez
+BLOCO = 1024 * 1024
+# Tentativas por arquivo em erro de rede; cada uma retoma o .part
+TENTATIVAS = 3
+
+_print_lock = threading.Lock()
+
+
+@dataclass
+class Resultado:
+    ano: int
+    uf: str
+    status: str  # 'baixado', 'pulado' ou 'erro'
+    tamanho: int = 0
+    mensagem: str = ""
+
+
+def url_foto(ano: int, uf: str, template: str = URL_TEMPLATE) -> str:
+    return template.format(ano=ano, uf=uf)
+
+
+def caminho_parcial(destino: Path) -> Path:
+    return destino.with_name(destino.name + ".part")
+
+
+def caminho_meta(destino: Path) -> Path:
+    return destino.with_name(destino.name + ".meta.json")
+
+
+def ler_meta(destino: Path) -> dict:
+    try:
+        return json.loads(caminho_meta(destino).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def gravar_meta(destino: Path, remoto: dict, completo: bool) -> None:
+    meta = {**remoto, "completo": completo}
+    caminho_meta(destino).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+
+def _requisicao(url: str, method: str = "GET", headers: dict | None = None) -> urllib.request.Request:
+    return urllib.request.Request(url, method=method, headers={"User-Agent": USER_AGENT, **(headers or {})})
 
-def url_foto(ano: int, uf: str) -> str:
-    return URL_TEMPLATE.format(ano=ano, uf=uf)
 
+def info_remota(url: str, timeout: float = TIMEOUT) -> dict:
+    """HEAD: tamanho, ETag, Last-Modified e suporte a Range da versão no servidor."""
+    try:
+        with urllib.request.urlopen(_requisicao(url, "HEAD"), timeout=timeout) as resp:
+            headers = resp.headers
+    except urllib.error.HTTPError as exc:
+        if exc.code not in (405, 501):
+            raise
+        # servidor sem HEAD: as informações vêm dos cabeçalhos do GET
+        return {"url": url, "tamanho": None, "etag": None, "last_modified": None, "ranges": False}
+    tamanho = headers.get("Content-Length")
+    return {
+        "url": url,
+        "tamanho": int(tamanho) if tamanho is not None else None,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "ranges": headers.get("Accept-Ranges", "").lower() == "bytes",
+    }
 
-def baixar(url: str, destino: Path) -> None:
-    req = urllib.request.Request(url, headers={"User-Agent": "dados-eleicoes-basicos/1.0"})
-    with urllib.request.urlopen(req, timeout=120) as resp:
-        destino.write_bytes(resp.read())
 
+def mesma_versao(meta: dict, remoto: dict) -> bool:
+    """Compara a versão registrada no .meta.json com a do servidor (ETag, senão Last-Modified e tamanho)."""
+    if meta.get("url") != remoto["url"]:
+        return False
+    if meta.get("etag") and remoto["etag"]:
+        return meta["etag"] == remoto["etag"]
+    if remoto["tamanho"] is not None and meta.get("tamanho") != remoto["tamanho"]:
+        return False
+    if meta.get("last_modified") and remoto["last_modified"]:
+        return meta["last_modified"] == remoto["last_modified"]
+    return remoto["tamanho"] is not None
 
-def main() -> int:
-    ok = 0
-    pulados = 0
-    erros: list[str] = []
 
-    for ano in ANOS_ELEICAO:
-        pasta_ano = DESTINO_BASE / str(ano)
+def arquivo_atualizado(destino: Path, remoto: dict) -> bool:
+    """True se o destino já tem a versão do servidor e pode ser pulado."""
+    if not destino.exists() or destino.stat().st_size == 0:
+        return False
+    meta = ler_meta(destino)
+    if not meta:
+        # baixado antes do .meta.json: aceito se o tamanho confere (ou se o servidor não informa)
+        return remoto["tamanho"] is None or destino.stat().st_size == remoto["tamanho"]
+    if not meta.get("completo") or not mesma_versao(meta, remoto):
+        return False
+    return remoto["tamanho"] is None or destino.stat().st_size == remoto["tamanho"]
+
+
+def _baixar_parcial(url: str, destino: Path, remoto: dict, timeout: float, bloco: int) -> int:
+    """Baixa (ou continua) o .part e devolve seu tamanho final, conferido com o esperado."""
+    parcial = caminho_parcial(destino)
+    meta = ler_meta(destino)
+    inicio = 0
+    if parcial.exists() and not meta.get("completo") and mesma_versao(meta, remoto) and remoto["ranges"]:
+        inicio = parcial.stat().st_size
+    if remoto["tamanho"] is not None and inicio == remoto["tamanho"]:
+        return inicio
+    # registra a versão sendo baixada, para a retomada saber se o .part ainda vale
+    gravar_meta(destino, remoto, completo=False)
+
+    headers = {}
+    if inicio:
+        headers["Range"] = f"bytes={inicio}-"
+        # versão diferente no servidor: resposta 200 com o arquivo inteiro
+        if remoto["etag"]:
+            headers["If-Range"] = remoto["etag"]
+        elif remoto["last_modified"]:
+            headers["If-Range"] = remoto["last_modified"]
+
+    with urllib.request.urlopen(_requisicao(url, headers=headers), timeout=timeout) as resp:
+        if resp.status == 206:
+            total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+            esperado = int(total) if total.isdigit() else None
+            modo = "ab"
+        else:
+            tamanho = resp.headers.get("Content-Length")
+            esperado = int(tamanho) if tamanho is not None else None
+            inicio, modo = 0, "wb"
+            if remoto["tamanho"] is None and remoto["etag"] is None:
+                # sem HEAD: a versão é a do GET
+                remoto.update(tamanho=esperado, etag=resp.headers.get("ETag"),
+                              last_modified=resp.headers.get("Last-Modified"))
+                gravar_meta(destino, remoto, completo=False)
+        with open(parcial, modo) as f:
+            while True:
+                dados = resp.read(bloco)
+                if not dados:
+                    break
+                f.write(dados)
+
+    tamanho_final = parcial.stat().st_size
+    if esperado is not None and tamanho_final != esperado:
+        raise IOError(f"download incompleto: {tamanho_final:,} de {esperado:,} bytes")
+    return tamanho_final
+
+
+def baixar(url: str, destino: Path, timeout: float = TIMEOUT, bloco: int = BLOCO,
+           tentativas: int = TENTATIVAS) -> str:
+    """
+    Garante em `destino` a versão atual de `url`. Retorna 'pulado' se ela já estava lá
+    ou 'baixado'. Em erro o .part é mantido para a próxima tentativa/execução retomar;
+    o destino anterior (se houver) só é substituído quando o download termina.
+    """
+    remoto = info_remota(url, timeout)
+    if arquivo_atualizado(destino, remoto):
+        if not ler_meta(destino):
+            gravar_meta(destino, {**remoto, "tamanho": destino.stat().st_size}, completo=True)
+        return "pulado"
+
+    for tentativa in range(1, tentativas + 1):
+        try:
+            tamanho = _baixar_parcial(url, destino, remoto, timeout, bloco)
+            break
+        except urllib.error.HTTPError as exc:
+            if exc.code == 416:
+                # Range fora do arquivo: o .part não corresponde ao servidor, recomeça
+                caminho_parcial(destino).unlink(missing_ok=True)
+            elif exc.code < 500 or tentativa == tentativas:
+                raise
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
+            # conexão caiu no meio: a próxima tentativa continua o .part
+            if tentativa == tentativas:
+                raise
+        time.sleep(min(8, 2 ** (tentativa - 1)))
+
+    caminho_parcial(destino).replace(destino)
+    gravar_meta(destino, {**remoto, "tamanho": tamanho}, completo=True)
+    return "baixado"
+
+
+def baixar_uf(ano: int, uf: str, pasta: Path, template: str = URL_TEMPLATE, **kwargs) -> Resultado:
+    destino = pasta / f"foto_cand{ano}_{uf}_div.zip"
+    try:
+        status = baixar(url_foto(ano, uf, template), destino, **kwargs)
+        return Resultado(ano, uf, status, destino.stat().st_size)
+    except urllib.error.HTTPError as exc:
+        return Resultado(ano, uf, "erro", mensagem=f"HTTP {exc.code}")
+    except Exception as exc:
+        return Resultado(ano, uf, "erro", mensagem=str(exc))
+
+
+def baixar_todos(anos: list[int], ufs: list[str], destino_base: Path = DESTINO_BASE,
+                 workers: int = WORKERS, template: str = URL_TEMPLATE, **kwargs) -> list[Resultado]:
+    """Baixa os arquivos de cada (ano, UF) em até `workers` downloads simultâneos."""
+    tarefas = []
+    for ano in anos:
+        pasta_ano = destino_base / str(ano)
         pasta_ano.mkdir(parents=True, exist_ok=True)
+        tarefas.extend((ano, uf, pasta_ano) for uf in ufs)
+
+    print(f"{len(tarefas)} arquivo(s) em até {workers} download(s) simultâneo(s) → {destino_base}")
+    resultados = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(baixar_uf, ano, uf, pasta, template, **kwargs) for ano, uf, pasta in tarefas]
+        for done, future in enumerate(as_completed(futures), start=1):
+            r = future.result()
+            resultados.append(r)
+            detalhe = r.mensagem if r.status == "erro" else f"{r.tamanho:,} bytes"
+            with _print_lock:
+                print(f"  [{done}/{len(tarefas)}] {r.ano}/{r.uf} {r.status} ({detalhe})")
+    return resultados
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Baixa os ZIPs de fotos de candidatos do CDN do TSE.")
+    parser.add_argument("--anos", type=int, nargs="+", default=ANOS_ELEICAO)
+    parser.add_argument("--ufs", nargs="+", default=UFS)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="downloads simultâneos")
+    parser.add_argument("--destino", type=Path, default=DESTINO_BASE)
+    parser.add_argument("--url-template", default=URL_TEMPLATE, help="URL com {ano} e {uf}")
+    args = parser.parse_args(argv)
 
-        print(f"\n=== Eleição {ano} → {pasta_ano} ===")
-
-        for uf in UFS:
-            nome_arquivo = f"foto_cand{ano}_{uf}_div.zip"
-            destino = pasta_ano / nome_arquivo
-            url = url_foto(ano, uf)
-
-            if destino.exists() and destino.stat().st_size > 0:
-                print(f"  [{uf}] já existe, pulando ({destino.stat().st_size:,} bytes)")
-                pulados += 1
-                continue
-
-            print(f"  [{uf}] baixando {url} ...", end=" ", flush=True)
-            try:
-                baixar(url, destino)
-                print(f"ok ({destino.stat().st_size:,} bytes)")
-                ok += 1
-            except urllib.error.HTTPError as exc:
-                destino.unlink(missing_ok=True)
-                msg = f"HTTP {exc.code}"
-                print(msg)
-                erros.append(f"{ano}/{uf}: {msg}")
-            except Exception as exc:
-                destino.unlink(missing_ok=True)
-                print(f"erro: {exc}")
-                erros.append(f"{ano}/{uf}: {exc}")
+    resultados = baixar_todos(args.anos, args.ufs, args.destino, args.workers, args.url_template)
 
+    ok = sum(1 for r in resultados if r.status == "baixado")
+    pulados = sum(1 for r in resultados if r.status == "pulado")
+    erros = [f"{r.ano}/{r.uf}: {r.mensagem}" for r in resultados if r.status == "erro"]
     print(f"\nResumo: {ok} baixados, {pulados} pulados, {len(erros)} erros")
     if erros:
-        for item in erros:
+        for item in sorted(erros):
             print(f"  - {item}")
         return 1
     return 0
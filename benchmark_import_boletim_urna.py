@@ -0,0 +1,82 @@
+"""
+Benchmark dos modos de carga do import_boletim_urna.py sobre a amostra em bweb/.
+
+Cada modo carrega todos os CSVs numa tabela de benchmark recriada do zero
+(não toca em boletim_de_urna) e informa linhas/s. No layout tipado, a view e as
+tabelas-dicionário da tabela de benchmark também são recriadas e removidas no fim.
+
+Uso:
+    python benchmark_import_boletim_urna.py
+    python benchmark_import_boletim_urna.py --modos load-data --tabela bu_bench
+    python benchmark_import_boletim_urna.py --schema tipado
+    python benchmark_import_boletim_urna.py --carga-inicial   # compara com a carga normal
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+
+import import_boletim_urna as ibu
+
+
+def run_mode(modo, tabela, tipado=False, carga_inicial=False):
+    """Recria a tabela de benchmark, importa todos os arquivos no modo dado e mede."""
+    ibu.TABLE_NAME = tabela
+    engine = ibu.get_engine()
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS `{tabela}`'))
+        ibu.drop_typed_tables(conn)
+    engine.dispose()
+
+    inicio = time.perf_counter()
+    ibu.process_and_import(modo=modo, usar_manifesto=False, tipado=tipado, carga_inicial=carga_inicial)
+    elapsed = time.perf_counter() - inicio
+
+    engine = ibu.get_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text(f'SELECT COUNT(*) FROM `{tabela}`')).scalar()
+    engine.dispose()
+    return rows, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos modos de carga do boletim de urna.')
+    parser.add_argument('--modos', nargs='+', choices=ibu.MODOS, default=ibu.MODOS)
+    parser.add_argument('--tabela', default='boletim_de_urna_benchmark')
+    parser.add_argument('--schema', choices=['texto', 'tipado'], default='texto')
+    parser.add_argument('--carga-inicial', action='store_true',
+                        help='roda cada modo também com --carga-inicial e mostra o tempo economizado')
+    args = parser.parse_args()
+
+    tipado = args.schema == 'tipado'
+    resultados = []
+    for modo in args.modos:
+        print(f"\n=== Modo '{modo}' ===")
+        rows, elapsed = run_mode(modo, args.tabela, tipado)
+        resultados.append((modo, rows, elapsed))
+        if args.carga_inicial:
+            print(f"\n=== Modo '{modo}' (carga inicial) ===")
+            rows, elapsed = run_mode(modo, args.tabela, tipado, carga_inicial=True)
+            resultados.append((f'{modo}+inicial', rows, elapsed))
+
+    print(f"\n{'modo':<20} {'linhas':>12} {'segundos':>10} {'linhas/s':>12}")
+    for modo, rows, elapsed in resultados:
+        rate = rows / elapsed if elapsed else 0
+        print(f"{modo:<20} {rows:>12,} {elapsed:>10.1f} {rate:>12,.0f}")
+
+    if args.carga_inicial:
+        print("\nTempo economizado pela carga inicial (índices no fim):")
+        for (modo, _, normal), (_, _, inicial) in zip(resultados[::2], resultados[1::2]):
+            ganho = normal - inicial
+            pct = ganho / normal * 100 if normal else 0
+            print(f"  {modo:<12} {ganho:>10.1f} s ({pct:.0f}%)")
+
+    engine = ibu.get_engine()
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS `{args.tabela}`'))
+        ibu.drop_typed_tables(conn)
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,12 +12,15 @@ Ajustado para evitar erro 1206 (The total number of locks exceeds the lock table
 ao quebrar a carga em etapas menores.
 """
 
+import argparse
 import os
 from urllib.parse import quote_plus
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 
+from aggregation_workers import UNIT_COLUMNS, ensure_unit_index, get_units, run_units, slice_filter
+
 load_dotenv()
 
 DB_CONFIG = {
@@ -30,18 +33,27 @@ DB_CONFIG = {
 
 TABLE_NAME = 'votos_candidatos'
 
+# Impressão digital de cada partição (ANO_ELEICAO, SG_UF, NR_TURNO) das tabelas de origem
+# no último build; a carga incremental só re-agrega as partições cuja impressão mudou.
+PARTITIONS_TABLE = f'{TABLE_NAME}_particoes'
+
 
-def get_engine():
+def get_engine(pool_size=None):
     pwd = quote_plus(DB_CONFIG['password']) if DB_CONFIG['password'] else ''
     conn_str = (
         f"mysql+mysqlconnector://{DB_CONFIG['user']}:{pwd}"
         f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
     )
+    kwargs = {}
+    if pool_size is not None:
+        kwargs["pool_size"] = pool_size
+        kwargs["max_overflow"] = 0
     return create_engine(
         conn_str,
         pool_pre_ping=True,
         pool_recycle=3600,
         isolation_level="READ COMMITTED",
+        **kwargs,
     )
 
 
@@ -122,8 +134,50 @@ def get_anos(conn):
 
 def insert_for_year(conn, ano):
     print(f"Inserindo dados do ano {ano}...")
+    insert_slice(conn, {"ANO_ELEICAO": ano})
+
+
+# Grão de votos_candidatos: um votável por município, eleição, turno e cargo
+VOTAVEL_GRAIN = [
+    'ANO_ELEICAO',
+    'CD_MUNICIPIO',
+    'NM_MUNICIPIO',
+    'CD_ELEICAO',
+    'NR_TURNO',
+    'SG_UF',
+    'CD_CARGO_PERGUNTA',
+    'NR_VOTAVEL',
+    'NM_VOTAVEL',
+]
+
+
+def votavel_aggregate_sql(source, where='1 = 1', votos='CAST(QT_VOTOS AS UNSIGNED)'):
+    """
+    SELECT que agrega `source` no grão de votos_candidatos (SUM de `votos` por votável).
+    source é o boletim_urna ou um agregado mais fino dele (create_tables_votos_agregados).
+    """
+    grain = ',\n            '.join(VOTAVEL_GRAIN)
+    return f"""
+        SELECT
+            {grain},
+            MAX(DS_CARGO_PERGUNTA) AS DS_CARGO_PERGUNTA,
+            SUM({votos}) AS total_votos
+        FROM {source}
+        WHERE {where}
+        GROUP BY
+            {grain}
+    """
+
 
-    insert_sql = text(f"""
+def insert_from_aggregate_sql(aggregate_sql):
+    """
+    INSERT em votos_candidatos a partir de um agregado por votável (votavel_aggregate_sql).
+    O JOIN com consulta_cand vem depois do GROUP BY, uma vez por votável: linhas repetidas
+    no consulta_cand não multiplicam total_votos. Única definição de total_votos, usada
+    pela carga completa, pela incremental, pelas unidades paralelas e pelo build conjunto.
+    """
+    grain = ',\n            '.join(f'ag.{c}' for c in VOTAVEL_GRAIN)
+    return f"""
         INSERT INTO {TABLE_NAME} (
             NM_URNA_CANDIDATO,
             NM_VOTAVEL,
@@ -140,38 +194,189 @@ def insert_for_year(conn, ano):
         )
         SELECT
             MAX(cc.NM_URNA_CANDIDATO) AS NM_URNA_CANDIDATO,
-            bu.NM_VOTAVEL,
-            SUM(CAST(bu.QT_VOTOS AS UNSIGNED)) AS total_votos,
-            bu.ANO_ELEICAO,
-            bu.NM_MUNICIPIO,
-            bu.CD_MUNICIPIO,
-            bu.CD_ELEICAO,
-            bu.NR_TURNO,
-            bu.SG_UF,
-            MAX(bu.DS_CARGO_PERGUNTA) AS DS_CARGO_PERGUNTA,
+            ag.NM_VOTAVEL,
+            ag.total_votos,
+            ag.ANO_ELEICAO,
+            ag.NM_MUNICIPIO,
+            ag.CD_MUNICIPIO,
+            ag.CD_ELEICAO,
+            ag.NR_TURNO,
+            ag.SG_UF,
+            ag.DS_CARGO_PERGUNTA,
             MAX(cc.SG_PARTIDO) AS SG_PARTIDO,
             MAX(cc.DS_SIT_TOT_TURNO) AS SITUACAO_ELEICAO
-        FROM boletim_urna AS bu
+        FROM ({aggregate_sql}) AS ag
         LEFT JOIN consulta_cand AS cc
-            ON bu.ANO_ELEICAO = cc.ANO_ELEICAO
-            AND bu.NR_VOTAVEL = cc.NR_CANDIDATO
-            AND bu.SG_UF = cc.SG_UF
-            AND bu.CD_CARGO_PERGUNTA = cc.CD_CARGO
-            AND bu.CD_MUNICIPIO = cc.SG_UE
-        WHERE bu.ANO_ELEICAO = :ano
+            ON ag.ANO_ELEICAO = cc.ANO_ELEICAO
+            AND ag.NR_VOTAVEL = cc.NR_CANDIDATO
+            AND ag.SG_UF = cc.SG_UF
+            AND ag.CD_CARGO_PERGUNTA = cc.CD_CARGO
+            AND ag.CD_MUNICIPIO = cc.SG_UE
         GROUP BY
-            bu.ANO_ELEICAO,
-            bu.CD_MUNICIPIO,
-            bu.NM_MUNICIPIO,
-            bu.CD_ELEICAO,
-            bu.NR_TURNO,
-            bu.SG_UF,
-            bu.CD_CARGO_PERGUNTA,
-            bu.NR_VOTAVEL,
-            bu.NM_VOTAVEL
-    """)
+            {grain},
+            ag.DS_CARGO_PERGUNTA,
+            ag.total_votos
+    """
+
+
+def insert_slice(conn, fatia):
+    """
+    Agrega no destino uma fatia do boletim_urna, dada por {coluna: valor}:
+    um ano, uma unidade (ano, UF[, cargo]) ou uma partição (ano, UF, turno).
+    """
+    aggregate_sql = votavel_aggregate_sql('boletim_urna AS bu', where=slice_filter('bu', fatia))
+    conn.execute(text(insert_from_aggregate_sql(aggregate_sql)), fatia)
+
+
+def ensure_partitions_table(conn):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} (
+            ANO_ELEICAO VARCHAR(10) NOT NULL,
+            SG_UF VARCHAR(10) NOT NULL,
+            NR_TURNO VARCHAR(10) NOT NULL,
+            linhas BIGINT UNSIGNED NOT NULL,
+            soma_votos BIGINT UNSIGNED NOT NULL,
+            assinatura_bu BIGINT UNSIGNED NOT NULL,
+            assinatura_cand BIGINT UNSIGNED NOT NULL,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (ANO_ELEICAO, SG_UF, NR_TURNO)
+        ) ENGINE=InnoDB
+    """))
+
+
+def compute_partition_fingerprints(conn):
+    """
+    Impressão digital atual de cada partição: contagem, soma de votos e BIT_XOR dos CRC32
+    das linhas do boletim_urna, mais a assinatura do consulta_cand da mesma (ano, UF),
+    já que o JOIN traz nome de urna, partido e situação dos candidatos.
+    Custa uma varredura das origens, sem JOIN nem GROUP BY por candidato.
+    """
+    bu_rows = conn.execute(text("""
+        SELECT
+            ANO_ELEICAO,
+            COALESCE(SG_UF, ''),
+            COALESCE(NR_TURNO, ''),
+            COUNT(*),
+            COALESCE(SUM(CAST(QT_VOTOS AS UNSIGNED)), 0),
+            BIT_XOR(CRC32(CONCAT_WS('|',
+                CD_MUNICIPIO, NM_MUNICIPIO, CD_ELEICAO, NR_ZONA, NR_SECAO,
+                CD_CARGO_PERGUNTA, DS_CARGO_PERGUNTA, NR_VOTAVEL, NM_VOTAVEL, QT_VOTOS
+            )))
+        FROM boletim_urna
+        WHERE ANO_ELEICAO IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)).fetchall()
+
+    cand_rows = conn.execute(text("""
+        SELECT
+            ANO_ELEICAO,
+            COALESCE(SG_UF, ''),
+            BIT_XOR(CRC32(CONCAT_WS('|',
+                NR_CANDIDATO, CD_CARGO, SG_UE, NM_URNA_CANDIDATO, SG_PARTIDO, DS_SIT_TOT_TURNO
+            )))
+        FROM consulta_cand
+        WHERE ANO_ELEICAO IS NOT NULL
+        GROUP BY 1, 2
+    """)).fetchall()
+    cand = {(str(r[0]), r[1]): int(r[2] or 0) for r in cand_rows}
+
+    return {
+        (str(r[0]), r[1], r[2]): (int(r[3]), int(r[4]), int(r[5] or 0), cand.get((str(r[0]), r[1]), 0))
+        for r in bu_rows
+    }
+
+
+def load_stored_fingerprints(conn):
+    rows = conn.execute(text(f"""
+        SELECT ANO_ELEICAO, SG_UF, NR_TURNO, linhas, soma_votos, assinatura_bu, assinatura_cand
+        FROM {PARTITIONS_TABLE}
+    """)).fetchall()
+    return {(r[0], r[1], r[2]): (int(r[3]), int(r[4]), int(r[5]), int(r[6])) for r in rows}
+
+
+def save_fingerprint(conn, partition, fingerprint):
+    ano, sg_uf, nr_turno = partition
+    if fingerprint is None:
+        conn.execute(text(
+            f"DELETE FROM {PARTITIONS_TABLE} WHERE ANO_ELEICAO = :ano AND SG_UF = :sg_uf AND NR_TURNO = :nr_turno"
+        ), {"ano": ano, "sg_uf": sg_uf, "nr_turno": nr_turno})
+        return
+    linhas, soma_votos, assinatura_bu, assinatura_cand = fingerprint
+    conn.execute(text(f"""
+        INSERT INTO {PARTITIONS_TABLE}
+            (ANO_ELEICAO, SG_UF, NR_TURNO, linhas, soma_votos, assinatura_bu, assinatura_cand)
+        VALUES (:ano, :sg_uf, :nr_turno, :linhas, :soma_votos, :assinatura_bu, :assinatura_cand)
+        ON DUPLICATE KEY UPDATE
+            linhas = VALUES(linhas),
+            soma_votos = VALUES(soma_votos),
+            assinatura_bu = VALUES(assinatura_bu),
+            assinatura_cand = VALUES(assinatura_cand)
+    """), {
+        "ano": ano, "sg_uf": sg_uf, "nr_turno": nr_turno, "linhas": linhas,
+        "soma_votos": soma_votos, "assinatura_bu": assinatura_bu, "assinatura_cand": assinatura_cand,
+    })
+
+
+def delete_slice(conn, fatia):
+    """
+    Remove a fatia do destino num único DELETE, na transação da partição: a re-agregação
+    e a impressão digital só ficam visíveis (ou são desfeitas) junto com ele.
+    """
+    return conn.execute(text(f"""
+        DELETE FROM {TABLE_NAME}
+        WHERE {slice_filter(TABLE_NAME, fatia)}
+    """), fatia).rowcount
+
+
+def partition_slice(partition):
+    """Chave armazenada ('' para nulos) -> fatia da origem (None para nulos)."""
+    ano, sg_uf, nr_turno = partition
+    return {"ANO_ELEICAO": ano, "SG_UF": sg_uf or None, "NR_TURNO": nr_turno or None}
 
-    conn.execute(insert_sql, {"ano": ano})
+
+def target_table_exists(conn):
+    return conn.execute(text(
+        "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+    ), {"t": TABLE_NAME}).first() is not None
+
+
+def refresh_changed_partitions(engine, workers=1):
+    """
+    Carga incremental: compara a impressão digital de cada (ANO_ELEICAO, SG_UF, NR_TURNO)
+    com a do último build e, para cada partição nova, alterada ou removida, apaga a fatia
+    do destino e re-agrega só ela. Cada partição é uma transação (dados + impressão juntos);
+    com workers > 1 as partições rodam em paralelo pela fila de aggregation_workers.
+    """
+    with engine.begin() as conn:
+        ensure_partitions_table(conn)
+        atuais = compute_partition_fingerprints(conn)
+        anteriores = load_stored_fingerprints(conn)
+
+    alteradas = sorted(
+        p for p in set(atuais) | set(anteriores)
+        if atuais.get(p) != anteriores.get(p)
+    )
+    print(f"Partições: {len(atuais)} na origem, {len(alteradas)} alterada(s).")
+
+    def refresh_partition(conn, fatia):
+        partition = (fatia["ANO_ELEICAO"], fatia["SG_UF"] or '', fatia["NR_TURNO"] or '')
+        delete_slice(conn, fatia)
+        if partition in atuais:
+            insert_slice(conn, fatia)
+        save_fingerprint(conn, partition, atuais.get(partition))
+
+    errors = run_units(engine, [partition_slice(p) for p in alteradas], refresh_partition, workers)
+    if errors:
+        raise RuntimeError(f"{len(errors)} partição(ões) falharam; rode --incremental de novo para retomar.")
+
+
+def record_all_fingerprints(engine):
+    """Após um build completo, grava a impressão de todas as partições como ponto de partida."""
+    with engine.begin() as conn:
+        ensure_partitions_table(conn)
+        conn.execute(text(f"DELETE FROM {PARTITIONS_TABLE}"))
+        for partition, fingerprint in compute_partition_fingerprints(conn).items():
+            save_fingerprint(conn, partition, fingerprint)
 
 
 def create_target_indexes(conn):
@@ -184,6 +389,7 @@ def create_target_indexes(conn):
         f"CREATE INDEX idx_{TABLE_NAME}_turno ON {TABLE_NAME} (NR_TURNO)",
         f"CREATE INDEX idx_{TABLE_NAME}_votos ON {TABLE_NAME} (total_votos)",
         f"CREATE INDEX idx_{TABLE_NAME}_ano_municipio ON {TABLE_NAME} (ANO_ELEICAO, CD_MUNICIPIO)",
+        f"CREATE INDEX idx_{TABLE_NAME}_particao ON {TABLE_NAME} (ANO_ELEICAO, SG_UF, NR_TURNO)",
     ]
 
     for stmt in statements:
@@ -197,27 +403,54 @@ def create_target_indexes(conn):
                 print(f"Aviso ao criar índice final: {e}")
 
 
-def create_table():
-    engine = get_engine()
+def create_table(incremental=False, workers=1, unidade='uf'):
+    """
+    workers=1 mantém a carga serial ano a ano. Com workers > 1, a agregação é quebrada em
+    unidades (ano, UF) ou (ano, UF, cargo) executadas em paralelo (aggregation_workers).
+    """
+    engine = get_engine(pool_size=workers + 1)
 
     try:
         with engine.begin() as conn:
             ensure_source_indexes(conn)
+            if workers > 1:
+                ensure_unit_index(conn)
+            existe = target_table_exists(conn)
+
+        if incremental and existe:
+            refresh_changed_partitions(engine, workers)
+            with engine.begin() as conn:
+                create_target_indexes(conn)
+            print(f"Tabela '{TABLE_NAME}' atualizada (incremental).")
+            return
+        if incremental:
+            print(f"Tabela '{TABLE_NAME}' não existe; fazendo carga completa.")
+
+        with engine.begin() as conn:
             recreate_target_table(conn)
 
-        with engine.connect() as conn:
-            anos = get_anos(conn)
+        if workers > 1:
+            with engine.connect() as conn:
+                units = get_units(conn, unidade)
+            errors = run_units(engine, units, insert_slice, workers)
+            if errors:
+                raise RuntimeError(f"{len(errors)} unidade(s) falharam: {[u for u, _ in errors]}")
+        else:
+            with engine.connect() as conn:
+                anos = get_anos(conn)
 
-        print(f"Anos encontrados: {anos}")
+            print(f"Anos encontrados: {anos}")
 
-        # processa ano a ano, em transações separadas
-        for ano in anos:
-            with engine.begin() as conn:
-                insert_for_year(conn, ano)
+            # processa ano a ano, em transações separadas
+            for ano in anos:
+                with engine.begin() as conn:
+                    insert_for_year(conn, ano)
 
         with engine.begin() as conn:
             create_target_indexes(conn)
 
+        record_all_fingerprints(engine)
+
         print(f"Tabela '{TABLE_NAME}' criada com sucesso.")
 
     except Exception as e:
@@ -225,4 +458,18 @@ def create_table():
 
 
 if __name__ == "__main__":
-    create_table()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=f"Cria/atualiza a tabela {TABLE_NAME}.")
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='re-agrega só as partições (ano, UF, turno) alteradas desde o último build'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='conexões simultâneas; > 1 quebra a agregação em unidades paralelas'
+    )
+    parser.add_argument(
+        '--unidade', choices=sorted(UNIT_COLUMNS), default='uf',
+        help='granularidade das unidades com --workers: (ano, UF) ou (ano, UF, cargo)'
+    )
+    args = parser.parse_args()
+    create_table(incremental=args.incremental, workers=args.workers, unidade=args.unidade)
\ No newline at end of file
@@ -12,12 +12,15 @@ Ajustado para evitar erro 1206 (The total number of locks exceeds the lock table
 ao quebrar a carga em etapas menores.
 """
 
+import argparse
 import os
 from urllib.parse import quote_plus
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 
+from aggregation_workers import UNIT_COLUMNS, ensure_unit_index, get_units, run_units, slice_filter
+
 load_dotenv()
 
 DB_CONFIG = {
@@ -31,18 +34,23 @@ DB_CONFIG = {
 TABLE_NAME = 'votos_partido'
 
 
-def get_engine():
+def get_engine(pool_size=None):
     """Retorna o engine do SQLAlchemy."""
     pwd = quote_plus(DB_CONFIG['password']) if DB_CONFIG['password'] else ''
     conn_str = (
         f"mysql+mysqlconnector://{DB_CONFIG['user']}:{pwd}"
         f"@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
     )
+    kwargs = {}
+    if pool_size is not None:
+        kwargs["pool_size"] = pool_size
+        kwargs["max_overflow"] = 0
     return create_engine(
         conn_str,
         pool_pre_ping=True,
         pool_recycle=3600,
         isolation_level="READ COMMITTED",
+        **kwargs,
     )
 
 
@@ -123,7 +131,11 @@ def get_anos(conn):
 
 def insert_for_year(conn, ano):
     print(f"Inserindo dados do ano {ano}...")
+    insert_slice(conn, {"ANO_ELEICAO": ano})
+
 
+def insert_slice(conn, fatia):
+    """Agrega no destino uma fatia do boletim_urna, dada por {coluna: valor} (ano ou unidade)."""
     conn.execute(text(f"""
         INSERT INTO {TABLE_NAME} (
             NR_PARTIDO,
@@ -153,7 +165,7 @@ def insert_for_year(conn, ano):
             MAX(bu.DS_CARGO_PERGUNTA) AS DS_CARGO_PERGUNTA,
             bu.CD_CARGO_PERGUNTA
         FROM boletim_urna AS bu
-        WHERE bu.ANO_ELEICAO = :ano
+        WHERE {slice_filter('bu', fatia)}
         GROUP BY
             bu.ANO_ELEICAO,
             bu.CD_MUNICIPIO,
@@ -165,7 +177,7 @@ def insert_for_year(conn, ano):
             bu.NR_PARTIDO,
             bu.SG_PARTIDO,
             bu.NM_PARTIDO
-    """), {"ano": ano})
+    """), fatia)
 
 
 def create_target_indexes(conn):
@@ -194,22 +206,35 @@ def create_target_indexes(conn):
                 print(f"Aviso ao criar índice final: {e}")
 
 
-def create_table():
-    engine = get_engine()
+def create_table(workers=1, unidade='uf'):
+    """
+    workers=1 mantém a carga serial ano a ano. Com workers > 1, a agregação é quebrada em
+    unidades (ano, UF) ou (ano, UF, cargo) executadas em paralelo (aggregation_workers).
+    """
+    engine = get_engine(pool_size=workers + 1)
 
     try:
         with engine.begin() as conn:
             ensure_source_indexes(conn)
+            if workers > 1:
+                ensure_unit_index(conn)
             recreate_target_table(conn)
 
-        with engine.connect() as conn:
-            anos = get_anos(conn)
+        if workers > 1:
+            with engine.connect() as conn:
+                units = get_units(conn, unidade)
+            errors = run_units(engine, units, insert_slice, workers)
+            if errors:
+                raise RuntimeError(f"{len(errors)} unidade(s) falharam: {[u for u, _ in errors]}")
+        else:
+            with engine.connect() as conn:
+                anos = get_anos(conn)
 
-        print(f"Anos encontrados: {anos}")
+            print(f"Anos encontrados: {anos}")
 
-        for ano in anos:
-            with engine.begin() as conn:
-                insert_for_year(conn, ano)
+            for ano in anos:
+                with engine.begin() as conn:
+                    insert_for_year(conn, ano)
 
         with engine.begin() as conn:
             create_target_indexes(conn)
@@ -221,4 +246,14 @@ def create_table():
 
 
 if __name__ == "__main__":
-    create_table()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=f"Cria a tabela {TABLE_NAME}.")
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='conexões simultâneas; > 1 quebra a agregação em unidades paralelas'
+    )
+    parser.add_argument(
+        '--unidade', choices=sorted(UNIT_COLUMNS), default='uf',
+        help='granularidade das unidades com --workers: (ano, UF) ou (ano, UF, cargo)'
+    )
+    args = parser.parse_args()
+    create_table(workers=args.workers, unidade=args.unidade)
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Cria as tabelas votos_candidatos e votos_partido numa única passada pelo boletim_urna.
+
+Para cada ano, o boletim é lido uma vez e agregado numa tabela temporária no grão
+(município, eleição, turno, UF, cargo, votável, partido). As duas tabelas finais
+são derivadas desse agregado, que é ordens de grandeza menor que o boletim:
+  - votos_candidatos: re-agrupa por votável e junta o consulta_cand;
+  - votos_partido: re-agrupa por partido.
+
+Substitui rodar create_table_votos_candidatos.py e create_table_votos_partido.py em
+sequência (cada um varre o boletim inteiro com índices de origem próprios).
+As definições das tabelas e dos índices finais vêm desses dois scripts.
+"""
+
+from sqlalchemy import text
+
+import create_table_votos_candidatos as votos_candidatos
+import create_table_votos_partido as votos_partido
+
+AGGREGATE_TABLE = 'tmp_bu_agregado_ano'
+
+
+def build_year_aggregate(conn, ano):
+    """Única leitura do boletim_urna no ano: agrega no grão comum às duas tabelas finais."""
+    conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {AGGREGATE_TABLE}"))
+    conn.execute(text(f"""
+        CREATE TEMPORARY TABLE {AGGREGATE_TABLE} ENGINE=InnoDB AS
+        SELECT
+            bu.ANO_ELEICAO,
+            bu.CD_MUNICIPIO,
+            bu.NM_MUNICIPIO,
+            bu.CD_ELEICAO,
+            bu.NR_TURNO,
+            bu.SG_UF,
+            bu.CD_CARGO_PERGUNTA,
+            MAX(bu.DS_CARGO_PERGUNTA) AS DS_CARGO_PERGUNTA,
+            bu.NR_VOTAVEL,
+            bu.NM_VOTAVEL,
+            bu.NR_PARTIDO,
+            bu.SG_PARTIDO,
+            bu.NM_PARTIDO,
+            SUM(CAST(bu.QT_VOTOS AS UNSIGNED)) AS total_votos
+        FROM boletim_urna AS bu
+        WHERE bu.ANO_ELEICAO = :ano
+        GROUP BY
+            bu.ANO_ELEICAO,
+            bu.CD_MUNICIPIO,
+            bu.NM_MUNICIPIO,
+            bu.CD_ELEICAO,
+            bu.NR_TURNO,
+            bu.SG_UF,
+            bu.CD_CARGO_PERGUNTA,
+            bu.NR_VOTAVEL,
+            bu.NM_VOTAVEL,
+            bu.NR_PARTIDO,
+            bu.SG_PARTIDO,
+            bu.NM_PARTIDO
+    """), {"ano": ano})
+
+
+def insert_candidatos_from_aggregate(conn):
+    """
+    votos_candidatos a partir do agregado, com o mesmo SQL do insert_slice (re-agrupa por
+    votável e só então junta o consulta_cand): a carga incremental de uma partição dá os
+    mesmos totais que este build.
+    """
+    aggregate_sql = votos_candidatos.votavel_aggregate_sql(AGGREGATE_TABLE, votos='total_votos')
+    conn.execute(text(votos_candidatos.insert_from_aggregate_sql(aggregate_sql)))
+
+
+def insert_partido_from_aggregate(conn):
+    """votos_partido a partir do agregado: soma os votáveis de cada partido."""
+    conn.execute(text(f"""
+        INSERT INTO {votos_partido.TABLE_NAME} (
+            NR_PARTIDO,
+            SG_PARTIDO,
+            NM_PARTIDO,
+            total_votos,
+            ANO_ELEICAO,
+            NM_MUNICIPIO,
+            CD_MUNICIPIO,
+            CD_ELEICAO,
+            NR_TURNO,
+            SG_UF,
+            DS_CARGO_PERGUNTA,
+            CD_CARGO_PERGUNTA
+        )
+        SELECT
+            NR_PARTIDO,
+            SG_PARTIDO,
+            NM_PARTIDO,
+            SUM(total_votos) AS total_votos,
+            ANO_ELEICAO,
+            NM_MUNICIPIO,
+            CD_MUNICIPIO,
+            CD_ELEICAO,
+            NR_TURNO,
+            SG_UF,
+            MAX(DS_CARGO_PERGUNTA) AS DS_CARGO_PERGUNTA,
+            CD_CARGO_PERGUNTA
+        FROM {AGGREGATE_TABLE}
+        GROUP BY
+            ANO_ELEICAO,
+            CD_MUNICIPIO,
+            NM_MUNICIPIO,
+            CD_ELEICAO,
+            NR_TURNO,
+            SG_UF,
+            CD_CARGO_PERGUNTA,
+            NR_PARTIDO,
+            SG_PARTIDO,
+            NM_PARTIDO
+    """))
+
+
+def insert_for_year(conn, ano):
+    print(f"Agregando o ano {ano} (uma leitura do boletim para as duas tabelas)...")
+    build_year_aggregate(conn, ano)
+    insert_candidatos_from_aggregate(conn)
+    insert_partido_from_aggregate(conn)
+    conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {AGGREGATE_TABLE}"))
+
+
+def create_tables():
+    engine = votos_candidatos.get_engine()
+
+    try:
+        with engine.begin() as conn:
+            # Só os índices do votos_candidatos: idx_bu_join_votos_candidatos começa por
+            # ANO_ELEICAO (serve ao filtro por ano) e o do consulta_cand serve ao JOIN.
+            votos_candidatos.ensure_source_indexes(conn)
+            votos_candidatos.recreate_target_table(conn)
+            votos_partido.recreate_target_table(conn)
+
+        with engine.connect() as conn:
+            anos = votos_candidatos.get_anos(conn)
+
+        print(f"Anos encontrados: {anos}")
+
+        # ano a ano, numa transação por ano: as duas tabelas avançam juntas
+        for ano in anos:
+            with engine.begin() as conn:
+                insert_for_year(conn, ano)
+
+        with engine.begin() as conn:
+            votos_candidatos.create_target_indexes(conn)
+            votos_partido.create_target_indexes(conn)
+
+        # ponto de partida para create_table_votos_candidatos.py --incremental
+        votos_candidatos.record_all_fingerprints(engine)
+
+        print(f"Tabelas '{votos_candidatos.TABLE_NAME}' e '{votos_partido.TABLE_NAME}' criadas com sucesso.")
+
+    except Exception as e:
+        print(f"Erro ao criar as tabelas de votos: {e}")
+
+
+if __name__ == "__main__":
+    create_tables()
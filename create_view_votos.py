@@ -1,10 +1,16 @@
 """
 Cria uma VIEW no MySQL para consolidar o total de votos por candidato, por município, por turno e por ano.
 Utiliza as tabelas 'boletim_urna' e 'consulta_cand'.
+
+A agregação fica materializada na tabela MATERIALIZED_TABLE (com índices); a VIEW é só
+um SELECT sobre ela, então as consultas usam índice em vez de refazer o JOIN a cada leitura.
+Para atualizar os dados: python create_view_votos.py --refresh
+(monta uma tabela sombra e troca com RENAME TABLE atômico; leitores nunca veem a tabela vazia).
 """
 from sqlalchemy import create_engine, text
 
 import os
+import argparse
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
 
@@ -20,6 +26,9 @@ DB_CONFIG = {
 }
 
 VIEW_NAME = 'view_votos_candidatos_municipio'
+MATERIALIZED_TABLE = 'mv_votos_candidatos_municipio'
+SHADOW_TABLE = f'{MATERIALIZED_TABLE}_novo'
+OLD_TABLE = f'{MATERIALIZED_TABLE}_antigo'
 
 def get_engine():
     """Retorna o engine do SQLAlchemy."""
@@ -30,17 +39,51 @@ def get_engine():
     )
     return create_engine(conn_str)
 
-def create_view():
-    engine = get_engine()
-    
-    # Query para criar a VIEW
+def create_shadow_table(conn):
+    """Tabela sombra já com os índices de consulta (preenchida antes da troca)."""
+    conn.execute(text(f"DROP TABLE IF EXISTS {SHADOW_TABLE}"))
+    conn.execute(text(f"""
+    CREATE TABLE {SHADOW_TABLE} (
+        id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        NM_URNA_CANDIDATO VARCHAR(255) NULL,
+        NM_VOTAVEL VARCHAR(255) NULL,
+        NR_VOTAVEL VARCHAR(50) NULL,
+        total_votos BIGINT UNSIGNED NOT NULL,
+        ANO_ELEICAO VARCHAR(10) NULL,
+        NM_MUNICIPIO VARCHAR(255) NULL,
+        CD_MUNICIPIO VARCHAR(50) NULL,
+        CD_ELEICAO VARCHAR(50) NULL,
+        NR_TURNO VARCHAR(10) NULL,
+        SG_UF VARCHAR(10) NULL,
+        CD_CARGO_PERGUNTA VARCHAR(50) NULL,
+        DS_CARGO_PERGUNTA VARCHAR(255) NULL,
+        SG_PARTIDO VARCHAR(50) NULL,
+        SITUACAO_ELEICAO VARCHAR(255) NULL,
+        INDEX idx_mv_ano_municipio (ANO_ELEICAO, CD_MUNICIPIO, NR_TURNO),
+        INDEX idx_mv_ano_uf_turno (ANO_ELEICAO, SG_UF, NR_TURNO, CD_CARGO_PERGUNTA),
+        INDEX idx_mv_votavel (ANO_ELEICAO, NR_VOTAVEL),
+        INDEX idx_mv_total_votos (total_votos)
+    ) ENGINE=InnoDB
+    """))
+
+def fill_shadow_table(engine):
+    """Mesma agregação da VIEW original, ano a ano (evita o erro 1206 numa única transação gigante)."""
+    with engine.connect() as conn:
+        anos = [row[0] for row in conn.execute(text(
+            "SELECT DISTINCT ANO_ELEICAO FROM boletim_urna WHERE ANO_ELEICAO IS NOT NULL ORDER BY ANO_ELEICAO"
+        ))]
+
     # Nota: Usamos CAST(... AS CHAR) para garantir a compatibilidade de tipos no JOIN entre CD_MUNICIPIO e SG_UE
-    view_sql = f"""
-    CREATE OR REPLACE VIEW {VIEW_NAME} AS
+    insert_sql = f"""
+    INSERT INTO {SHADOW_TABLE} (
+        NM_URNA_CANDIDATO, NM_VOTAVEL, NR_VOTAVEL, total_votos, ANO_ELEICAO, NM_MUNICIPIO,
+        CD_MUNICIPIO, CD_ELEICAO, NR_TURNO, SG_UF, CD_CARGO_PERGUNTA, DS_CARGO_PERGUNTA,
+        SG_PARTIDO, SITUACAO_ELEICAO
+    )
     SELECT
-        bu.id,
         MAX(cc.NM_URNA_CANDIDATO) AS NM_URNA_CANDIDATO,
         bu.NM_VOTAVEL,
+        bu.NR_VOTAVEL,
         SUM(CAST(bu.QT_VOTOS AS UNSIGNED)) AS total_votos,
         bu.ANO_ELEICAO,
         bu.NM_MUNICIPIO,
@@ -48,6 +91,7 @@ def create_view():
         bu.CD_ELEICAO,
         bu.NR_TURNO,
         bu.SG_UF,
+        bu.CD_CARGO_PERGUNTA,
         MAX(bu.DS_CARGO_PERGUNTA) AS DS_CARGO_PERGUNTA,
         MAX(cc.SG_PARTIDO) AS SG_PARTIDO,
         MAX(cc.DS_SIT_TOT_TURNO) AS SITUACAO_ELEICAO
@@ -60,6 +104,7 @@ def create_view():
         AND bu.SG_UF = cc.SG_UF
         AND bu.CD_CARGO_PERGUNTA = cc.CD_CARGO
         AND bu.CD_MUNICIPIO = cc.SG_UE
+    WHERE bu.ANO_ELEICAO = :ano
     GROUP BY
         bu.ANO_ELEICAO,
         bu.CD_MUNICIPIO,
@@ -70,12 +115,69 @@ def create_view():
         bu.CD_CARGO_PERGUNTA,
         bu.NR_VOTAVEL,
         bu.NM_VOTAVEL
-    ORDER BY
-        total_votos DESC;
     """
 
-    print(f"Criando/Atualizando a VIEW '{VIEW_NAME}'...")
+    for ano in anos:
+        print(f"  Agregando o ano {ano}...")
+        with engine.begin() as conn:
+            conn.execute(text(insert_sql), {"ano": ano})
+
+def swap_in_shadow_table(conn):
+    """Troca a tabela materializada pela sombra num único RENAME TABLE (atômico para os leitores)."""
+    existe = conn.execute(text(
+        "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+    ), {"t": MATERIALIZED_TABLE}).first() is not None
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {OLD_TABLE}"))
+    if existe:
+        conn.execute(text(
+            f"RENAME TABLE {MATERIALIZED_TABLE} TO {OLD_TABLE}, {SHADOW_TABLE} TO {MATERIALIZED_TABLE}"
+        ))
+        conn.execute(text(f"DROP TABLE {OLD_TABLE}"))
+    else:
+        conn.execute(text(f"RENAME TABLE {SHADOW_TABLE} TO {MATERIALIZED_TABLE}"))
+
+def refresh_materialized_table(engine):
+    print(f"Atualizando a tabela materializada '{MATERIALIZED_TABLE}'...")
+    with engine.begin() as conn:
+        create_shadow_table(conn)
+    fill_shadow_table(engine)
+    with engine.begin() as conn:
+        swap_in_shadow_table(conn)
+    print(f"Tabela '{MATERIALIZED_TABLE}' atualizada.")
+
+def create_view():
+    engine = get_engine()
+
+    # Query para criar a VIEW: leitura direta da tabela materializada.
+    # Sem ORDER BY (cada consulta ordena o que precisar, usando os índices).
+    # NR_VOTAVEL e CD_CARGO_PERGUNTA vão no fim (as colunas originais mantêm a posição) para
+    # que filtros pela VIEW alcancem idx_mv_votavel e idx_mv_ano_uf_turno por inteiro.
+    view_sql = f"""
+    CREATE OR REPLACE VIEW {VIEW_NAME} AS
+    SELECT
+        id,
+        NM_URNA_CANDIDATO,
+        NM_VOTAVEL,
+        total_votos,
+        ANO_ELEICAO,
+        NM_MUNICIPIO,
+        CD_MUNICIPIO,
+        CD_ELEICAO,
+        NR_TURNO,
+        SG_UF,
+        DS_CARGO_PERGUNTA,
+        SG_PARTIDO,
+        SITUACAO_ELEICAO,
+        NR_VOTAVEL,
+        CD_CARGO_PERGUNTA
+    FROM
+        {MATERIALIZED_TABLE};
+    """
+
     try:
+        refresh_materialized_table(engine)
+        print(f"Criando/Atualizando a VIEW '{VIEW_NAME}'...")
         with engine.begin() as conn:
             conn.execute(text(view_sql))
         print(f"VIEW '{VIEW_NAME}' criada com sucesso.")
@@ -83,4 +185,14 @@ def create_view():
         print(f"Erro ao criar a VIEW: {e}")
 
 if __name__ == "__main__":
-    create_view()
+    parser = argparse.ArgumentParser(description=f"Cria a VIEW {VIEW_NAME} e sua tabela materializada.")
+    parser.add_argument('--refresh', action='store_true',
+                        help='só recalcula a tabela materializada (a VIEW já existe)')
+    args = parser.parse_args()
+    if args.refresh:
+        try:
+            refresh_materialized_table(get_engine())
+        except Exception as e:
+            print(f"Erro ao atualizar a tabela materializada: {e}")
+    else:
+        create_view()
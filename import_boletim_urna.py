@@ -1,13 +1,20 @@
 import os
 import glob
+import argparse
+import random
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 import pandas as pd
 from sqlalchemy import create_engine, text
 
 from dotenv import load_dotenv
 
+from import_manifest import open_manifest
+from parquet_cache import read_csv_chunks  # cache Parquet compartilhado com o pipeline
+
 load_dotenv()
 
 # Configuração do Banco de Dados
@@ -31,6 +38,13 @@ KEY_COLUMNS = ['CD_PLEITO', 'CD_MUNICIPIO', 'NR_ZONA', 'NR_SECAO', 'CD_CARGO_PER
 
 TABLE_NAME = 'boletim_de_urna'
 
+# Índices secundários que a carga inicial só cria no fim. As colunas são as do índice que
+# create_table_votos_candidatos.ensure_source_indexes cria em boletim_urna (outra tabela),
+# aqui para as mesmas junções por candidato feitas sobre boletim_de_urna.
+DEFERRED_INDEXES = {
+    'idx_bu_join_votos_candidatos': ['ANO_ELEICAO', 'NR_VOTAVEL', 'SG_UF', 'CD_CARGO_PERGUNTA', 'CD_MUNICIPIO'],
+}
+
 # Tamanhos VARCHAR conforme layout oficial / tabela alvo
 BU_COLUMN_LENGTHS = [
     ('DT_GERACAO', 10),
@@ -80,17 +94,80 @@ BU_COLUMN_LENGTHS = [
     ('NR_TURMA_APURADORA', 2),
 ]
 
+# Layout tipado (opt-in, --schema tipado): tipo SQL por coluna; as demais continuam VARCHAR.
+# Códigos podem vir como -1 ("não se aplica") no TSE, por isso são SIGNED; contagens são UNSIGNED.
+BU_TYPED_COLUMNS = {
+    'DT_GERACAO': 'DATE',
+    'HH_GERACAO': 'TIME',
+    'ANO_ELEICAO': 'SMALLINT UNSIGNED',
+    'CD_TIPO_ELEICAO': 'TINYINT',
+    'CD_PLEITO': 'SMALLINT',
+    'DT_PLEITO': 'DATETIME',
+    'NR_TURNO': 'TINYINT',
+    'CD_ELEICAO': 'SMALLINT',
+    'CD_MUNICIPIO': 'MEDIUMINT',
+    'NR_ZONA': 'SMALLINT',
+    'NR_SECAO': 'SMALLINT',
+    'NR_LOCAL_VOTACAO': 'SMALLINT',
+    'CD_CARGO_PERGUNTA': 'SMALLINT',
+    'NR_PARTIDO': 'SMALLINT',
+    'DT_BU_RECEBIDO': 'DATETIME',
+    'QT_APTOS': 'SMALLINT UNSIGNED',
+    'QT_COMPARECIMENTO': 'SMALLINT UNSIGNED',
+    'QT_ABSTENCOES': 'SMALLINT UNSIGNED',
+    'CD_TIPO_URNA': 'TINYINT',
+    'CD_TIPO_VOTAVEL': 'TINYINT',
+    'NR_VOTAVEL': 'MEDIUMINT',
+    'QT_VOTOS': 'SMALLINT UNSIGNED',
+    'NR_URNA_EFETIVADA': 'INT',
+    'DT_CARGA_URNA_EFETIVADA': 'DATETIME',
+    'DT_ABERTURA': 'DATETIME',
+    'DT_ENCERRAMENTO': 'DATETIME',
+    'QT_ELEI_BIOM_SEM_HABILITACAO': 'SMALLINT UNSIGNED',
+    'DT_EMISSAO_BU': 'DATETIME',
+    'NR_JUNTA_APURADORA': 'SMALLINT',
+    'NR_TURMA_APURADORA': 'SMALLINT',
+}
+
+# Textos longos e repetitivos viram id de tabela-dicionário (coluna -> tipo do id).
+# Na tabela tipada a coluna passa a se chamar <COLUNA>_ID.
+BU_DICTIONARY_COLUMNS = {
+    'NM_MUNICIPIO': 'MEDIUMINT UNSIGNED',
+    'DS_CARGO_PERGUNTA': 'SMALLINT UNSIGNED',
+    'NM_PARTIDO': 'SMALLINT UNSIGNED',
+}
+
+# Formatos de data do TSE (pandas / MySQL STR_TO_DATE)
+DATE_FORMAT = '%d/%m/%Y'
+DATETIME_FORMAT = '%d/%m/%Y %H:%M:%S'
+SQL_DATE_FORMAT = '%d/%m/%Y'
+SQL_DATETIME_FORMAT = '%d/%m/%Y %H:%i:%s'
+
 # Multithread: um arquivo por thread (sem overlap); duplicidade evitada por índice único + INSERT IGNORE
 MAX_WORKERS = 2
 CHUNKSIZE_READ = 10_000
 CHUNKSIZE_INSERT = 2_000
 
+# Modo 'processos': N processos fazem o parse/normalização; poucos escritores gravam no banco.
+# A fila limitada segura a memória quando o banco é mais lento que o parse.
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+WRITE_WORKERS = 1
+BATCH_QUEUE_SIZE = 8
+MAX_INSERT_RETRIES = 10
+
 _print_lock = threading.Lock()
 
+# Fila de lotes herdada pelos processos de parse (definida no initializer do pool)
+_batch_queue = None
+
+# Cache local valor -> id das tabelas-dicionário do layout tipado
+_dictionary_cache = {col: {} for col in BU_DICTIONARY_COLUMNS}
+_dictionary_lock = threading.Lock()
+
 
 from urllib.parse import quote_plus
 
-def get_engine(pool_size=None):
+def get_engine(pool_size=None, local_infile=False):
     """Retorna o engine do SQLAlchemy usando mysql-connector-python."""
     pwd = quote_plus(DB_CONFIG['password']) if DB_CONFIG['password'] else ''
     conn_str = f"mysql+mysqlconnector://{DB_CONFIG['user']}:{pwd}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
@@ -98,6 +175,9 @@ def get_engine(pool_size=None):
     if pool_size is not None:
         kwargs["pool_size"] = pool_size
         kwargs["max_overflow"] = max(0, pool_size - 1)
+    if local_infile:
+        # LOAD DATA LOCAL INFILE exige opt-in no cliente (e local_infile=ON no servidor)
+        kwargs["connect_args"] = {"allow_local_infile": True}
     return create_engine(conn_str, **kwargs)
 
 def clean_column_names(df):
@@ -119,16 +199,55 @@ def insert_ignore(table, conn, keys, data_iter):
     stmt = stmt.prefix_with('IGNORE')
     conn.execute(stmt)
 
-def build_create_table_sql():
-    """DDL com id AUTO_INCREMENT, VARCHARs oficiais e UNIQUE em chave natural."""
-    cols = ['`id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT']
+def dictionary_table(column):
+    return f'{TABLE_NAME}_dic_{column.lower()}'
+
+
+def reset_dictionary_cache():
+    """Esquece os ids em cache; chamada sempre que as tabelas-dicionário são criadas ou removidas."""
+    with _dictionary_lock:
+        for cache in _dictionary_cache.values():
+            cache.clear()
+
+
+def drop_typed_tables(conn):
+    """Remove a view com os textos e as tabelas-dicionário do layout tipado."""
+    conn.execute(text(f'DROP VIEW IF EXISTS `{TABLE_NAME}_texto`'))
+    for column in BU_DICTIONARY_COLUMNS:
+        conn.execute(text(f'DROP TABLE IF EXISTS `{dictionary_table(column)}`'))
+    reset_dictionary_cache()
+
+
+def table_columns(tipado=False):
+    """
+    Colunas da tabela final como (nome, tipo SQL).
+    No layout tipado, colunas de dicionário viram <COLUNA>_ID e as demais ganham o tipo de BU_TYPED_COLUMNS.
+    """
+    cols = []
     for name, length in BU_COLUMN_LENGTHS:
-        cols.append(f'`{name}` VARCHAR({length}) DEFAULT NULL')
+        if tipado and name in BU_DICTIONARY_COLUMNS:
+            cols.append((f'{name}_ID', BU_DICTIONARY_COLUMNS[name]))
+        elif tipado and name in BU_TYPED_COLUMNS:
+            cols.append((name, BU_TYPED_COLUMNS[name]))
+        else:
+            cols.append((name, f'VARCHAR({length})'))
+    return cols
+
+
+def build_create_table_sql(tipado=False, indices=True):
+    """
+    DDL com id AUTO_INCREMENT, VARCHARs oficiais (ou layout tipado) e UNIQUE em chave natural.
+    Com indices=False (carga inicial) a tabela sai só com a PK.
+    """
+    cols = ['`id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT']
+    for name, sql_type in table_columns(tipado):
+        cols.append(f'`{name}` {sql_type} DEFAULT NULL')
     cols.append('PRIMARY KEY (`id`)')
-    cols.append(
-        'UNIQUE KEY `idx_unique_bu` '
-        '(`CD_PLEITO`,`CD_MUNICIPIO`,`NR_ZONA`,`NR_SECAO`,`CD_CARGO_PERGUNTA`,`NR_VOTAVEL`)'
-    )
+    if indices:
+        cols.append(
+            'UNIQUE KEY `idx_unique_bu` '
+            '(`CD_PLEITO`,`CD_MUNICIPIO`,`NR_ZONA`,`NR_SECAO`,`CD_CARGO_PERGUNTA`,`NR_VOTAVEL`)'
+        )
     body = ',\n  '.join(cols)
     return (
         f'CREATE TABLE IF NOT EXISTS `{TABLE_NAME}` (\n  {body}\n) '
@@ -136,11 +255,82 @@ def build_create_table_sql():
     )
 
 
-def setup_table_and_indexes(engine):
-    """Cria a tabela com id e VARCHARs fixos; garante índice único na chave natural."""
+def build_staging_table_sql(staging_name):
+    """DDL da tabela temporária de staging: mesmas colunas, sem id e sem índices."""
+    cols = [f'`{name}` VARCHAR({length}) DEFAULT NULL' for name, length in BU_COLUMN_LENGTHS]
+    body = ',\n  '.join(cols)
+    return (
+        f'CREATE TEMPORARY TABLE `{staging_name}` (\n  {body}\n) '
+        'ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci'
+    )
+
+
+def build_dictionary_table_sql(column):
+    return (
+        f'CREATE TABLE IF NOT EXISTS `{dictionary_table(column)}` (\n'
+        f'  `id` {BU_DICTIONARY_COLUMNS[column]} NOT NULL AUTO_INCREMENT,\n'
+        '  `valor` VARCHAR(255) COLLATE utf8mb4_bin NOT NULL,\n'
+        '  PRIMARY KEY (`id`),\n'
+        '  UNIQUE KEY `uk_valor` (`valor`)\n'
+        ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci'
+    )
+
+
+def build_typed_view_sql():
+    """View que devolve a tabela tipada com os textos dos dicionários nos nomes originais."""
+    select_cols = []
+    joins = []
+    for name, _ in BU_COLUMN_LENGTHS:
+        if name in BU_DICTIONARY_COLUMNS:
+            alias = f'd_{name.lower()}'
+            select_cols.append(f'`{alias}`.`valor` AS `{name}`')
+            joins.append(
+                f'LEFT JOIN `{dictionary_table(name)}` AS `{alias}` ON `{alias}`.`id` = bu.`{name}_ID`'
+            )
+        else:
+            select_cols.append(f'bu.`{name}`')
+    return (
+        f'CREATE OR REPLACE VIEW `{TABLE_NAME}_texto` AS\n'
+        f'SELECT bu.`id`, {", ".join(select_cols)}\n'
+        f'FROM `{TABLE_NAME}` AS bu\n' + '\n'.join(joins)
+    )
+
+
+def check_layout(conn, tipado):
+    """Evita misturar layouts: a tabela existente precisa ter o mesmo tipo em QT_VOTOS."""
+    data_type = conn.execute(text(
+        "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND COLUMN_NAME = 'QT_VOTOS'"
+    ), {'t': TABLE_NAME}).scalar()
+    if data_type is None:
+        return
+    if (data_type != 'varchar') != tipado:
+        layout = 'tipado' if data_type != 'varchar' else 'texto'
+        raise RuntimeError(
+            f"A tabela `{TABLE_NAME}` já existe com o layout '{layout}'. "
+            f"Use --schema {layout} ou remova a tabela antes."
+        )
+
+
+def setup_table_and_indexes(engine, tipado=False, indices=True):
+    """
+    Cria a tabela com id e VARCHARs fixos (ou layout tipado); garante índice único na chave natural.
+    Com indices=False (carga inicial) a tabela fica só com a PK; os índices vêm em build_deferred_indexes.
+    """
     with engine.begin() as conn:
-        conn.execute(text(build_create_table_sql()))
-        print(f"Tabela `{TABLE_NAME}` verificada/criada (com coluna `id`).")
+        check_layout(conn, tipado)
+        if tipado:
+            for column in BU_DICTIONARY_COLUMNS:
+                conn.execute(text(build_dictionary_table_sql(column)))
+            # os ids em cache podem ser de tabelas-dicionário já removidas/recriadas
+            reset_dictionary_cache()
+        conn.execute(text(build_create_table_sql(tipado, indices)))
+        if tipado:
+            conn.execute(text(build_typed_view_sql()))
+        print(f"Tabela `{TABLE_NAME}` verificada/criada (com coluna `id`{', layout tipado' if tipado else ''}).")
+
+    if not indices:
+        return
 
     idx_sql = f"""
     ALTER TABLE `{TABLE_NAME}`
@@ -158,32 +348,151 @@ def setup_table_and_indexes(engine):
             else:
                 print(f"Erro ao configurar índices: {e}")
 
-def process_one_file(engine, file_path):
+def prepare_initial_load(engine):
+    """
+    Carga inicial só vale para tabela vazia: sem o índice único, INSERT IGNORE não
+    deduplica contra dados já existentes. Uma tabela vazia é recriada sem índices secundários.
+    """
+    with engine.begin() as conn:
+        try:
+            tem_linhas = conn.execute(text(f"SELECT 1 FROM `{TABLE_NAME}` LIMIT 1")).first() is not None
+        except Exception as e:
+            # 1146: Table doesn't exist (será criada sem índices); qualquer outro erro interrompe
+            if "1146" not in str(e) and "doesn't exist" not in str(e):
+                raise
+            return
+        if tem_linhas:
+            raise RuntimeError(
+                f"A tabela `{TABLE_NAME}` já tem dados; a carga inicial exige tabela vazia. "
+                f"Rode sem --carga-inicial para carga incremental."
+            )
+        conn.execute(text(f"DROP TABLE `{TABLE_NAME}`"))
+        print(f"Tabela `{TABLE_NAME}` vazia removida para recriação sem índices secundários.")
+
+
+def dedupe_natural_key(engine):
+    """
+    Remove as linhas repetidas na chave natural (mantém o menor id), como o idx_unique_bu
+    faria durante a carga normal: linhas com algum NULL na chave nunca colidem no índice
+    único, então ficam todas. Roda uma transação por (ANO_ELEICAO, SG_UF), para não
+    estourar a tabela de locks (erro 1206) com um único DELETE na tabela inteira; a chave
+    inclui CD_PLEITO e CD_MUNICIPIO, então repetições nunca atravessam fatias.
+    """
+    partition = ', '.join(f'`{c}`' for c in KEY_COLUMNS)
+    not_null = ' AND '.join(f'`{c}` IS NOT NULL' for c in KEY_COLUMNS)
+    with engine.connect() as conn:
+        fatias = conn.execute(text(
+            f"SELECT DISTINCT `ANO_ELEICAO`, `SG_UF` FROM `{TABLE_NAME}` ORDER BY `ANO_ELEICAO`, `SG_UF`"
+        )).fetchall()
+
+    removidas = 0
+    for ano, uf in fatias:
+        with engine.begin() as conn:
+            removidas += conn.execute(text(f"""
+                DELETE t FROM `{TABLE_NAME}` AS t
+                JOIN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY id) AS rn
+                        FROM `{TABLE_NAME}`
+                        WHERE `ANO_ELEICAO` <=> :ano AND `SG_UF` <=> :uf AND {not_null}
+                    ) AS numeradas
+                    WHERE rn > 1
+                ) AS duplicadas ON duplicadas.id = t.id
+            """), {'ano': ano, 'uf': uf}).rowcount
+    print(f"Deduplicação: {removidas:,} linha(s) repetida(s) removida(s) em {len(fatias)} fatia(s) ano/UF.")
+    return removidas
+
+
+def build_deferred_indexes(engine):
+    """Cria idx_unique_bu e os índices de DEFERRED_INDEXES num único ALTER (uma passada na tabela)."""
+    with engine.connect() as conn:
+        existentes = {row[0] for row in conn.execute(text(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"
+        ), {'t': TABLE_NAME})}
+
+    clauses = []
+    if 'idx_unique_bu' not in existentes:
+        clauses.append(f"ADD UNIQUE INDEX idx_unique_bu ({', '.join(f'`{c}`' for c in KEY_COLUMNS)})")
+    for name, columns in DEFERRED_INDEXES.items():
+        if name not in existentes:
+            clauses.append(f"ADD INDEX {name} ({', '.join(f'`{c}`' for c in columns)})")
+    if not clauses:
+        print("Índices já existentes.")
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE `{TABLE_NAME}` " + ', '.join(clauses)))
+    print(f"Índices criados: {len(clauses)}.")
+
+
+def finish_initial_load(engine):
+    """Fase final da carga inicial: deduplica e constrói os índices. Retorna os tempos de cada fase."""
+    inicio = time.perf_counter()
+    dedupe_natural_key(engine)
+    meio = time.perf_counter()
+    build_deferred_indexes(engine)
+    fim = time.perf_counter()
+    return {'deduplicacao': meio - inicio, 'indices': fim - meio}
+
+
+def start_from_manifest(manifest, file_path):
+    """
+    Consulta o manifesto: None se o arquivo deve ser pulado,
+    senão (linhas já carregadas, último chunk já carregado).
+    """
+    if manifest is None:
+        return 0, 0
+    inicio = manifest.start(file_path)
+    if inicio is None:
+        with _print_lock:
+            print(f"Pulando (inalterado e já importado): {file_path}")
+    elif inicio[0]:
+        with _print_lock:
+            print(f"Retomando {file_path} a partir do chunk {inicio[1] + 1} ({inicio[0]} linhas já carregadas)")
+    return inicio
+
+
+def process_one_file(engine, file_path, manifest=None, usar_cache=False, tipado=False):
     """
     Processa um único arquivo CSV (uma thread por arquivo = sem overlap).
     Duplicidade evitada pelo índice único + INSERT IGNORE.
+    Com manifesto, cada chunk gravado vira checkpoint e a carga retoma dele.
+    Com usar_cache, lê do Parquet ao lado do CSV (gerado na primeira leitura).
+    Com tipado, converte tipos e dicionários antes de gravar.
     """
+    inicio = start_from_manifest(manifest, file_path)
+    if inicio is None:
+        return file_path, None
+    _, last_chunk = inicio
+
     with _print_lock:
         print(f"Iniciando: {file_path}")
     try:
-        reader = pd.read_csv(
+        reader = read_csv_chunks(
             file_path,
-            sep=';',
-            encoding='latin1',
-            quotechar='"',
-            dtype=str,
-            chunksize=CHUNKSIZE_READ
+            CHUNKSIZE_READ,
+            skip_chunks=last_chunk,
+            use_cache=usar_cache
         )
-        for chunk in reader:
+        for chunk_no, chunk in enumerate(reader, start=last_chunk + 1):
             chunk = clean_column_names(chunk)
-            chunk.to_sql(
-                name=TABLE_NAME,
-                con=engine,
-                if_exists='append',
-                index=False,
-                method=insert_ignore,
-                chunksize=CHUNKSIZE_INSERT
-            )
+            if tipado:
+                columns, values = to_columnar_batch(convert_typed(chunk))
+                write_batch(engine, *resolve_dictionaries(engine, columns, values))
+            else:
+                chunk.to_sql(
+                    name=TABLE_NAME,
+                    con=engine,
+                    if_exists='append',
+                    index=False,
+                    method=insert_ignore,
+                    chunksize=CHUNKSIZE_INSERT
+                )
+            if manifest is not None:
+                manifest.checkpoint(file_path, chunk_no, len(chunk))
+        if manifest is not None:
+            manifest.finish(file_path)
         with _print_lock:
             print(f"Finalizado: {file_path}")
         return file_path, None
@@ -193,35 +502,444 @@ def process_one_file(engine, file_path):
         return file_path, e
 
 
-def process_and_import():
-    csv_files = sorted(glob.glob('bweb/**/*.csv', recursive=True))
-    if not csv_files:
-        print("Nenhum arquivo CSV encontrado em 'bweb/'.")
-        return
+def read_header(file_path):
+    """
+    Lê só a linha de cabeçalho do CSV e devolve (colunas já renomeadas, terminador de linha).
+    Aplica a mesma limpeza de clean_column_names, sem passar pelo pandas.
+    """
+    with open(file_path, 'rb') as f:
+        first_line = f.readline()
+    line_terminator = '\\r\\n' if first_line.endswith(b'\r\n') else '\\n'
+    raw_cols = first_line.decode('latin1').rstrip('\r\n').split(';')
+    columns = [c.strip('"').upper() for c in raw_cols]
+    columns = [COLUMN_MAPPING.get(c, c) for c in columns]
+    return columns, line_terminator
+
+
+def build_load_data_sql(file_path, staging_name, columns, line_terminator):
+    """
+    Monta o LOAD DATA LOCAL INFILE para a staging.
+    Cada campo vai para uma variável de usuário e é gravado com NULLIF(@v, ''),
+    reproduzindo o NaN -> NULL do caminho via pandas. Colunas fora do layout são descartadas.
+    ESCAPED BY '' desliga o escape por barra invertida do MySQL: os campos do TSE chegam
+    literalmente, barras invertidas incluídas, como no caminho via pandas.
+    """
+    known = {name for name, _ in BU_COLUMN_LENGTHS}
+    variables = []
+    assignments = []
+    for i, col in enumerate(columns):
+        if col in known:
+            variables.append(f'@c{i}')
+            assignments.append(f"`{col}` = NULLIF(@c{i}, '')")
+        else:
+            variables.append('@descartada')
+
+    path_sql = os.path.abspath(file_path).replace('\\', '\\\\').replace("'", "\\'")
+    return (
+        f"LOAD DATA LOCAL INFILE '{path_sql}'\n"
+        f"INTO TABLE `{staging_name}`\n"
+        "CHARACTER SET latin1\n"
+        "FIELDS TERMINATED BY ';' OPTIONALLY ENCLOSED BY '\"'\n"
+        "ESCAPED BY ''\n"
+        f"LINES TERMINATED BY '{line_terminator}'\n"
+        "IGNORE 1 LINES\n"
+        f"({', '.join(variables)})\n"
+        f"SET {', '.join(assignments)}"
+    )
+
+
+def build_merge_sql(staging_name, tipado=False):
+    """
+    INSERT IGNORE ... SELECT da staging para a tabela final.
+    No layout tipado, a conversão acontece aqui: CAST só para valores numéricos,
+    STR_TO_DATE para datas e JOIN nas tabelas-dicionário (já alimentadas pela staging).
+    Os formatos de data vão como parâmetros (:fmt_date / :fmt_datetime).
+    """
+    if not tipado:
+        target_cols = ', '.join(f'`{name}`' for name, _ in BU_COLUMN_LENGTHS)
+        return (
+            f'INSERT IGNORE INTO `{TABLE_NAME}` ({target_cols}) '
+            f'SELECT {target_cols} FROM `{staging_name}`'
+        )
+
+    target_cols = []
+    exprs = []
+    joins = []
+    for name, _ in BU_COLUMN_LENGTHS:
+        src = f's.`{name}`'
+        sql_type = BU_TYPED_COLUMNS.get(name)
+        if name in BU_DICTIONARY_COLUMNS:
+            alias = f'd_{name.lower()}'
+            target_cols.append(f'`{name}_ID`')
+            exprs.append(f'`{alias}`.`id`')
+            # comparação binária, como o uk_valor: variantes de acento/caixa são valores distintos
+            joins.append(
+                f'LEFT JOIN `{dictionary_table(name)}` AS `{alias}` '
+                f'ON `{alias}`.`valor` = {src} COLLATE utf8mb4_bin'
+            )
+            continue
+        target_cols.append(f'`{name}`')
+        if sql_type is None or sql_type == 'TIME':
+            exprs.append(src)
+        elif sql_type == 'DATE':
+            exprs.append(f'STR_TO_DATE({src}, :fmt_date)')
+        elif sql_type == 'DATETIME':
+            exprs.append(f'COALESCE(STR_TO_DATE({src}, :fmt_datetime), STR_TO_DATE({src}, :fmt_date))')
+        else:
+            exprs.append(f"CASE WHEN {src} REGEXP '^-?[0-9]+$' THEN CAST({src} AS SIGNED) END")
+
+    return (
+        f'INSERT IGNORE INTO `{TABLE_NAME}` ({", ".join(target_cols)})\n'
+        f'SELECT {", ".join(exprs)}\n'
+        f'FROM `{staging_name}` AS s\n' + '\n'.join(joins)
+    )
+
+
+def process_one_file_load_data(engine, file_path, manifest=None, usar_cache=False, tipado=False):
+    """
+    Modo bulk: LOAD DATA LOCAL INFILE numa staging temporária e um único
+    INSERT IGNORE ... SELECT para a tabela final (dedupe continua no idx_unique_bu).
+    A staging é TEMPORARY, então cada conexão/thread tem a sua.
+    A carga é atômica por arquivo, então o manifesto só registra arquivos concluídos.
+    O servidor lê o CSV bruto, então usar_cache não se aplica a este modo.
+    """
+    if start_from_manifest(manifest, file_path) is None:
+        return file_path, None
+
+    with _print_lock:
+        print(f"Iniciando (LOAD DATA): {file_path}")
+    staging_name = f'{TABLE_NAME}_staging'
+    try:
+        columns, line_terminator = read_header(file_path)
+
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP TEMPORARY TABLE IF EXISTS `{staging_name}`'))
+            conn.execute(text(build_staging_table_sql(staging_name)))
+            loaded = conn.execute(
+                text(build_load_data_sql(file_path, staging_name, columns, line_terminator))
+            ).rowcount
+            merge_params = {}
+            if tipado:
+                for col in BU_DICTIONARY_COLUMNS:
+                    conn.execute(text(
+                        f'INSERT IGNORE INTO `{dictionary_table(col)}` (`valor`) '
+                        f'SELECT DISTINCT `{col}` COLLATE utf8mb4_bin FROM `{staging_name}` '
+                        f'WHERE `{col}` IS NOT NULL'
+                    ))
+                merge_params = {'fmt_date': SQL_DATE_FORMAT, 'fmt_datetime': SQL_DATETIME_FORMAT}
+            inserted = conn.execute(text(build_merge_sql(staging_name, tipado)), merge_params).rowcount
+            conn.execute(text(f'DROP TEMPORARY TABLE IF EXISTS `{staging_name}`'))
+
+        if manifest is not None:
+            manifest.finish(file_path)
+        with _print_lock:
+            print(f"Finalizado: {file_path} ({loaded} linhas lidas, {inserted} inseridas)")
+        return file_path, None
+    except Exception as e:
+        with _print_lock:
+            print(f"Erro ao processar {file_path}: {e}")
+        return file_path, e
+
+
+def is_retryable_db_error(exc):
+    s = str(exc)
+    return "1213" in s or "1205" in s  # deadlock / lock wait timeout
+
+
+def to_columnar_batch(chunk):
+    """
+    Converte o chunk em (colunas, listas por coluna), já ordenado pela chave natural.
+    A ordenação faz todos os escritores tomarem os locks de idx_unique_bu na mesma ordem.
+    """
+    sort_cols = [c for c in KEY_COLUMNS if c in chunk.columns]
+    if sort_cols:
+        chunk = chunk.sort_values(sort_cols, kind='stable')
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    columns = list(chunk.columns)
+    return columns, [chunk[c].tolist() for c in columns]
+
+
+def convert_typed(chunk):
+    """
+    Converte as colunas de BU_TYPED_COLUMNS para inteiros/datas no próprio pandas.
+    Valores fora do formato viram NULL (mesmo efeito do CAST no caminho LOAD DATA).
+    """
+    for col, sql_type in BU_TYPED_COLUMNS.items():
+        if col not in chunk.columns:
+            continue
+        if sql_type == 'DATE':
+            chunk[col] = pd.to_datetime(chunk[col], format=DATE_FORMAT, errors='coerce').dt.date
+        elif sql_type == 'DATETIME':
+            parsed = pd.to_datetime(chunk[col], format=DATETIME_FORMAT, errors='coerce')
+            parsed = parsed.fillna(pd.to_datetime(chunk[col], format=DATE_FORMAT, errors='coerce'))
+            # datetime nativo: o driver MySQL não converte pandas.Timestamp
+            chunk[col] = pd.Series(parsed.dt.to_pydatetime(), index=chunk.index, dtype=object)
+        elif sql_type != 'TIME':
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('Int64')
+    return chunk
+
+
+def resolve_dictionaries(engine, columns, values):
+    """
+    Troca, no lote colunar, os textos de BU_DICTIONARY_COLUMNS pelos ids das tabelas-dicionário.
+    Valores novos entram com um INSERT IGNORE multi-linha e os ids voltam num único SELECT.
+    """
+    columns = list(columns)
+    values = list(values)
+    for col, cache in _dictionary_cache.items():
+        if col not in columns:
+            continue
+        i = columns.index(col)
+        missing = {v for v in values[i] if v is not None and v not in cache}
+        if missing:
+            table = dictionary_table(col)
+            params = {f'v{n}': v for n, v in enumerate(sorted(missing))}
+            placeholders = ', '.join(f':{k}' for k in params)
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f'INSERT IGNORE INTO `{table}` (`valor`) VALUES ' + ', '.join(f'(:{k})' for k in params)),
+                    params
+                )
+                rows = conn.execute(
+                    text(f'SELECT `valor`, `id` FROM `{table}` WHERE `valor` IN ({placeholders})'),
+                    params
+                ).fetchall()
+            with _dictionary_lock:
+                cache.update({valor: id_ for valor, id_ in rows})
+        columns[i] = f'{col}_ID'
+        values[i] = [cache.get(v) if v is not None else None for v in values[i]]
+    return columns, values
+
 
-    n_workers = min(MAX_WORKERS, len(csv_files))
-    engine = get_engine(pool_size=n_workers + 2)
+def _init_parse_worker(batch_queue):
+    global _batch_queue
+    _batch_queue = batch_queue
 
-    print(f"Encontrados {len(csv_files)} arquivo(s) CSV. Usando {n_workers} thread(s).")
 
-    setup_table_and_indexes(engine)
+def parse_file_worker(file_path, last_chunk=0, usar_cache=False, tipado=False):
+    """
+    Processo filho: lê o CSV em chunks, normaliza e publica lotes colunares na fila.
+    No layout tipado, a conversão de tipos também roda aqui; os dicionários ficam com o escritor.
+    Retorna o número do último chunk do arquivo.
+    """
+    reader = read_csv_chunks(file_path, CHUNKSIZE_READ, skip_chunks=last_chunk, use_cache=usar_cache)
+    for chunk_no, chunk in enumerate(reader, start=last_chunk + 1):
+        chunk = clean_column_names(chunk)
+        if tipado:
+            chunk = convert_typed(chunk)
+        columns, values = to_columnar_batch(chunk)
+        _batch_queue.put((file_path, chunk_no, len(chunk), columns, values))
+        last_chunk = chunk_no
+    return file_path, last_chunk
+
+
+def write_batch(engine, columns, values):
+    """Grava um lote colunar com executemany + INSERT IGNORE, com retry em deadlock/lock wait."""
+    col_list = ', '.join(f'`{c}`' for c in columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = f'INSERT IGNORE INTO `{TABLE_NAME}` ({col_list}) VALUES ({placeholders})'
+    rows = list(zip(*values))
+
+    for attempt in range(1, MAX_INSERT_RETRIES + 1):
+        try:
+            with engine.begin() as conn:
+                for start in range(0, len(rows), CHUNKSIZE_INSERT):
+                    conn.exec_driver_sql(sql, rows[start:start + CHUNKSIZE_INSERT])
+            return
+        except Exception as e:
+            if not is_retryable_db_error(e) or attempt == MAX_INSERT_RETRIES:
+                raise
+            time.sleep(min(8, 0.4 * (2 ** (attempt - 1))) + random.uniform(0, 0.8))
+
+
+def writer_loop(engine, batch_queue, errors, manifest=None, tipado=False):
+    """Thread escritora: consome lotes até receber o sentinela None."""
+    while True:
+        item = batch_queue.get()
+        if item is None:
+            return
+        file_path, chunk_no, n_rows, columns, values = item
+        try:
+            if tipado:
+                columns, values = resolve_dictionaries(engine, columns, values)
+            write_batch(engine, columns, values)
+            if manifest is not None:
+                manifest.checkpoint(file_path, chunk_no, n_rows)
+        except Exception as e:
+            # continua drenando a fila para não travar os processos de parse
+            with _print_lock:
+                print(f"Erro ao gravar {file_path} chunk={chunk_no}: {e}")
+            errors.append((file_path, e))
+
+
+def process_and_import_parallel(csv_files, parse_workers=PARSE_WORKERS, write_workers=WRITE_WORKERS,
+                                usar_manifesto=True, usar_cache=False, tipado=False, indices=True):
+    """
+    Modo 'processos': parse em paralelo (sem GIL) e escrita por poucas conexões.
+    parse_workers escala com os núcleos; write_workers controla a concorrência no idx_unique_bu.
+    """
+    n_parse = min(parse_workers, len(csv_files))
+    engine = get_engine(pool_size=write_workers + 1)
+
+    print(
+        f"Encontrados {len(csv_files)} arquivo(s) CSV. "
+        f"Usando {n_parse} processo(s) de parse e {write_workers} escritor(es)."
+    )
+
+    setup_table_and_indexes(engine, tipado, indices)
+    manifest = open_manifest(engine, TABLE_NAME) if usar_manifesto else None
+
+    pending = []
+    for path in csv_files:
+        inicio = start_from_manifest(manifest, path)
+        if inicio is not None:
+            pending.append((path, inicio[1]))
+
+    batch_queue = mp.Queue(maxsize=BATCH_QUEUE_SIZE)
+    write_errors = []
+    writers = [
+        threading.Thread(
+            target=writer_loop, args=(engine, batch_queue, write_errors, manifest, tipado), daemon=True
+        )
+        for _ in range(write_workers)
+    ]
+    for w in writers:
+        w.start()
 
-    # Workers: cada um processa um arquivo
     errors = []
-    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+    with ProcessPoolExecutor(
+        max_workers=n_parse,
+        initializer=_init_parse_worker,
+        initargs=(batch_queue,),
+    ) as executor:
         futures = {
-            executor.submit(process_one_file, engine, path): path
-            for path in csv_files
+            executor.submit(parse_file_worker, path, last_chunk, usar_cache, tipado): path
+            for path, last_chunk in pending
         }
         for future in as_completed(futures):
-            _path, err = future.result()
-            if err is not None:
-                errors.append((_path, err))
+            path = futures[future]
+            try:
+                _path, last_chunk = future.result()
+                if manifest is not None:
+                    # concluído quando os escritores confirmarem todos os chunks até last_chunk
+                    manifest.finish(path, last_chunk)
+                with _print_lock:
+                    print(f"Parse finalizado: {path} (até o chunk {last_chunk})")
+            except Exception as e:
+                with _print_lock:
+                    print(f"Erro ao processar {path}: {e}")
+                errors.append((path, e))
+
+    for _ in writers:
+        batch_queue.put(None)
+    for w in writers:
+        w.join()
+
+    return errors + write_errors
+
+
+# Modo de carga -> função que processa um arquivo
+PROCESSORS = {
+    'insert': process_one_file,
+    'load-data': process_one_file_load_data,
+}
+
+MODOS = sorted(PROCESSORS) + ['processos']
+
+
+def process_and_import(modo='insert', parse_workers=PARSE_WORKERS, write_workers=WRITE_WORKERS,
+                       usar_manifesto=True, usar_cache=False, tipado=False, carga_inicial=False):
+    """
+    Importa todos os CSVs de bweb/ no modo escolhido.
+    Com carga_inicial (tabela vazia), carrega sem índices secundários, deduplica em lote
+    e só então cria idx_unique_bu e os índices de junção; os tempos de cada fase são exibidos.
+    """
+    csv_files = sorted(glob.glob('bweb/**/*.csv', recursive=True))
+    if not csv_files:
+        print("Nenhum arquivo CSV encontrado em 'bweb/'.")
+        return
+
+    if carga_inicial:
+        engine = get_engine()
+        prepare_initial_load(engine)
+        engine.dispose()
+
+    inicio = time.perf_counter()
+    if modo == 'processos':
+        errors = process_and_import_parallel(
+            csv_files, parse_workers, write_workers, usar_manifesto, usar_cache, tipado,
+            indices=not carga_inicial,
+        )
+    else:
+        n_workers = min(MAX_WORKERS, len(csv_files))
+        engine = get_engine(pool_size=n_workers + 2, local_infile=(modo == 'load-data'))
+        process_file = PROCESSORS[modo]
+
+        print(f"Encontrados {len(csv_files)} arquivo(s) CSV. Usando {n_workers} thread(s), modo '{modo}'.")
+
+        setup_table_and_indexes(engine, tipado, indices=not carga_inicial)
+        manifest = open_manifest(engine, TABLE_NAME) if usar_manifesto else None
+
+        # Workers: cada um processa um arquivo
+        errors = []
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                executor.submit(process_file, engine, path, manifest, usar_cache, tipado): path
+                for path in csv_files
+            }
+            for future in as_completed(futures):
+                _path, err = future.result()
+                if err is not None:
+                    errors.append((_path, err))
+        engine.dispose()
+
+    if carga_inicial:
+        # Mesmo com erros: deixa a tabela indexada para que a próxima execução
+        # (carga normal, retomando pelo manifesto) encontre idx_unique_bu.
+        tempos = {'carga': time.perf_counter() - inicio}
+        engine = get_engine()
+        tempos.update(finish_initial_load(engine))
+        engine.dispose()
+        total = sum(tempos.values())
+        print("\nTempos da carga inicial:")
+        for fase, segundos in tempos.items():
+            print(f"  {fase:<14} {segundos:>10.1f} s")
+        print(f"  {'total':<14} {total:>10.1f} s")
+        print("Compare com a carga normal via benchmark_import_boletim_urna.py --carga-inicial.")
 
     if errors:
         print(f"\nProcessamento concluído com {len(errors)} erro(s).")
     else:
         print("\nProcessamento concluído com sucesso.")
+    return errors
 
 if __name__ == "__main__":
-    process_and_import()
+    parser = argparse.ArgumentParser(description='Importa os boletins de urna (bweb) para o MySQL.')
+    parser.add_argument(
+        '--modo', choices=MODOS, default='insert',
+        help="insert: pandas + INSERT IGNORE em lotes (padrão); "
+             "load-data: LOAD DATA LOCAL INFILE em staging + INSERT IGNORE ... SELECT por arquivo; "
+             "processos: parse em processos paralelos e escrita por poucas conexões"
+    )
+    parser.add_argument('--parse-workers', type=int, default=PARSE_WORKERS,
+                        help='processos de parse no modo processos')
+    parser.add_argument('--write-workers', type=int, default=WRITE_WORKERS,
+                        help='conexões escritoras no modo processos')
+    parser.add_argument('--sem-manifesto', action='store_true',
+                        help='ignora o manifesto e relê todos os arquivos')
+    parser.add_argument('--cache-parquet', action='store_true',
+                        help='lê os CSVs via cache Parquet (convertido uma vez, requer pyarrow)')
+    parser.add_argument('--schema', choices=['texto', 'tipado'], default='texto',
+                        help="texto: tudo VARCHAR (padrão); tipado: inteiros, DATETIME e dicionários")
+    parser.add_argument('--carga-inicial', action='store_true',
+                        help='tabela vazia: carrega sem índices, deduplica em lote e cria os índices no fim')
+    args = parser.parse_args()
+    process_and_import(
+        modo=args.modo,
+        parse_workers=args.parse_workers,
+        write_workers=args.write_workers,
+        usar_manifesto=not args.sem_manifesto,
+        usar_cache=args.cache_parquet,
+        tipado=args.schema == 'tipado',
+        carga_inicial=args.carga_inicial,
+    )
@@ -9,6 +9,7 @@ Importa e unifica todos os CSVs de consulta_cand_{ano} em uma única tabela MySQ
 Ajustado para reduzir deadlocks durante INSERT IGNORE concorrente.
 """
 
+import argparse
 import json
 import os
 import glob
@@ -23,6 +24,9 @@ from sqlalchemy import create_engine, text, types
 from sqlalchemy.exc import OperationalError, InternalError
 from dotenv import load_dotenv
 
+from import_manifest import open_manifest
+from parquet_cache import read_csv_chunks  # cache Parquet compartilhado com o pipeline
+
 load_dotenv()
 
 # #region agent log
@@ -223,34 +227,50 @@ def insert_chunk_with_retry(engine, chunk: pd.DataFrame, file_path: str, chunk_n
             time.sleep(sleep_s)
 
 
-def process_one_file(file_path):
+def process_one_file(file_path, manifest=None, usar_cache=False):
     """
     Cada thread cria sua própria engine/conexão.
     Isso evita compartilhamento estranho de conexão entre threads.
+    Com manifesto, pula arquivos inalterados e retoma do último chunk gravado.
     """
+    last_chunk = 0
+    if manifest is not None:
+        inicio = manifest.start(file_path)
+        if inicio is None:
+            with _print_lock:
+                print(f"Pulando (inalterado e já importado): {file_path}")
+            return file_path, None
+        _, last_chunk = inicio
+
     engine = get_engine(pool_size=1)
 
     with _print_lock:
-        print(f"Iniciando: {file_path}")
+        if last_chunk:
+            print(f"Retomando: {file_path} a partir do chunk {last_chunk + 1}")
+        else:
+            print(f"Iniciando: {file_path}")
 
     try:
-        reader = pd.read_csv(
+        reader = read_csv_chunks(
             file_path,
-            sep=";",
-            encoding="latin1",
-            quotechar='"',
-            dtype=str,
-            chunksize=CHUNKSIZE_READ,
+            CHUNKSIZE_READ,
+            skip_chunks=last_chunk,
+            use_cache=usar_cache,
             low_memory=False,
         )
 
-        for chunk_no, chunk in enumerate(reader, start=1):
+        for chunk_no, chunk in enumerate(reader, start=last_chunk + 1):
+            n_rows = len(chunk)
             chunk = normalize_chunk(chunk)
 
-            if chunk.empty:
-                continue
+            if not chunk.empty:
+                insert_chunk_with_retry(engine, chunk, file_path, chunk_no)
 
-            insert_chunk_with_retry(engine, chunk, file_path, chunk_no)
+            if manifest is not None:
+                manifest.checkpoint(file_path, chunk_no, n_rows)
+
+        if manifest is not None:
+            manifest.finish(file_path)
 
         with _print_lock:
             print(f"Finalizado: {file_path}")
@@ -278,7 +298,7 @@ def process_one_file(file_path):
         engine.dispose()
 
 
-def process_and_import():
+def process_and_import(usar_manifesto=True, usar_cache=False):
     csv_files = get_csv_files()
     if not csv_files:
         print(f"Nenhum arquivo CSV encontrado em {DADOS_BASE}/consulta_cand_*/")
@@ -291,24 +311,19 @@ def process_and_import():
 
     first_file = csv_files[0]
     first_chunk = next(
-        pd.read_csv(
-            first_file,
-            sep=";",
-            encoding="latin1",
-            quotechar='"',
-            dtype=str,
-            chunksize=CHUNKSIZE_READ,
-            low_memory=False,
-        ).__iter__()
+        read_csv_chunks(first_file, CHUNKSIZE_READ, use_cache=usar_cache, low_memory=False)
     )
     first_chunk = normalize_chunk(first_chunk)
     setup_table_and_indexes(setup_engine, first_chunk)
+    manifest = open_manifest(setup_engine, TABLE_NAME) if usar_manifesto else None
     setup_engine.dispose()
 
     errors = []
 
     with ThreadPoolExecutor(max_workers=n_workers) as executor:
-        futures = {executor.submit(process_one_file, path): path for path in csv_files}
+        futures = {
+            executor.submit(process_one_file, path, manifest, usar_cache): path for path in csv_files
+        }
 
         for future in as_completed(futures):
             path, err = future.result()
@@ -325,4 +340,10 @@ def process_and_import():
 
 
 if __name__ == "__main__":
-    process_and_import()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Importa os CSVs de consulta_cand para o MySQL.")
+    parser.add_argument("--sem-manifesto", action="store_true",
+                        help="ignora o manifesto e relê todos os arquivos")
+    parser.add_argument("--cache-parquet", action="store_true",
+                        help="lê os CSVs via cache Parquet (convertido uma vez, requer pyarrow)")
+    args = parser.parse_args()
+    process_and_import(usar_manifesto=not args.sem_manifesto, usar_cache=args.cache_parquet)
\ No newline at end of file
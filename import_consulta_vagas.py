@@ -5,14 +5,17 @@ Encoding dos CSV: latin1.
 """
 import os
 import glob
+import argparse
 import threading
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import pandas as pd
 from sqlalchemy import create_engine, text, types
 from dotenv import load_dotenv
 
+from import_manifest import open_manifest
+from parquet_cache import read_csv_chunks  # cache Parquet compartilhado com o pipeline
+
 load_dotenv()
 
 # Configuração do Banco de Dados
@@ -134,20 +137,27 @@ def get_csv_files():
     files = glob.glob(pattern)
     return sorted(files)
 
-def process_one_file(engine, file_path):
-    """Processa um único arquivo CSV."""
+def process_one_file(engine, file_path, manifest=None, usar_cache=False):
+    """Processa um único arquivo CSV; com manifesto, pula inalterados e retoma do último chunk."""
+    last_chunk = 0
+    if manifest is not None:
+        inicio = manifest.start(file_path)
+        if inicio is None:
+            with _print_lock:
+                print(f"Pulando (inalterado e já importado): {file_path}")
+            return file_path, None
+        _, last_chunk = inicio
+
     with _print_lock:
         print(f"Iniciando: {file_path}")
     try:
-        reader = pd.read_csv(
+        reader = read_csv_chunks(
             file_path,
-            sep=';',
-            encoding='latin1',
-            quotechar='"',
-            dtype=str,
-            chunksize=CHUNKSIZE_READ
+            CHUNKSIZE_READ,
+            skip_chunks=last_chunk,
+            use_cache=usar_cache
         )
-        for chunk in reader:
+        for chunk_no, chunk in enumerate(reader, start=last_chunk + 1):
             chunk = clean_column_names(chunk)
             for attempt in range(MAX_INSERT_RETRIES):
                 try:
@@ -165,6 +175,10 @@ def process_one_file(engine, file_path):
                         time.sleep(2 * (attempt + 1))
                     else:
                         raise
+            if manifest is not None:
+                manifest.checkpoint(file_path, chunk_no, len(chunk))
+        if manifest is not None:
+            manifest.finish(file_path)
         with _print_lock:
             print(f"Finalizado: {file_path}")
         return file_path, None
@@ -173,7 +187,7 @@ def process_one_file(engine, file_path):
             print(f"Erro ao processar {file_path}: {e}")
         return file_path, e
 
-def process_and_import():
+def process_and_import(usar_manifesto=True, usar_cache=False):
     csv_files = get_csv_files()
     if not csv_files:
         print(f"Nenhum arquivo CSV encontrado em {DADOS_BASE}/consulta_vagas_*/")
@@ -186,24 +200,16 @@ def process_and_import():
 
     # Thread principal: cria tabela e índice
     first_file = csv_files[0]
-    first_chunk = next(
-        pd.read_csv(
-            first_file,
-            sep=';',
-            encoding='latin1',
-            quotechar='"',
-            dtype=str,
-            chunksize=CHUNKSIZE_READ
-        ).__iter__()
-    )
+    first_chunk = next(read_csv_chunks(first_file, CHUNKSIZE_READ, use_cache=usar_cache))
     first_chunk = clean_column_names(first_chunk)
     setup_table_and_indexes(engine, first_chunk)
+    manifest = open_manifest(engine, TABLE_NAME) if usar_manifesto else None
 
     # Workers
     errors = []
     with ThreadPoolExecutor(max_workers=n_workers) as executor:
         futures = {
-            executor.submit(process_one_file, engine, path): path
+            executor.submit(process_one_file, engine, path, manifest, usar_cache): path
             for path in csv_files
         }
         for future in as_completed(futures):
@@ -218,7 +224,7 @@ def process_and_import():
         print(f"\nReprocessando {len(retry_paths)} arquivo(s) em modo sequencial...")
         engine_serial = get_engine(pool_size=1)
         for p in retry_paths:
-            _, err = process_one_file(engine_serial, p)
+            _, err = process_one_file(engine_serial, p, manifest, usar_cache)
             if err is not None:
                 other_errors.append((p, err))
         errors = other_errors
@@ -231,4 +237,10 @@ def process_and_import():
         print("\nProcessamento concluído com sucesso.")
 
 if __name__ == "__main__":
-    process_and_import()
+    parser = argparse.ArgumentParser(description='Importa os CSVs de consulta_vagas para o MySQL.')
+    parser.add_argument('--sem-manifesto', action='store_true',
+                        help='ignora o manifesto e relê todos os arquivos')
+    parser.add_argument('--cache-parquet', action='store_true',
+                        help='lê os CSVs via cache Parquet (convertido uma vez, requer pyarrow)')
+    args = parser.parse_args()
+    process_and_import(usar_manifesto=not args.sem_manifesto, usar_cache=args.cache_parquet)
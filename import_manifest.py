@@ -0,0 +1,188 @@
+"""
+Manifesto local (SQLite) das importações dos CSVs do TSE.
+
+Cada arquivo é identificado por (tabela destino, caminho) e guarda tamanho, mtime,
+hash do conteúdo e o último chunk confirmado no banco. Com isso, uma nova execução:
+  - pula arquivos já concluídos e não alterados;
+  - retoma arquivos parcialmente carregados a partir do último checkpoint;
+  - recomeça do zero arquivos cujo conteúdo mudou.
+
+Usado por import_boletim_urna.py, import_consulta_cand.py e import_consulta_vagas.py.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+
+MANIFEST_PATH = os.getenv(
+    'IMPORT_MANIFEST',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.import_manifest.sqlite')
+)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+STATUS_PARCIAL = 'PARCIAL'
+STATUS_CONCLUIDO = 'CONCLUIDO'
+
+
+def hash_arquivo(file_path):
+    """Hash BLAKE2b do conteúdo, lido em blocos para não carregar o arquivo em memória."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ImportManifest:
+    """
+    Registro de progresso por arquivo/chunk. Seguro para uso por várias threads
+    do mesmo processo (os escritores do modo 'processos' confirmam chunks fora de ordem).
+    """
+
+    def __init__(self, tabela, db_path=MANIFEST_PATH):
+        self.tabela = tabela
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS manifesto (
+                tabela TEXT NOT NULL,
+                path TEXT NOT NULL,
+                tamanho INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chunks_ok INTEGER NOT NULL DEFAULT 0,
+                linhas_ok INTEGER NOT NULL DEFAULT 0,
+                atualizado_em TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (tabela, path)
+            )
+        """)
+        self._conn.commit()
+        # path -> {'proximo': chunk esperado, 'linhas': linhas confirmadas,
+        #          'pendentes': {chunk: linhas}, 'ultimo': último chunk do arquivo}
+        self._estado = {}
+
+    def reset(self):
+        """Esquece todos os arquivos desta tabela (ex.: tabela destino foi truncada)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM manifesto WHERE tabela = ?", (self.tabela,))
+            self._conn.commit()
+
+    def _fingerprint(self, path, row):
+        """(tamanho, mtime, hash); reaproveita o hash gravado se tamanho e mtime não mudaram."""
+        st = os.stat(path)
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return st.st_size, st.st_mtime, row[2]
+        return st.st_size, st.st_mtime, hash_arquivo(path)
+
+    def start(self, file_path):
+        """
+        Prepara o arquivo para carga.
+        Retorna None se já foi concluído e não mudou; senão (linhas já carregadas, chunks já carregados).
+        """
+        path = os.path.abspath(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tamanho, mtime, hash, status, chunks_ok, linhas_ok "
+                "FROM manifesto WHERE tabela = ? AND path = ?",
+                (self.tabela, path)
+            ).fetchone()
+
+        tamanho, mtime, digest = self._fingerprint(path, row)
+
+        with self._lock:
+            if row and row[2] == digest:
+                if row[3] == STATUS_CONCLUIDO:
+                    if (row[0], row[1]) != (tamanho, mtime):
+                        self._conn.execute(
+                            "UPDATE manifesto SET tamanho = ?, mtime = ? WHERE tabela = ? AND path = ?",
+                            (tamanho, mtime, self.tabela, path)
+                        )
+                        self._conn.commit()
+                    return None
+                chunks_ok, linhas_ok = row[4], row[5]
+            else:
+                chunks_ok, linhas_ok = 0, 0
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifesto "
+                "(tabela, path, tamanho, mtime, hash, status, chunks_ok, linhas_ok, atualizado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (self.tabela, path, tamanho, mtime, digest, STATUS_PARCIAL, chunks_ok, linhas_ok)
+            )
+            self._conn.commit()
+            self._estado[path] = {
+                'proximo': chunks_ok + 1, 'linhas': linhas_ok, 'pendentes': {}, 'ultimo': None,
+            }
+            return linhas_ok, chunks_ok
+
+    def checkpoint(self, file_path, chunk_no, linhas):
+        """
+        Confirma que o chunk chunk_no (com `linhas` linhas do CSV) está gravado no banco.
+        Só avança o checkpoint quando todos os chunks anteriores também estão confirmados.
+        """
+        path = os.path.abspath(file_path)
+        with self._lock:
+            estado = self._estado[path]
+            estado['pendentes'][chunk_no] = linhas
+            avancou = False
+            while estado['proximo'] in estado['pendentes']:
+                estado['linhas'] += estado['pendentes'].pop(estado['proximo'])
+                estado['proximo'] += 1
+                avancou = True
+            if avancou:
+                self._persistir(path, estado)
+
+    def finish(self, file_path, ultimo_chunk=None):
+        """
+        Marca o arquivo como concluído. Com ultimo_chunk, a conclusão só é gravada
+        quando todos os chunks até ele tiverem passado por checkpoint().
+        """
+        path = os.path.abspath(file_path)
+        with self._lock:
+            estado = self._estado[path]
+            estado['ultimo'] = estado['proximo'] - 1 if ultimo_chunk is None else ultimo_chunk
+            self._persistir(path, estado)
+
+    def _persistir(self, path, estado):
+        concluido = estado['ultimo'] is not None and estado['proximo'] - 1 >= estado['ultimo']
+        self._conn.execute(
+            "UPDATE manifesto SET chunks_ok = ?, linhas_ok = ?, status = ?, "
+            "atualizado_em = CURRENT_TIMESTAMP WHERE tabela = ? AND path = ?",
+            (
+                estado['proximo'] - 1,
+                estado['linhas'],
+                STATUS_CONCLUIDO if concluido else STATUS_PARCIAL,
+                self.tabela,
+                path,
+            )
+        )
+        self._conn.commit()
+        if concluido:
+            self._estado.pop(path, None)
+
+    def close(self):
+        self._conn.close()
+
+
+def open_manifest(engine, tabela):
+    """
+    Abre o manifesto da tabela destino. Se a tabela estiver vazia (ex.: após truncate_all.sql)
+    ou ainda não existir, o registro é zerado para que nenhum arquivo seja pulado indevidamente.
+    Outros erros do banco são propagados: uma falha passageira não apaga o manifesto.
+    """
+    from sqlalchemy import text
+
+    manifest = ImportManifest(tabela)
+    try:
+        with engine.connect() as conn:
+            vazia = conn.execute(text(f"SELECT 1 FROM `{tabela}` LIMIT 1")).first() is None
+    except Exception as e:
+        # 1146: Table doesn't exist
+        if "1146" not in str(e) and "doesn't exist" not in str(e):
+            raise
+        vazia = True
+    if vazia:
+        manifest.reset()
+    return manifest
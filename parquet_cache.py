@@ -0,0 +1,234 @@
+"""
+Cache Parquet dos CSVs do TSE, compartilhado pelos importadores da raiz (import_boletim_urna.py,
+import_consulta_cand.py, import_consulta_vagas.py) e pelo CSVExtractor do pipeline.
+Cada CSV é lido uma única vez e gravado como Parquet comprimido ao lado dele; as leituras
+seguintes projetam colunas e descartam row groups em vez de interpretar o texto de novo.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:  # dependência opcional: sem ela toda leitura volta ao CSV
+    HAS_PYARROW = False
+
+# Linhas por row group do Parquet; também a granularidade do descarte de row groups nas leituras filtradas
+ROW_GROUP_SIZE = 100_000
+COMPRESSION = 'zstd'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Colunas de contagem (QT_VOTOS, QT_APTOS, QT_VAGA, ...) são gravadas como inteiros;
+# as demais ficam como texto para os códigos manterem os zeros à esquerda.
+COUNT_COLUMN_PREFIX = 'QT_'
+
+CSV_OPTIONS = {
+    'sep': ';',
+    'encoding': 'latin1',
+    'quotechar': '"',
+    'dtype': str,
+}
+
+
+def file_digest(file_path, block_size=HASH_BLOCK_SIZE):
+    """
+    Hash BLAKE2b do conteúdo do arquivo (string hex).
+    Lido em blocos para que arquivos de vários GB do TSE não fiquem em memória.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def options_key(read_csv_kwargs):
+    """Hash curto das opções de leitura: a tabela convertida depende de encoding, sep, dtype..."""
+    options = {**CSV_OPTIONS, **read_csv_kwargs}
+    return hashlib.blake2b(repr(sorted(options.items())).encode(), digest_size=4).hexdigest()
+
+
+def cache_path(csv_path, digest, read_csv_kwargs=None):
+    """Arquivo de cache de um CSV: fica ao lado da origem, identificado pelo hash do conteúdo e pelas opções de leitura."""
+    base, _ = os.path.splitext(csv_path)
+    return f"{base}.{digest[:16]}.{options_key(read_csv_kwargs or {})}.parquet"
+
+
+def _fingerprint_path(csv_path):
+    base, _ = os.path.splitext(csv_path)
+    return f"{base}.parquet.json"
+
+
+def csv_digest(csv_path):
+    """
+    Hash do conteúdo do CSV. O (tamanho, mtime, hash) do último cálculo fica num pequeno
+    JSON ao lado dele, para que um CSV inalterado não seja relido só para ser identificado.
+    """
+    st = os.stat(csv_path)
+    fingerprint_path = _fingerprint_path(csv_path)
+    try:
+        with open(fingerprint_path, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved['size'] == st.st_size and saved['mtime'] == st.st_mtime:
+            return saved['digest']
+    except (OSError, ValueError, KeyError):
+        pass
+    digest = file_digest(csv_path)
+    try:
+        with open(fingerprint_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': st.st_size, 'mtime': st.st_mtime, 'digest': digest}, f)
+    except OSError as e:
+        logger.warning(f"Não foi possível salvar {fingerprint_path}: {e}")
+    return digest
+
+
+def _schema_for(columns, count_columns):
+    return pa.schema([
+        (c, pa.int64() if c in count_columns else pa.string()) for c in columns
+    ])
+
+
+def _to_table(df, schema, count_columns):
+    for col in count_columns:
+        # errors='raise': uma contagem não numérica aborta a conversão tipada em vez de virar nulo em silêncio
+        df[col] = pd.to_numeric(df[col], errors='raise').astype('Int64')
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def convert_csv(csv_path, parquet_path, typed=True, **read_csv_kwargs):
+    """
+    Lê o CSV uma vez e grava como Parquet comprimido.
+    Grava num nome temporário e renomeia, para que uma falha nunca deixe um cache pela metade.
+    """
+    options = {**CSV_OPTIONS, **read_csv_kwargs}
+    tmp_path = f"{parquet_path}.tmp"
+    writer = None
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=ROW_GROUP_SIZE, **options):
+            if writer is None:
+                columns = list(chunk.columns)
+                count_columns = [c for c in columns if typed and c.strip('"').upper().startswith(COUNT_COLUMN_PREFIX)]
+                schema = _schema_for(columns, count_columns)
+                writer = pq.ParquetWriter(tmp_path, schema, compression=COMPRESSION)
+            writer.write_table(_to_table(chunk, schema, count_columns), row_group_size=ROW_GROUP_SIZE)
+    except (ValueError, TypeError):
+        if writer is not None:
+            writer.close()
+            writer = None
+        if not typed:
+            raise
+        logger.warning(f"Coluna de contagem não numérica em {csv_path}; gravando todas as colunas como texto")
+        return convert_csv(csv_path, parquet_path, typed=False, **read_csv_kwargs)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not os.path.exists(tmp_path):
+        # CSV só com cabeçalho: nada foi gravado
+        return None
+    os.replace(tmp_path, parquet_path)
+    return parquet_path
+
+
+def ensure_parquet(csv_path, **read_csv_kwargs):
+    """
+    Retorna o cache Parquet de csv_path, convertendo antes se o cache não existe ou o
+    conteúdo do CSV mudou. Caches de versões anteriores do CSV são removidos; caches da
+    mesma versão gravados com outras opções de leitura são mantidos. Só são considerados
+    arquivos no formato <base>.<16 hex>.<8 hex>.parquet, para não apagar o cache de outro
+    CSV cujo nome começa igual (x.csv e x.2t.csv).
+    """
+    digest = csv_digest(csv_path)
+    target = cache_path(csv_path, digest, read_csv_kwargs)
+    if os.path.exists(target):
+        return target
+
+    base, _ = os.path.splitext(csv_path)
+    own_cache = re.compile(re.escape(os.path.basename(base)) + r'\.([0-9a-f]{16})\.[0-9a-f]{8}\.parquet$')
+    for path in glob.glob(f"{glob.escape(base)}.*.parquet"):
+        match = own_cache.match(os.path.basename(path))
+        if match and match.group(1) != digest[:16]:
+            os.remove(path)
+
+    logger.info(f"Convertendo {csv_path} para o cache Parquet {target}")
+    return convert_csv(csv_path, target, **read_csv_kwargs)
+
+
+def _filter_expression(filters):
+    """{'SG_UF': 'GO', 'NR_TURNO': ['1', '2']} -> expressão pyarrow (AND de igualdades / IN)."""
+    expr = None
+    for col, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            term = ds.field(col).isin(list(value))
+        else:
+            term = ds.field(col) == value
+        expr = term if expr is None else expr & term
+    return expr
+
+
+def read_parquet_chunks(parquet_path, chunk_size, columns=None, filters=None, skip_chunks=0):
+    """
+    Gera DataFrames a partir do cache Parquet.
+    columns projeta na leitura; filters descarta row groups inteiros pelas estatísticas min/max.
+    skip_chunks pula os primeiros chunks (usado para retomar um arquivo carregado em parte).
+    """
+    dataset = ds.dataset(parquet_path, format='parquet')
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    scanner = dataset.scanner(
+        columns=columns,
+        filter=_filter_expression(filters),
+        batch_size=chunk_size,
+    )
+    types_mapper = {pa.int64(): pd.Int64Dtype()}.get
+    for batch in scanner.to_batches():
+        if batch.num_rows == 0:
+            continue
+        if skip_chunks:
+            skip_chunks -= 1
+            continue
+        yield batch.to_pandas(types_mapper=types_mapper)
+
+
+def read_csv_chunks(csv_path, chunk_size, columns=None, filters=None, skip_chunks=0,
+                    use_cache=True, **read_csv_kwargs):
+    """
+    Ponto de entrada único dos importadores: lê pelo cache Parquet quando o pyarrow está
+    disponível; caso contrário, lê o CSV direto com a mesma projeção e os mesmos filtros.
+    skip_chunks descarta os primeiros chunks que seriam gerados, para que a retomada caia
+    nas mesmas fronteiras de registro da execução interrompida (com o mesmo chunk_size),
+    mesmo com quebras de linha entre aspas ou filtros.
+    """
+    if use_cache and HAS_PYARROW:
+        parquet_path = ensure_parquet(csv_path, **read_csv_kwargs)
+        if parquet_path is None:
+            return
+        yield from read_parquet_chunks(parquet_path, chunk_size, columns, filters, skip_chunks)
+        return
+
+    options = {**CSV_OPTIONS, **read_csv_kwargs}
+    if columns is not None:
+        wanted = set(columns)
+        options['usecols'] = lambda c: c in wanted
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size, **options):
+        for col, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                chunk = chunk[chunk[col].isin(list(value))]
+            else:
+                chunk = chunk[chunk[col] == value]
+        if not len(chunk):
+            continue
+        if skip_chunks:
+            skip_chunks -= 1
+            continue
+        yield chunk
@@ -25,6 +25,33 @@ class Settings:
     CHUNK_SIZE = 50000
     ENCODING = 'latin1'
     CSV_SEPARATOR = ';'
+    # Read CSVs through a Parquet copy written next to each file (requires pyarrow)
+    PARQUET_CACHE = os.getenv('PARQUET_CACHE', 'false').lower() in ('1', 'true', 'yes')
+    # CSV parser when the Parquet cache is off: 'pandas' or 'pyarrow' (streaming, multithreaded)
+    CSV_ENGINE = os.getenv('CSV_ENGINE', 'pandas')
+    # Optional LRU bound (entries) for the largest id caches; 0 = unbounded. Evicted keys
+    # are re-read from the database when a chunk misses them (Transformer._refetch_evicted)
+    SECOES_CACHE_MAX_SIZE = int(os.getenv('SECOES_CACHE_MAX_SIZE', '0')) or None
+    CANDIDATOS_CACHE_MAX_SIZE = int(os.getenv('CANDIDATOS_CACHE_MAX_SIZE', '0')) or None
+    # Files processed concurrently by run_pipeline.py (overridden by --workers)
+    WORKERS = int(os.getenv('PIPELINE_WORKERS', '1'))
+    # MySQLLoader.load_df write path: 'upsert' (pandas to_sql), 'executemany' or 'load_data'.
+    # LOAD_METHODS overrides it per table, e.g. "votos_secao=load_data,vagas=executemany"
+    LOAD_METHOD = os.getenv('LOAD_METHOD', 'upsert')
+    LOAD_METHODS = dict(
+        item.split('=', 1) for item in os.getenv('LOAD_METHODS', '').replace(' ', '').split(',') if '=' in item
+    )
+    # Connection pool of each MySQLLoader (one loader per pipeline worker process)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+    # Attempts per statement on deadlock (1213) / lock wait timeout (1205)
+    DB_MAX_RETRIES = int(os.getenv('DB_MAX_RETRIES', '5'))
+    # JSON lines file receiving run_pipeline's per-file profile (overridden by --profile-out)
+    PROFILE_OUTPUT = os.getenv('PROFILE_OUTPUT', '')
+
+    @property
+    def uses_load_data(self):
+        return 'load_data' in (self.LOAD_METHOD, *self.LOAD_METHODS.values())
 
     @property
     def DATABASE_URL(self):
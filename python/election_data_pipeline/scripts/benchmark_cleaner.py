@@ -0,0 +1,127 @@
+"""
+Micro-benchmark of Cleaner.clean_chunk against the previous implementation
+(strip every object column, then a whole-frame replace('#NULO#', None)).
+
+A synthetic bweb file is written once and read back through CSVExtractor with the
+bweb column projection. Two inputs are measured: the chunk as the parser returns it
+('parser': arrow-backed 'str' columns on pandas >= 3) and with its text columns as
+object dtype ('object': what pandas < 3 returns). The old code strips both: on pandas 3
+select_dtypes('object') still matches 'str' columns (with a deprecation warning).
+Each implementation runs in its own process: peak memory is the growth of the
+process high-water mark (ru_maxrss) while cleaning one chunk, which also counts
+pyarrow's allocations; the time is the median over --repeat runs.
+
+Usage:
+    python scripts/benchmark_cleaner.py
+    python scripts/benchmark_cleaner.py --rows 50000 --engine pyarrow
+"""
+import sys
+import os
+import argparse
+import multiprocessing
+import resource
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.extractors.csv_extractor import CSVExtractor
+from src.transformers.cleaner import Cleaner
+from src.transformers.normalizer import Transformer
+
+
+def legacy_clean_chunk(df):
+    """Cleaner.clean_chunk before the single-pass rewrite."""
+    for col in df.select_dtypes(['object']).columns:
+        df[col] = df[col].str.strip()
+    df.replace('#NULO#', None, inplace=True)
+    return df
+
+
+IMPLEMENTATIONS = {
+    'anterior': legacy_clean_chunk,
+    'atual': Cleaner.clean_chunk,
+}
+
+
+def write_synthetic_bweb(path, rows, seed=0):
+    """bweb-like file: padded text, #NULO# in the party columns of brancos/nulos, QT_* counts."""
+    rng = np.random.default_rng(seed)
+    columns = Transformer.columns_for('bweb') + ['DS_CARGO_PERGUNTA_SECAO', 'DS_SECOES_AGREGADAS', 'DT_BU_RECEBIDO']
+    nulo = rng.random(rows) < 0.1
+    data = {}
+    for col in columns:
+        if col.startswith('QT_'):
+            data[col] = rng.integers(0, 400, rows)
+        else:
+            data[col] = np.char.add(f' {col[:6]} ', rng.integers(0, 5000, rows).astype(str))
+    for col in ('NR_PARTIDO', 'SG_PARTIDO', 'NM_PARTIDO'):
+        data[col] = np.where(nulo, '#NULO#', data[col])
+    pd.DataFrame(data).to_csv(path, sep=';', index=False, encoding='latin1', quoting=1)
+
+
+def max_rss_bytes():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(name, entrada, csv_path, rows, engine, repeat, results):
+    clean = IMPLEMENTATIONS[name]
+    chunk = next(CSVExtractor(csv_path, use_cache=False, columns=Transformer.columns_for('bweb'),
+                              engine=engine).extract_chunks(rows))
+    if entrada == 'object':
+        for col in chunk.columns:
+            if not pd.api.types.is_numeric_dtype(chunk[col]):
+                chunk[col] = chunk[col].astype(object)
+
+    # warm-up run on a copy, then the peak is measured on a fresh copy
+    clean(chunk.copy())
+    work = chunk.copy()
+    before = max_rss_bytes()
+    clean(work)
+    peak = max_rss_bytes() - before
+    del work
+
+    times = []
+    for _ in range(repeat):
+        work = chunk.copy()
+        inicio = time.perf_counter()
+        clean(work)
+        times.append(time.perf_counter() - inicio)
+    results[(name, entrada)] = (statistics.median(times), peak, chunk.memory_usage(deep=True).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark of Cleaner.clean_chunk.')
+    parser.add_argument('--rows', type=int, default=50_000, help='rows per chunk (pipeline CHUNK_SIZE)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--engine', choices=['pandas', 'pyarrow'], default='pandas')
+    parser.add_argument('--entrada', nargs='+', choices=['object', 'parser'], default=['object', 'parser'],
+                        help='dtype of the text columns handed to the cleaner')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'bweb_benchmark.csv')
+        write_synthetic_bweb(csv_path, args.rows)
+
+        results = multiprocessing.Manager().dict()
+        for entrada in args.entrada:
+            for name in IMPLEMENTATIONS:
+                # a fresh process per run keeps the high-water marks independent
+                proc = multiprocessing.Process(
+                    target=measure, args=(name, entrada, csv_path, args.rows, args.engine, args.repeat, results)
+                )
+                proc.start()
+                proc.join()
+
+    print(f"{'implementação':<14} {'entrada':<8} {'ms/chunk':>10} {'pico MiB':>10} {'chunk MiB':>10}")
+    for (name, entrada), (seconds, peak, chunk_bytes) in results.items():
+        print(f"{name:<14} {entrada:<8} {seconds * 1000:>10.1f} {peak / 2**20:>10.1f} {chunk_bytes / 2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark of the MySQLLoader.load_df write paths on votos_secao.
+
+Each method loads the same synthetic rows into a scratch copy of votos_secao
+(CREATE TABLE ... LIKE, so no foreign keys and the real table is never touched):
+a first pass of new rows and a second pass over the same keys (the update side of the upsert).
+
+Usage:
+    python scripts/benchmark_load_df.py
+    python scripts/benchmark_load_df.py --rows 500000 --methods executemany load_data
+"""
+import sys
+import os
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.loaders.mysql_loader import MySQLLoader, LOAD_METHODS
+
+
+def synthetic_votos_secao(rows, seed=0):
+    """Rows with distinct (eleicao_id, secao_id, cargo_id, candidato_id), like one boletim file."""
+    rng = np.random.default_rng(seed)
+    idx = np.arange(rows)
+    return pd.DataFrame({
+        'eleicao_id': 1,
+        'secao_id': idx // 40 + 1,
+        'cargo_id': idx % 4 + 1,
+        'candidato_id': idx % 40 + 1,
+        'qt_votos': rng.integers(0, 300, rows),
+        'qt_aptos': rng.integers(100, 400, rows),
+        'qt_comparecimento': rng.integers(50, 300, rows),
+        'qt_abstencoes': rng.integers(0, 100, rows),
+    })
+
+
+def run_method(loader, method, table, df, batch_rows):
+    with loader.engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS `{table}`"))
+        conn.execute(text(f"CREATE TABLE `{table}` LIKE votos_secao"))
+
+    timings = []
+    for _ in ('insert', 'update'):
+        inicio = time.perf_counter()
+        # same granularity as the pipeline: one load_df call per chunk
+        for start in range(0, len(df), batch_rows):
+            loader.load_df(df.iloc[start:start + batch_rows], table, method=method)
+        timings.append(time.perf_counter() - inicio)
+
+    with loader.engine.connect() as conn:
+        count = conn.execute(text(f"SELECT COUNT(*) FROM `{table}`")).scalar()
+    return count, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the MySQLLoader.load_df write paths on votos_secao.')
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch-rows', type=int, default=50_000, help='rows per load_df call (pipeline chunk size)')
+    parser.add_argument('--methods', nargs='+', choices=LOAD_METHODS, default=list(LOAD_METHODS))
+    parser.add_argument('--table', default='votos_secao_benchmark')
+    args = parser.parse_args()
+
+    loader = MySQLLoader()
+    df = synthetic_votos_secao(args.rows)
+
+    resultados = []
+    for method in args.methods:
+        print(f"=== {method} ===")
+        count, (t_insert, t_update) = run_method(loader, method, args.table, df, args.batch_rows)
+        if count != args.rows:
+            print(f"  AVISO: {count} linhas na tabela, esperado {args.rows}")
+        resultados.append((method, t_insert, t_update))
+
+    with loader.engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS `{args.table}`"))
+
+    base = resultados[0][1] + resultados[0][2]
+    print(f"\n{'método':<14} {'insert s':>10} {'update s':>10} {'linhas/s':>12} {'vs ' + resultados[0][0]:>14}")
+    for method, t_insert, t_update in resultados:
+        total = t_insert + t_update
+        print(f"{method:<14} {t_insert:>10.2f} {t_update:>10.2f} {2 * args.rows / total:>12,.0f} {base / total:>13.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ import sys
 import os
 import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
 # Add project root to path
@@ -9,6 +10,9 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from config.settings import settings
 from src.utils.file_parser import FileParser
+from src.utils.scheduler import plan_stages
+from src.utils.profiler import FileProfiler
+from src.utils.file_hash import FileFingerprint
 from src.extractors.csv_extractor import CSVExtractor
 from src.loaders.mysql_loader import MySQLLoader
 from src.transformers.normalizer import Transformer
@@ -18,48 +22,181 @@ from src.transformers.aggregator import Aggregator
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def process_file(file_path, metadata, loader, transformer, show_progress=True, profile_out=None):
+    """
+    Runs one file through extract -> clean -> transform/load, tracking it in arquivos_processados.
+    Returns (status, lines) with status 'PROCESSED', 'SKIPPED' or 'ERROR'.
+    Each processed file ends with a JSON profile (stage times, chunk latency, DB round trips,
+    cache hits/misses), logged and appended to profile_out when given.
+    """
+    logger.info(f"Processing {file_path} (Turno: {metadata['turno']}, UF: {metadata['uf']})")
+
+    # Skip decisions are based on contents: size/mtime first, the digest only when they differ
+    fingerprint = FileFingerprint(file_path)
+    file_id, already_processed, changed = loader.register_file(file_path, fingerprint)
+    if already_processed:
+        logger.info(f"Skipping already processed file: {file_path}")
+        return 'SKIPPED', 0
+
+    # The digest stored with the PROCESSED status is computed while the file is parsed
+    fingerprint.start()
+
+    total_lines = 0
+
+    # Only the columns the transformer consumes for this file type are parsed and cleaned
+    columns = Transformer.columns_for(metadata.get('type'))
+    extractor = CSVExtractor(file_path, columns=columns)
+
+    profiler = FileProfiler(file_path, metadata, loader, transformer)
+    commits_before = loader.commits
+
+    try:
+        if changed:
+            logger.info(f"Content changed since the last load, reloading its slice: {file_path}")
+            transformer.delete_file_slice(metadata)
+
+        progress = tqdm(profiler.iterate(extractor.extract_chunks()), desc="Processing Chunks", disable=not show_progress)
+        for chunk in progress:
+            # Clean
+            with profiler.stage('clean'):
+                chunk = Cleaner.clean_chunk(chunk, columns=columns)
+
+            # Transform and Load (Normalized + Consolidated), one transaction per chunk
+            with profiler.transform():
+                transformer.process_chunk(chunk, metadata)
+
+            total_lines += len(chunk)
+            profiler.end_chunk(len(chunk))
+            if transformer.last_chunk_stats:
+                progress.set_postfix(transformer.last_chunk_stats)
+                logger.debug(f"Chunk de {len(chunk)} linhas: {transformer.last_chunk_stats}")
+
+        loader.update_file_status(file_id, 'PROCESSED', total_lines, fingerprint)
+        logger.info(f"Successfully processed {file_path} ({loader.commits - commits_before} commits)")
+        profiler.report('PROCESSED', profile_out)
+        return 'PROCESSED', total_lines
+
+    except Exception as e:
+        loader.update_file_status(file_id, 'ERROR', total_lines)
+        logger.error(f"Failed to process {file_path}: {e}", exc_info=True)
+        profiler.report('ERROR', profile_out)
+        return 'ERROR', total_lines
+
+# Per-process state of the worker pool (one engine and one set of caches per worker)
+_worker = {}
+
+def _init_worker(profile_out=None):
+    _worker['profile_out'] = profile_out
+    loader = MySQLLoader()
+    _worker['loader'] = loader
+    _worker['transformer'] = Transformer(loader)
+    _worker['preloaded'] = set()
+
+def _process_file_in_worker(file_path, metadata):
+    transformer = _worker['transformer']
+    # Warm start scoped to the file; each (UF, ano) is read from the database once per worker
+    scope = (metadata['uf'], metadata['ano'])
+    if scope not in _worker['preloaded']:
+        transformer.preload(ufs={metadata['uf']}, anos={metadata['ano']})
+        _worker['preloaded'].add(scope)
+    status, lines = process_file(
+        file_path, metadata, _worker['loader'], transformer, show_progress=False, profile_out=_worker['profile_out']
+    )
+    return status, lines, transformer.cache_stats(), set(transformer.eleicoes_carregadas)
+
+def run_parallel(plan, workers, profile_out=None):
+    """
+    Processes the planned stages in a pool of worker processes: files of a stage run
+    concurrently (largest first), and a stage only starts when the previous one is done.
+    Dimension ids are created with DB-side upserts (INSERT ... ON DUPLICATE KEY UPDATE on
+    uk_municipio_tse, uk_zona, uk_secao, uk_candidato, ...), so workers racing on the same
+    key all read back the same id; deadlocks between them are retried by the loader.
+    Returns the status summary and the eleicao_ids that received votos_secao rows.
+    """
+    summary = {'PROCESSED': 0, 'SKIPPED': 0, 'ERROR': 0}
+    eleicoes = set()
+    # Engines are created inside each worker, never inherited from this process
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(profile_out,)) as executor:
+        for stage, files in plan:
+            logger.info(f"Stage '{stage}': {len(files)} file(s)")
+            # submitted in plan order, so the largest files are picked up first
+            futures = {
+                executor.submit(_process_file_in_worker, file_path, metadata): file_path
+                for file_path, metadata in files
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                file_path = futures[future]
+                try:
+                    status, lines, stats, carregadas = future.result()
+                    eleicoes |= carregadas
+                except Exception as e:
+                    # worker crashed before reaching the status tracking (e.g. killed process)
+                    logger.error(f"Worker failed on {file_path}: {e}", exc_info=True)
+                    status, lines, stats = 'ERROR', 0, []
+                summary[status] += 1
+                logger.info(f"[{stage} {done}/{len(files)}] {status} {file_path} ({lines} linhas)")
+                for cache in stats:
+                    logger.debug(f"Cache {cache['name']} ({file_path}): {cache}")
+    return summary, eleicoes
+
+def consolidate(loader, eleicoes):
+    """Post-load stage: rebuilds votos_consolidados of every eleição touched by this run."""
+    for eleicao_id in sorted(eleicoes):
+        try:
+            Aggregator.rebuild_votos_consolidados(loader, eleicao_id)
+        except Exception as e:
+            logger.error(f"Failed to rebuild votos_consolidados for eleicao_id={eleicao_id}: {e}", exc_info=True)
+
 def main():
     parser = argparse.ArgumentParser(description='Election Data ETL Pipeline')
     parser.add_argument('--data_dir', default=settings.DATA_DIR, help='Directory containing election data')
+    parser.add_argument('--workers', type=int, default=settings.WORKERS,
+                        help='Number of files processed concurrently (worker processes)')
+    parser.add_argument('--profile-out', default=settings.PROFILE_OUTPUT or None,
+                        help='Append the per-file JSON profiles to this file (JSON lines)')
     args = parser.parse_args()
 
     logger.info(f"Starting ETL pipeline. Data directory: {args.data_dir}")
     
-    loader = MySQLLoader()
-    transformer = Transformer(loader)
-    
     # 1. Discovery
     files = list(FileParser.find_csv_files(args.data_dir))
     logger.info(f"Found {len(files)} CSV files to process.")
-    
-    for file_path, metadata in files:
-        logger.info(f"Processing {file_path} (Turno: {metadata['turno']}, UF: {metadata['uf']})")
-
-        file_id, already_processed = loader.register_file(file_path)
-        if already_processed:
-            logger.info(f"Skipping already processed file: {file_path}")
-            continue
 
-        total_lines = 0
+    # Dimension files first, then the fact loads (largest first)
+    plan = plan_stages(files)
+    logger.info("Execution plan: " + ', '.join(f"{stage}={len(stage_files)}" for stage, stage_files in plan))
 
-        extractor = CSVExtractor(file_path)
+    loader = MySQLLoader()
+    # size/mtime/hash columns of arquivos_processados on databases created before them
+    loader.ensure_file_tracking_columns()
 
-        try:
-            for chunk in tqdm(extractor.extract_chunks(), desc="Processing Chunks"):
-                # Clean
-                chunk = Cleaner.clean_chunk(chunk)
+    if args.workers > 1:
+        logger.info(f"Processing files with {args.workers} workers.")
+        # workers open their own connections; none of this pool's is inherited
+        loader.engine.dispose()
+        summary, eleicoes = run_parallel(plan, args.workers, args.profile_out)
+        logger.info(f"Finished: {summary}")
+        consolidate(loader, eleicoes)
+        return
 
-                # Transform and Load (Normalized + Consolidated)
-                transformer.process_chunk(chunk, metadata)
+    transformer = Transformer(loader)
 
-                total_lines += len(chunk)
+    # 2. Warm start: load the dimensions already in the database for these UFs/years
+    transformer.preload(
+        ufs={metadata['uf'] for _, metadata in files},
+        anos={metadata['ano'] for _, metadata in files},
+    )
+    
+    for stage, stage_files in plan:
+        logger.info(f"Stage '{stage}': {len(stage_files)} file(s)")
+        for file_path, metadata in stage_files:
+            process_file(file_path, metadata, loader, transformer, profile_out=args.profile_out)
 
-            loader.update_file_status(file_id, 'PROCESSED', total_lines)
-            logger.info(f"Successfully processed {file_path}")
+    # 3. Consolidation: votos_consolidados derived from votos_secao in the database
+    consolidate(loader, transformer.eleicoes_carregadas)
 
-        except Exception as e:
-            loader.update_file_status(file_id, 'ERROR', total_lines)
-            logger.error(f"Failed to process {file_path}: {e}", exc_info=True)
+    for stats in transformer.cache_stats():
+        logger.info(f"Cache {stats['name']}: {stats}")
 
 if __name__ == '__main__':
     main()
@@ -1,23 +1,60 @@
 import pandas as pd
 import logging
 from config.settings import settings
+from src.utils.parquet_cache import read_csv_chunks
 
 logger = logging.getLogger(__name__)
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    HAS_PYARROW = True
+except ImportError:  # optional dependency: without it the pandas parser is used
+    HAS_PYARROW = False
+
+# Count columns are parsed as integers, every other column as string (keeps leading zeros)
+COUNT_COLUMN_PREFIX = 'QT_'
+
 class CSVExtractor:
-    def __init__(self, file_path, encoding=settings.ENCODING, separator=settings.CSV_SEPARATOR):
+    def __init__(self, file_path, encoding=settings.ENCODING, separator=settings.CSV_SEPARATOR,
+                 use_cache=settings.PARQUET_CACHE, columns=None, engine=settings.CSV_ENGINE):
         self.file_path = file_path
         self.encoding = encoding
         self.separator = separator
+        self.use_cache = use_cache
+        # Projection: only these columns are parsed (None = all). Columns missing from a
+        # file are simply absent from the chunks, as before.
+        self.columns = list(columns) if columns is not None else None
+        self.engine = engine
+        if engine == 'pyarrow' and not HAS_PYARROW:
+            logger.warning("CSV_ENGINE=pyarrow but pyarrow is not installed; using the pandas parser")
+            self.engine = 'pandas'
 
     def extract_chunks(self, chunk_size=settings.CHUNK_SIZE):
         """
         Yields chunks of the CSV file as DataFrames.
         """
         try:
+            if self.use_cache:
+                # Parquet cache keeps codes as strings and QT_* counts as integers
+                yield from read_csv_chunks(
+                    self.file_path,
+                    chunk_size,
+                    columns=self.columns,
+                    use_cache=True,
+                    encoding=self.encoding,
+                    sep=self.separator,
+                    on_bad_lines='warn'
+                )
+                return
+
+            if self.engine == 'pyarrow':
+                yield from self._extract_chunks_pyarrow(chunk_size)
+                return
+
             # First, peek at the columns to ensure validity or validation if needed
             # For now, we trust the schema but handle encoding issues
-            
+
             # Columns to ensure are read as strings to preserve leading zeros
             dtype_options = {
                 'NR_ZONA': str,
@@ -38,15 +75,69 @@ class CSVExtractor:
                 'SQ_COLIGACAO': str
             }
 
+            usecols = None
+            if self.columns is not None:
+                wanted = set(self.columns)
+                usecols = lambda c: c in wanted
+
             for chunk in pd.read_csv(
-                self.file_path, 
-                sep=self.separator, 
-                encoding=self.encoding, 
+                self.file_path,
+                sep=self.separator,
+                encoding=self.encoding,
                 chunksize=chunk_size,
                 dtype=dtype_options,
+                usecols=usecols,
                 on_bad_lines='warn'
             ):
                 yield chunk
         except Exception as e:
             logger.error(f"Error reading file {self.file_path}: {e}")
             raise
+
+    def _read_header(self):
+        with open(self.file_path, encoding=self.encoding, newline='') as f:
+            header = f.readline().rstrip('\r\n')
+        return [c.strip('"') for c in header.split(self.separator)]
+
+    def _skip_bad_row(self, row):
+        logger.warning(f"{self.file_path}: linha {row.number} ignorada ({row.text[:80]!r})")
+        return 'skip'
+
+    def _extract_chunks_pyarrow(self, chunk_size):
+        """
+        Streaming parse with pyarrow's multithreaded CSV reader. Projected columns are
+        selected before conversion, so unused columns are never materialized.
+        Record batches are regrouped into DataFrames of chunk_size rows.
+        """
+        header = self._read_header()
+        columns = header if self.columns is None else [c for c in header if c in set(self.columns)]
+        column_types = {
+            c: pa.int64() if c.upper().startswith(COUNT_COLUMN_PREFIX) else pa.string() for c in columns
+        }
+        reader = pa_csv.open_csv(
+            self.file_path,
+            read_options=pa_csv.ReadOptions(encoding=self.encoding, block_size=8 << 20),
+            parse_options=pa_csv.ParseOptions(
+                delimiter=self.separator, invalid_row_handler=self._skip_bad_row
+            ),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns, column_types=column_types, strings_can_be_null=True
+            ),
+        )
+
+        pending, pending_rows = [], 0
+        for batch in reader:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows < chunk_size:
+                continue
+            table = pa.Table.from_batches(pending)
+            offset = 0
+            while pending_rows - offset >= chunk_size:
+                yield table.slice(offset, chunk_size).to_pandas()
+                offset += chunk_size
+            pending = table.slice(offset).to_batches()
+            pending_rows -= offset
+
+        if pending_rows:
+            yield pa.Table.from_batches(pending).to_pandas()
@@ -1,43 +1,305 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from contextlib import contextmanager
 from config.settings import settings
 import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# Write paths accepted by MySQLLoader.load_df
+LOAD_METHODS = ('upsert', 'executemany', 'load_data')
+
+# Content tracking of arquivos_processados added after the first schema (see ensure_file_tracking_columns)
+FILE_TRACKING_MIGRATIONS = [
+    "ALTER TABLE arquivos_processados ADD COLUMN tamanho BIGINT",
+    "ALTER TABLE arquivos_processados ADD COLUMN mtime DOUBLE",
+    "ALTER TABLE arquivos_processados ADD COLUMN hash_conteudo VARCHAR(80)",
+    "ALTER TABLE arquivos_processados ADD INDEX idx_arquivos_tamanho (tamanho)",
+]
+
+def is_retryable_db_error(exc):
+    s = str(exc)
+    return "1213" in s or "1205" in s  # deadlock / lock wait timeout
+
+class UnitOfWork:
+    """Counters of one unit of work (one transaction on one pooled connection)."""
+    def __init__(self, conn):
+        self.conn = conn
+        self.statements = 0
+        self.commits = 0
+        self.locks = []
+        self.started = time.perf_counter()
+
+    def stats(self):
+        return {
+            'statements': self.statements,
+            'commits': self.commits,
+            'seconds': round(time.perf_counter() - self.started, 3),
+        }
+
 class MySQLLoader:
     def __init__(self):
-        self.engine = create_engine(settings.DATABASE_URL)
+        self.engine = create_engine(
+            settings.DATABASE_URL,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+            **self._infile_kwargs(settings.uses_load_data)
+        )
+        self._infile_engine = None
+        self._count_round_trips(self.engine)
+        # The active unit of work is per thread: each thread gets its own connection
+        self._local = threading.local()
+        # Totals since the loader was created (statements outside a unit of work commit one by one)
+        self.statements = 0
+        self.commits = 0
+        # Round trips (cursor executions) and time spent in execute_query / load_df
+        self.round_trips = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.loads = 0
+        self.loaded_rows = 0
+        self.load_seconds = 0.0
+
+    def _count_round_trips(self, engine):
+        def count(*args):
+            self.round_trips += 1
+        event.listen(engine, 'before_cursor_execute', count)
+
+    def metrics(self):
+        """Snapshot of the loader's counters (see FileProfiler)."""
+        return {
+            'round_trips': self.round_trips,
+            'statements': self.statements,
+            'commits': self.commits,
+            'queries': self.queries,
+            'query_seconds': self.query_seconds,
+            'loads': self.loads,
+            'loaded_rows': self.loaded_rows,
+            'load_seconds': self.load_seconds,
+        }
+
+    @staticmethod
+    def _infile_kwargs(enabled):
+        # LOAD DATA LOCAL INFILE needs the client opt-in (and local_infile=ON on the server)
+        return {'connect_args': {'allow_local_infile': True}} if enabled else {}
+
+    @property
+    def current_unit_of_work(self):
+        return getattr(self._local, 'uow', None)
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Groups every execute_query / load_df issued inside the block (by this thread) into a
+        single transaction on one pooled connection, committed once at the end and rolled back
+        as a whole on error. Nested blocks join the outer one. Yields the UnitOfWork, whose
+        stats() give the statement and commit counts of the block.
+
+        Statements are not retried individually here: a deadlock rolls back the whole
+        transaction, so the caller repeats the entire unit (see Transformer.process_chunk).
+        """
+        outer = self.current_unit_of_work
+        if outer is not None:
+            yield outer
+            return
+
+        with self.engine.connect() as conn:
+            uow = UnitOfWork(conn)
+            self._local.uow = uow
+            try:
+                with conn.begin():
+                    yield uow
+                uow.commits += 1
+                self.commits += 1
+            finally:
+                self._local.uow = None
+                # named locks are session-level: held until the transaction ended
+                for name in uow.locks:
+                    conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': name})
+                if uow.locks:
+                    conn.commit()
+
+    @contextmanager
+    def _transaction(self, engine=None):
+        """Connection of the active unit of work, or a new transaction committed on exit."""
+        uow = self.current_unit_of_work
+        if uow is not None:
+            uow.statements += 1
+            self.statements += 1
+            yield uow.conn
+            return
+        with (engine or self.engine).begin() as conn:
+            self.statements += 1
+            yield conn
+        self.commits += 1
+
+    def _with_retry(self, fn, description):
+        """
+        Runs fn(), retrying with backoff on deadlock / lock wait timeout.
+        Parallel workers upsert the same dimension keys, so InnoDB may pick one of them as
+        a deadlock victim; its transaction was rolled back and the upsert is safe to repeat.
+        Inside a unit of work fn() runs once: only the whole unit can be repeated.
+        """
+        if self.current_unit_of_work is not None:
+            return fn()
+        for attempt in range(1, settings.DB_MAX_RETRIES + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if not is_retryable_db_error(e) or attempt == settings.DB_MAX_RETRIES:
+                    raise
+                logger.warning(f"{description}: conflito de lock, tentativa {attempt + 1}/{settings.DB_MAX_RETRIES}")
+                time.sleep(min(8, 0.2 * (2 ** (attempt - 1))) + random.uniform(0, 0.4))
 
     def execute_query(self, query, params=None):
+        # If query is string, wrap in text(), else use as is
+        if isinstance(query, str):
+            stmt = text(query)
+        else:
+            stmt = query
+
+        def run():
+            with self._transaction() as conn:
+                return conn.execute(stmt, params or {})
+
+        inicio = time.perf_counter()
+        try:
+            return self._with_retry(run, "execute_query")
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - inicio
+
+    @contextmanager
+    def named_lock(self, name, timeout=60):
+        """
+        Holds a MySQL named lock (GET_LOCK) for the duration of the block, serializing a
+        check-then-insert section across worker processes. Statements inside the block may
+        use other connections: the lock belongs to the connection kept open here.
+        Inside a unit of work the lock is taken on its connection and kept until the unit
+        commits, so other workers only get it once the rows written under it are visible.
+        """
+        uow = self.current_unit_of_work
+        if uow is not None:
+            if name not in uow.locks:
+                self._get_lock(uow.conn, name, timeout)
+                uow.locks.append(name)
+            yield
+            return
+
         with self.engine.connect() as conn:
-            # If query is string, wrap in text(), else use as is
-            if isinstance(query, str):
-                stmt = text(query)
-            else:
-                stmt = query
-                
-            result = conn.execute(stmt, params or {})
-            conn.commit()
-            return result
-
-    def register_file(self, path):
+            self._get_lock(conn, name, timeout)
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': name})
+
+    @staticmethod
+    def _get_lock(conn, name, timeout):
+        acquired = conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {'name': name, 'timeout': timeout}).scalar()
+        if acquired != 1:
+            raise TimeoutError(f"Could not acquire lock {name} within {timeout}s")
+
+    def ensure_file_tracking_columns(self):
+        """
+        Adds the content-tracking columns of arquivos_processados (size, mtime, hash) to
+        databases created before they were in schema.sql. Columns/indexes that already
+        exist (MySQL errors 1060/1061) are skipped.
+        """
+        for sql in FILE_TRACKING_MIGRATIONS:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(text(sql))
+                logger.info(f"Migração aplicada: {sql}")
+            except Exception as e:
+                if "1060" in str(e) or "1061" in str(e) or "Duplicate" in str(e):
+                    continue
+                raise
+
+    def _save_fingerprint(self, conn, file_id, fingerprint, **changes):
+        assignments = ''.join(f", {column}=:{column}" for column in changes)
+        conn.execute(text(
+            f"UPDATE arquivos_processados SET tamanho=:tamanho, mtime=:mtime, hash_conteudo=:hash{assignments} "
+            f"WHERE id=:id"
+        ), {'tamanho': fingerprint.size, 'mtime': fingerprint.mtime, 'hash': fingerprint.digest(),
+            'id': file_id, **changes})
+
+    def register_file(self, path, fingerprint=None):
         """
         Registra o arquivo na tabela de controle.
-        Retorna uma tupla (file_id, already_processed).
+        Retorna uma tupla (file_id, already_processed, changed).
         already_processed=True indica que o arquivo já foi processado com sucesso e deve ser pulado.
+        changed=True indica que o conteúdo mudou desde a última carga: a fatia do arquivo
+        deve ser apagada antes de recarregar.
+
+        With a FileFingerprint the decision is based on content: a PROCESSED file whose size
+        and mtime match is skipped without hashing; otherwise its digest is compared with the
+        stored one (a touched or re-downloaded identical file is skipped too). An unknown path
+        whose contents were already loaded under another path (moved/copied) is skipped as
+        well. The fingerprint is only stored once a load succeeds (update_file_status), so a
+        failed reload of changed contents is detected as changed again.
+        Without a fingerprint only the path is checked, as before.
         """
         try:
             with self.engine.connect() as conn:
                 # Check if exists
-                res = conn.execute(text("SELECT id, status FROM arquivos_processados WHERE path=:path"), {'path': path}).first()
+                res = conn.execute(text(
+                    "SELECT id, status, tamanho, mtime, hash_conteudo FROM arquivos_processados WHERE path=:path"
+                ), {'path': path}).first()
                 if res:
-                    file_id, status = res[0], res[1]
-                    if status == 'PROCESSED':
-                        return file_id, True
-                    # ERROR or PROCESSING: allow retry
+                    file_id, status, size, mtime, stored_hash = res
+                    changed = False
+                    if fingerprint is not None:
+                        if stored_hash is None:
+                            # loaded before content tracking: trust the path, record the fingerprint
+                            if status == 'PROCESSED':
+                                self._save_fingerprint(conn, file_id, fingerprint)
+                                conn.commit()
+                                return file_id, True, False
+                        elif fingerprint.same_stat(size, mtime) or fingerprint.matches(stored_hash):
+                            if status == 'PROCESSED':
+                                if not fingerprint.same_stat(size, mtime):
+                                    self._save_fingerprint(conn, file_id, fingerprint)
+                                    conn.commit()
+                                return file_id, True, False
+                        else:
+                            changed = True
+                    elif status == 'PROCESSED':
+                        return file_id, True, False
+                    # ERROR, PROCESSING or new contents: (re)load
                     conn.execute(text("UPDATE arquivos_processados SET status='PROCESSING', linhas=0 WHERE id=:id"), {'id': file_id})
                     conn.commit()
-                    return file_id, False
+                    return file_id, False, changed
+
+                if fingerprint is not None:
+                    # same contents already loaded under another path (file moved or copied)
+                    candidates = conn.execute(text(
+                        "SELECT id, path, hash_conteudo FROM arquivos_processados "
+                        "WHERE tamanho=:tamanho AND status='PROCESSED' AND hash_conteudo IS NOT NULL"
+                    ), {'tamanho': fingerprint.size}).fetchall()
+                    for other_id, other_path, other_hash in candidates:
+                        if not fingerprint.matches(other_hash):
+                            continue
+                        if not os.path.exists(other_path):
+                            logger.info(f"{path}: mesmo conteúdo de {other_path} (arquivo movido)")
+                            self._save_fingerprint(conn, other_id, fingerprint, path=path)
+                            conn.commit()
+                            return other_id, True, False
+                        logger.info(f"{path}: mesmo conteúdo de {other_path}, já carregado")
+                        conn.execute(text(
+                            "INSERT INTO arquivos_processados (path, status, linhas, tamanho, mtime, hash_conteudo) "
+                            "SELECT :path, 'PROCESSED', linhas, tamanho, :mtime, hash_conteudo "
+                            "FROM arquivos_processados WHERE id=:id"
+                        ), {'path': path, 'mtime': fingerprint.mtime, 'id': other_id})
+                        conn.commit()
+                        res = conn.execute(text("SELECT id FROM arquivos_processados WHERE path=:path"), {'path': path}).first()
+                        return res[0], True, False
 
                 # Insert new record
                 conn.execute(text("INSERT INTO arquivos_processados (path, status, linhas) VALUES (:path, 'PROCESSING', 0)"),
@@ -45,21 +307,124 @@ class MySQLLoader:
                 conn.commit()
 
                 res = conn.execute(text("SELECT id FROM arquivos_processados WHERE path=:path"), {'path': path}).first()
-                return res[0], False
+                return res[0], False, False
         except Exception as e:
             logger.error(f"Error registering file {path}: {e}")
-            return None, False
+            return None, False, False
 
-    def update_file_status(self, file_id, status, lines=0):
+    def update_file_status(self, file_id, status, lines=0, fingerprint=None):
+        """Stores the file's status; with a fingerprint (successful load) also its size, mtime and digest."""
         try:
             with self.engine.connect() as conn:
-                conn.execute(text("UPDATE arquivos_processados SET status=:status, linhas=:lines WHERE id=:id"), 
-                           {'status': status, 'lines': lines, 'id': file_id})
+                if fingerprint is not None:
+                    self._save_fingerprint(conn, file_id, fingerprint, status=status, linhas=lines)
+                else:
+                    conn.execute(text("UPDATE arquivos_processados SET status=:status, linhas=:lines WHERE id=:id"), 
+                               {'status': status, 'lines': lines, 'id': file_id})
                 conn.commit()
         except Exception as e:
             logger.error(f"Error updating file {file_id}: {e}")
 
-    def load_df(self, df, table_name, if_exists='append', chunksize=1000):
+    def _local_infile_engine(self):
+        if settings.uses_load_data:
+            return self.engine
+        if self._infile_engine is None:
+            self._infile_engine = create_engine(settings.DATABASE_URL, **self._infile_kwargs(True))
+            self._count_round_trips(self._infile_engine)
+        return self._infile_engine
+
+    @staticmethod
+    def _upsert_sql(table_name, columns, source=None):
+        """
+        INSERT ... ON DUPLICATE KEY UPDATE that overwrites every loaded column, the same
+        effect as the to_sql upsert. Without source it takes driver placeholders (%s);
+        with source it is an INSERT ... SELECT from that table.
+        """
+        col_list = ', '.join(f'`{c}`' for c in columns)
+        updates = ', '.join(f'`{c}`=VALUES(`{c}`)' for c in columns)
+        if source is None:
+            body = f"VALUES ({', '.join(['%s'] * len(columns))})"
+        else:
+            body = f"SELECT {col_list} FROM `{source}`"
+        return f"INSERT INTO `{table_name}` ({col_list}) {body} ON DUPLICATE KEY UPDATE {updates}"
+
+    def _load_executemany(self, df, table_name, chunksize):
+        """
+        Plain driver executemany: no SQLAlchemy statement is built or compiled. mysql-connector
+        rewrites an executemany INSERT into one multi-row INSERT per call.
+        """
+        if len(df) == 0:
+            return
+        sql = self._upsert_sql(table_name, list(df.columns))
+        # python scalars, None for every kind of missing value
+        rows = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+        with self._transaction() as conn:
+            for start in range(0, len(rows), chunksize):
+                conn.exec_driver_sql(sql, rows[start:start + chunksize])
+
+    @staticmethod
+    def _load_data_text(df):
+        """
+        Renders df in LOAD DATA's default format: tab-separated, newline-terminated,
+        backslash escapes and \\N for NULL.
+        """
+        columns = []
+        for name in df.columns:
+            col = df[name]
+            null = col.isna().to_numpy()
+            if pd.api.types.is_bool_dtype(col):
+                col = col.astype('Int64')
+            text_col = col.astype(str)
+            if col.dtype == object or pd.api.types.is_string_dtype(col):
+                for char, escaped in (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')):
+                    text_col = text_col.str.replace(char, escaped, regex=False)
+            columns.append(text_col.where(~null, '\\N'))
+        lines = columns[0]
+        for text_col in columns[1:]:
+            lines = lines + '\t' + text_col
+        return '\n'.join(lines) + '\n'
+
+    def _load_load_data(self, df, table_name):
+        """
+        Writes df to a temporary file, LOAD DATA LOCAL INFILE into a key-less TEMPORARY
+        staging copy of the table, then one set-based INSERT ... SELECT ... ON DUPLICATE KEY UPDATE.
+        """
+        if len(df) == 0:
+            return
+        columns = list(df.columns)
+        col_list = ', '.join(f'`{c}`' for c in columns)
+        staging = f'{table_name}_staging'
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv', delete=False) as f:
+            f.write(self._load_data_text(df))
+            path = f.name
+        try:
+            path_sql = path.replace('\\', '\\\\').replace("'", "\\'")
+            # inside a unit of work this is its connection (infile-enabled when LOAD_METHODS uses load_data)
+            with self._transaction(self._local_infile_engine()) as conn:
+                conn.exec_driver_sql(f"DROP TEMPORARY TABLE IF EXISTS `{staging}`")
+                # CREATE ... SELECT copies the column types but none of the keys
+                conn.exec_driver_sql(f"CREATE TEMPORARY TABLE `{staging}` SELECT {col_list} FROM `{table_name}` LIMIT 0")
+                conn.exec_driver_sql(
+                    f"LOAD DATA LOCAL INFILE '{path_sql}' INTO TABLE `{staging}` "
+                    f"CHARACTER SET utf8mb4 ({col_list})"
+                )
+                conn.exec_driver_sql(self._upsert_sql(table_name, columns, source=staging))
+                conn.exec_driver_sql(f"DROP TEMPORARY TABLE IF EXISTS `{staging}`")
+        finally:
+            os.remove(path)
+
+    def load_df(self, df, table_name, if_exists='append', chunksize=1000, method=None):
+        """
+        Upserts df into table_name. method picks the write path (default: settings.LOAD_METHODS
+        for the table, else settings.LOAD_METHOD):
+          - 'upsert':       pandas to_sql with a multi-row INSERT ... ON DUPLICATE KEY UPDATE;
+          - 'executemany':  the same upsert sent through the driver's executemany;
+          - 'load_data':    LOAD DATA LOCAL INFILE into a staging table + one set-based upsert.
+        """
+        method = method or settings.LOAD_METHODS.get(table_name, settings.LOAD_METHOD)
+        if method not in LOAD_METHODS:
+            raise ValueError(f"Unknown load method {method!r} for {table_name}; expected one of {LOAD_METHODS}")
+
         def mysql_on_duplicate_key_update(table, conn, keys, data_iter):
             from sqlalchemy.dialects.mysql import insert
             from sqlalchemy import table as sql_table, column as sql_column
@@ -80,16 +445,32 @@ class MySQLLoader:
 
             conn.execute(on_duplicate_key_stmt)
 
+        if method == 'executemany':
+            load = lambda: self._load_executemany(df, table_name, chunksize)
+        elif method == 'load_data':
+            load = lambda: self._load_load_data(df, table_name)
+        else:
+            def load():
+                with self._transaction() as conn:
+                    df.to_sql(
+                        table_name,
+                        conn,
+                        if_exists=if_exists,
+                        index=False,
+                        chunksize=chunksize,
+                        method=mysql_on_duplicate_key_update
+                    )
+
+        inicio = time.perf_counter()
         try:
-            df.to_sql(
-                table_name, 
-                self.engine, 
-                if_exists=if_exists, 
-                index=False, 
-                chunksize=chunksize,
-                method=mysql_on_duplicate_key_update
-            )
-            logger.info(f"Loaded {len(df)} rows into {table_name}")
+            # Each path runs in one transaction (or joins the unit of work): a deadlock
+            # rolls it all back, so outside a unit of work the whole upsert is retried
+            self._with_retry(load, f"load_df {table_name}")
+            self.loaded_rows += len(df)
+            logger.info(f"Loaded {len(df)} rows into {table_name} ({method})")
         except Exception as e:
             logger.error(f"Error loading data into {table_name}: {e}")
             raise
+        finally:
+            self.loads += 1
+            self.load_seconds += time.perf_counter() - inicio
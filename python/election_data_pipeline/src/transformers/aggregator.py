@@ -1,3 +1,10 @@
+import logging
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
 
 class Aggregator:
     @staticmethod
@@ -22,3 +29,31 @@ class Aggregator:
         }
         
         return df.groupby(group_cols, as_index=False).agg(agg_funcs)
+
+    @staticmethod
+    def rebuild_votos_consolidados(loader, eleicao_id):
+        """
+        Recomputes votos_consolidados of one eleição from votos_secao, in the database:
+        one DELETE and one INSERT ... SELECT ... GROUP BY (município via secoes -> zonas),
+        in a single transaction. Runs after the files are loaded, so every municipality's
+        total covers all of its sections regardless of how the CSV was chunked.
+        Returns the number of consolidated rows.
+        """
+        inicio = time.perf_counter()
+        with loader.unit_of_work():
+            loader.execute_query(
+                text("DELETE FROM votos_consolidados WHERE eleicao_id = :eleicao_id"),
+                {'eleicao_id': eleicao_id}
+            )
+            result = loader.execute_query(text("""
+                INSERT INTO votos_consolidados (eleicao_id, municipio_id, cargo_id, candidato_id, total_votos)
+                SELECT vs.eleicao_id, z.municipio_id, vs.cargo_id, vs.candidato_id, SUM(vs.qt_votos)
+                FROM votos_secao vs
+                JOIN secoes s ON s.id = vs.secao_id
+                JOIN zonas z ON z.id = s.zona_id
+                WHERE vs.eleicao_id = :eleicao_id
+                GROUP BY vs.eleicao_id, z.municipio_id, vs.cargo_id, vs.candidato_id
+            """), {'eleicao_id': eleicao_id})
+        rows = result.rowcount
+        logger.info(f"votos_consolidados da eleição {eleicao_id} recalculado: {rows} linhas em {time.perf_counter() - inicio:.1f}s")
+        return rows
@@ -1,17 +1,56 @@
+import numpy as np
 import pandas as pd
 
+# TSE placeholders for "null" (#NULO#) and "not informed" (#NE#)
+NULL_SENTINELS = ['#NULO#', '#NE#']
+
+# Code columns where -1 also means "not informed". Counts (QT_*) and numbers such as
+# NR_PARTIDO are left alone: -1 is meaningful there or handled by the transformer.
+NEGATIVE_ONE_NULL_COLUMNS = {
+    'CD_SITUACAO_CANDIDATURA', 'CD_GENERO', 'CD_GRAU_INSTRUCAO', 'CD_ESTADO_CIVIL',
+    'CD_COR_RACA', 'CD_OCUPACAO', 'CD_SIT_TOT_TURNO',
+}
+
+
+def _arrow_string_dtype():
+    """Arrow-backed strings with NaN as missing value (pandas' default 'str' from 3.0 on)."""
+    for args, kwargs in ((('pyarrow',), {'na_value': np.nan}), (('pyarrow_numpy',), {})):
+        try:
+            return pd.StringDtype(*args, **kwargs)
+        except (TypeError, ValueError, ImportError):
+            continue
+    return None
+
+
+STRING_DTYPE = _arrow_string_dtype()
+
+
 class Cleaner:
     @staticmethod
-    def clean_chunk(df):
+    def clean_chunk(df, columns=None):
         """
-        Cleans a raw dataframe chunk.
+        Cleans a raw dataframe chunk in place, one column at a time: strips whitespace and
+        turns the TSE sentinels into nulls in a single pass over each column.
+        columns limits the work to the projected columns (default: every column).
+        Object columns become arrow-backed strings, so strip/isin run in pyarrow
+        instead of per Python object.
         """
-        # Strip whitespaces from string columns
-        for col in df.select_dtypes(['object']).columns:
-            df[col] = df[col].str.strip()
-            
-        # Handle special values if any
-        # e.g., #NULO# -> None
-        df.replace('#NULO#', None, inplace=True)
-        
+        for col in (df.columns if columns is None else [c for c in columns if c in df.columns]):
+            values = df[col]
+            negative_one = col in NEGATIVE_ONE_NULL_COLUMNS
+
+            if pd.api.types.is_numeric_dtype(values):
+                if negative_one and (values == -1).any():
+                    df[col] = values.mask(values == -1)
+                continue
+
+            if values.dtype == object and STRING_DTYPE is not None:
+                values = values.astype(STRING_DTYPE)
+            values = values.str.strip()
+
+            nulls = values.isin(NULL_SENTINELS + ['-1'] if negative_one else NULL_SENTINELS)
+            if nulls.any():
+                values = values.mask(nulls)
+            df[col] = values
+
         return df
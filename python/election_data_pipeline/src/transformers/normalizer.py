@@ -1,33 +1,289 @@
+import numpy as np
 import pandas as pd
 import logging
+import random
+import time
 from datetime import datetime
 from config.settings import settings
-from src.loaders.mysql_loader import MySQLLoader
-from sqlalchemy import text
+from src.loaders.mysql_loader import MySQLLoader, is_retryable_db_error
+from src.utils.id_cache import CompactIdCache
+from sqlalchemy import text, select, tuple_, bindparam, table as sql_table, column as sql_column
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import SQLAlchemyError
 
 logger = logging.getLogger(__name__)
 
+# Keys per multi-row INSERT / IN (...) lookup when resolving dimension ids
+RESOLVE_BATCH_SIZE = 1000
+
+# candidatos_detalhes columns copied from the consulta_cand CSV: (target, source, kind)
+CANDIDATOS_DETALHES_COLUMNS = [
+    ('sq_candidato', 'SQ_CANDIDATO', 'text'),
+    ('nr_candidato', 'NR_CANDIDATO', 'text'),
+    ('nm_candidato', 'NM_CANDIDATO', 'text'),
+    ('nm_urna_candidato', 'NM_URNA_CANDIDATO', 'text'),
+    ('nm_social_candidato', 'NM_SOCIAL_CANDIDATO', 'text'),
+    ('nr_cpf_candidato', 'NR_CPF_CANDIDATO', 'text'),
+    ('ds_email', 'DS_EMAIL', 'text'),
+    ('cd_situacao_candidatura', 'CD_SITUACAO_CANDIDATURA', 'int'),
+    ('ds_situacao_candidatura', 'DS_SITUACAO_CANDIDATURA', 'text'),
+    ('tp_agremiacao', 'TP_AGREMIACAO', 'text'),
+    ('nr_partido', 'NR_PARTIDO', 'text'),
+    ('sg_partido', 'SG_PARTIDO', 'text'),
+    ('nm_partido', 'NM_PARTIDO', 'text'),
+    ('nr_federacao', 'NR_FEDERACAO', 'text'),
+    ('nm_federacao', 'NM_FEDERACAO', 'text'),
+    ('sg_federacao', 'SG_FEDERACAO', 'text'),
+    ('ds_composicao_federacao', 'DS_COMPOSICAO_FEDERACAO', 'text'),
+    ('sq_coligacao', 'SQ_COLIGACAO', 'text'),
+    ('nm_coligacao', 'NM_COLIGACAO', 'text'),
+    ('ds_composicao_coligacao', 'DS_COMPOSICAO_COLIGACAO', 'text'),
+    ('sg_uf_nascimento', 'SG_UF_NASCIMENTO', 'text'),
+    ('dt_nascimento', 'DT_NASCIMENTO', 'date'),
+    ('nr_titulo_eleitoral_candidato', 'NR_TITULO_ELEITORAL_CANDIDATO', 'text'),
+    ('cd_genero', 'CD_GENERO', 'int'),
+    ('ds_genero', 'DS_GENERO', 'text'),
+    ('cd_grau_instrucao', 'CD_GRAU_INSTRUCAO', 'int'),
+    ('ds_grau_instrucao', 'DS_GRAU_INSTRUCAO', 'text'),
+    ('cd_estado_civil', 'CD_ESTADO_CIVIL', 'int'),
+    ('ds_estado_civil', 'DS_ESTADO_CIVIL', 'text'),
+    ('cd_cor_raca', 'CD_COR_RACA', 'int'),
+    ('ds_cor_raca', 'DS_COR_RACA', 'text'),
+    ('cd_ocupacao', 'CD_OCUPACAO', 'int'),
+    ('ds_ocupacao', 'DS_OCUPACAO', 'text'),
+    ('cd_sit_tot_turno', 'CD_SIT_TOT_TURNO', 'int'),
+    ('ds_sit_tot_turno', 'DS_SIT_TOT_TURNO', 'text'),
+]
+
+# Columns read by get_or_create_eleicao from the first row of each CD_ELEICAO group
+ELEICAO_COLUMNS = ['CD_ELEICAO', 'DS_ELEICAO', 'DT_PLEITO', 'DT_ELEICAO', 'DT_GERACAO']
+
 class Transformer:
+    # Columns each process_*_chunk consumes, per FileParser type. The extractor reads only
+    # these (about a third of the 45 bweb columns); keep in sync when a new column is used.
+    COLUMNS_BY_TYPE = {
+        'bweb': ELEICAO_COLUMNS + [
+            'SG_UF', 'CD_MUNICIPIO', 'NM_MUNICIPIO', 'NR_ZONA', 'NR_SECAO', 'NR_LOCAL_VOTACAO',
+            'CD_CARGO_PERGUNTA', 'DS_CARGO_PERGUNTA', 'NR_PARTIDO', 'SG_PARTIDO', 'NM_PARTIDO',
+            'NR_VOTAVEL', 'NM_VOTAVEL', 'QT_VOTOS', 'QT_APTOS', 'QT_COMPARECIMENTO', 'QT_ABSTENCOES',
+        ],
+        'vagas': ELEICAO_COLUMNS + [
+            'SG_UF', 'SG_UE', 'NM_UE', 'CD_CARGO', 'DS_CARGO', 'QT_VAGA',
+        ],
+        'candidatos': ELEICAO_COLUMNS + [
+            'SG_UF', 'SG_UE', 'NM_UE', 'CD_CARGO', 'DS_CARGO', 'NR_PARTIDO', 'SG_PARTIDO', 'NM_PARTIDO',
+            'SQ_CANDIDATO', 'NR_CANDIDATO', 'NM_CANDIDATO', 'NM_URNA_CANDIDATO', 'NM_SOCIAL_CANDIDATO',
+            'NR_CPF_CANDIDATO', 'DS_EMAIL', 'CD_SITUACAO_CANDIDATURA', 'DS_SITUACAO_CANDIDATURA',
+            'TP_AGREMIACAO', 'NR_FEDERACAO', 'NM_FEDERACAO', 'SG_FEDERACAO', 'DS_COMPOSICAO_FEDERACAO',
+            'SQ_COLIGACAO', 'NM_COLIGACAO', 'DS_COMPOSICAO_COLIGACAO', 'SG_UF_NASCIMENTO', 'DT_NASCIMENTO',
+            'NR_TITULO_ELEITORAL_CANDIDATO', 'CD_GENERO', 'DS_GENERO', 'CD_GRAU_INSTRUCAO',
+            'DS_GRAU_INSTRUCAO', 'CD_ESTADO_CIVIL', 'DS_ESTADO_CIVIL', 'CD_COR_RACA', 'DS_COR_RACA',
+            'CD_OCUPACAO', 'DS_OCUPACAO', 'CD_SIT_TOT_TURNO', 'DS_SIT_TOT_TURNO',
+        ],
+    }
+
+    @classmethod
+    def columns_for(cls, file_type):
+        """Column projection for a file type; None (all columns) for unknown types."""
+        return cls.COLUMNS_BY_TYPE.get(file_type)
+
     def __init__(self, loader: MySQLLoader):
         self.loader = loader
+        # cache name -> {'hits', 'misses'} per-row lookups of compact caches already
+        # dropped by reset_caches, so dimension_stats keeps adding up over a whole run
+        self.lookup_counts = {}
+        self.reset_caches()
+        # statement/commit counts of the last process_chunk (one unit of work)
+        self.last_chunk_stats = None
+        # eleicao_ids that received votos_secao rows (their consolidados need a rebuild)
+        self.eleicoes_carregadas = set()
+        # table -> {'hits', 'misses'} of the dimension resolvers (distinct keys per chunk);
+        # kept across reset_caches so they add up over a whole run
+        self.resolve_counts = {}
+
+    def reset_caches(self):
+        """
+        Empties every id cache. Used after a rolled-back unit of work, whose newly
+        inserted dimension ids were cached but never committed.
+        """
+        if hasattr(self, 'cache_secoes'):
+            for cache in (self.cache_secoes, self.cache_candidatos):
+                counts = self.lookup_counts.setdefault(cache.name, {'hits': 0, 'misses': 0})
+                counts['hits'] += cache.hits
+                counts['misses'] += cache.misses
         # Caches to avoid repeated DB lookups
         self.cache_estados = {} # sigla -> id
         self.cache_municipios = {} # (estado_id, codigo_tse) -> id
         self.cache_zonas = {} # (municipio_id, nr_zona) -> id
-        self.cache_secoes = {} # (zona_id, nr_secao) -> id
+        # The two largest dimensions use packed-integer caches (see CompactIdCache)
+        self.cache_secoes = CompactIdCache(
+            [('int', 42), ('digits', 22)], max_size=settings.SECOES_CACHE_MAX_SIZE, name='secoes'
+        ) # (zona_id, nr_secao) -> id
         self.cache_partidos = {} # numero -> id
         self.cache_cargos = {} # codigo -> id
-        self.cache_candidatos = {} # (eleicao_id, cargo_id, nr_votavel) -> id
+        self.cache_candidatos = CompactIdCache(
+            [('int', 12), ('int', 22), ('int', 8), ('digits', 22)],
+            max_size=settings.CANDIDATOS_CACHE_MAX_SIZE, name='candidatos'
+        ) # (eleicao_id, municipio_id, cargo_id, nr_votavel) -> id
         self.cache_eleicoes = {} # (ano, turno, cd_eleicao) -> id
+        # id(cache) -> (len(cache), pandas Series view) used by the vectorized lookups
+        self._cache_views = {}
+
+    def preload(self, ufs, anos):
+        """
+        Warm-starts the caches from the dimension tables already in the database,
+        scoped to the UFs and years about to be processed. Small dimensions (estados,
+        cargos, partidos) are read whole. A file for 'BRASIL' widens the geographic scope
+        to every UF.
+        """
+        ufs = sorted({uf for uf in ufs if uf})
+        anos = sorted({int(ano) for ano in anos})
+        all_ufs = not ufs or 'BRASIL' in ufs
+        uf_filter = '' if all_ufs else 'AND e.sigla IN :ufs'
+
+        def rows(sql, **params):
+            stmt = text(sql)
+            expanding = [bindparam(name, expanding=True) for name in params if name in ('ufs', 'anos', 'eleicoes')]
+            if expanding:
+                stmt = stmt.bindparams(*expanding)
+            return self.loader.execute_query(stmt, params).fetchall()
+
+        uf_params = {} if all_ufs else {'ufs': ufs}
+
+        self.cache_estados.update((r[0], r[1]) for r in rows("SELECT sigla, id FROM estados"))
+        self.cache_cargos.update((r[0], r[1]) for r in rows("SELECT codigo, id FROM cargos"))
+        self.cache_partidos.update((r[0], r[1]) for r in rows("SELECT numero, id FROM partidos"))
+
+        eleicoes = []
+        if anos:
+            eleicoes = rows("SELECT ano, turno, cd_eleicao, id FROM eleicoes WHERE ano IN :anos", anos=anos)
+            self.cache_eleicoes.update(((r[0], r[1], r[2]), r[3]) for r in eleicoes)
+
+        self.cache_municipios.update(((r[0], r[1]), r[2]) for r in rows(f"""
+            SELECT m.estado_id, m.codigo_tse, m.id
+            FROM municipios m JOIN estados e ON e.id = m.estado_id
+            WHERE 1 = 1 {uf_filter}
+        """, **uf_params))
+
+        self.cache_zonas.update(((r[0], r[1]), r[2]) for r in rows(f"""
+            SELECT z.municipio_id, z.nr_zona, z.id
+            FROM zonas z
+            JOIN municipios m ON m.id = z.municipio_id
+            JOIN estados e ON e.id = m.estado_id
+            WHERE 1 = 1 {uf_filter}
+        """, **uf_params))
+
+        self.cache_secoes.update(((r[0], r[1]), r[2]) for r in rows(f"""
+            SELECT s.zona_id, s.nr_secao, s.id
+            FROM secoes s
+            JOIN zonas z ON z.id = s.zona_id
+            JOIN municipios m ON m.id = z.municipio_id
+            JOIN estados e ON e.id = m.estado_id
+            WHERE 1 = 1 {uf_filter}
+        """, **uf_params))
+
+        if eleicoes:
+            cand_uf_filter = '' if all_ufs else 'AND (e.sigla IN :ufs OR c.municipio_id IS NULL)'
+            self.cache_candidatos.update(((r[0], r[1], r[2], r[3]), r[4]) for r in rows(f"""
+                SELECT c.eleicao_id, c.municipio_id, c.cargo_id, c.nr_votavel, c.id
+                FROM candidatos c
+                LEFT JOIN municipios m ON m.id = c.municipio_id
+                LEFT JOIN estados e ON e.id = m.estado_id
+                WHERE c.eleicao_id IN :eleicoes {cand_uf_filter}
+            """, eleicoes=[r[3] for r in eleicoes], **uf_params))
+
+        logger.info(
+            f"Preload: {len(self.cache_eleicoes)} eleições, {len(self.cache_municipios)} municípios, "
+            f"{len(self.cache_zonas)} zonas, {len(self.cache_secoes)} seções, "
+            f"{len(self.cache_candidatos)} candidatos em cache"
+        )
+
+    def cache_stats(self):
+        """Hit/miss/size counters of the compact caches."""
+        return [self.cache_secoes.stats(), self.cache_candidatos.stats()]
+
+    def _count_resolve(self, table_name, hits, misses):
+        counts = self.resolve_counts.setdefault(table_name, {'hits': 0, 'misses': 0})
+        counts['hits'] += hits
+        counts['misses'] += misses
+
+    def dimension_stats(self):
+        """
+        Cache hits/misses per dimension: 'hits'/'misses' count the distinct keys the
+        resolvers found in / fetched for the caches; 'lookup_hits'/'lookup_misses' the
+        per-row lookups of the compact caches (secoes, candidatos) when loading facts.
+        """
+        stats = {table: dict(counts) for table, counts in self.resolve_counts.items()}
+        for cache in (self.cache_secoes, self.cache_candidatos):
+            entry = stats.setdefault(cache.name, {'hits': 0, 'misses': 0})
+            dropped = self.lookup_counts.get(cache.name, {'hits': 0, 'misses': 0})
+            entry['lookup_hits'] = dropped['hits'] + cache.hits
+            entry['lookup_misses'] = dropped['misses'] + cache.misses
+        return stats
+
+    # Table written by each file type and the DELETE of one eleições x UF slice of it
+    SLICE_DELETES = {
+        'bweb': ("votos_secao", """
+            DELETE t FROM votos_secao t
+            JOIN secoes s ON s.id = t.secao_id
+            JOIN zonas z ON z.id = s.zona_id
+            JOIN municipios m ON m.id = z.municipio_id
+            JOIN estados uf ON uf.id = m.estado_id
+            WHERE t.eleicao_id IN :eleicao_ids AND uf.sigla = :uf
+        """),
+        'vagas': ("vagas", """
+            DELETE t FROM vagas t
+            JOIN municipios m ON m.id = t.municipio_id
+            JOIN estados uf ON uf.id = m.estado_id
+            WHERE t.eleicao_id IN :eleicao_ids AND uf.sigla = :uf
+        """),
+        'candidatos': ("candidatos_detalhes", """
+            DELETE t FROM candidatos_detalhes t
+            JOIN municipios m ON m.id = t.municipio_id
+            JOIN estados uf ON uf.id = m.estado_id
+            WHERE t.eleicao_id IN :eleicao_ids AND uf.sigla = :uf
+        """),
+    }
+
+    def delete_file_slice(self, metadata):
+        """
+        Deletes the rows a file loaded before (its eleições of ano/turno, restricted to its UF),
+        so a file whose contents changed is reloaded without leftovers and without truncating
+        everything (truncate_all.sql). Rows not tied to a município (e.g. candidatos_detalhes
+        of state-wide offices, or the BRASIL file) are only overwritten by the reload's upserts.
+        Eleições whose votos_secao were deleted are queued for the votos_consolidados rebuild.
+        Returns the number of deleted rows.
+        """
+        if metadata.get('type') not in self.SLICE_DELETES:
+            return 0
+        table_name, sql = self.SLICE_DELETES[metadata['type']]
+        eleicao_ids = [r[0] for r in self.loader.execute_query(
+            text("SELECT id FROM eleicoes WHERE ano=:ano AND turno=:turno"),
+            {'ano': metadata['ano'], 'turno': metadata['turno']}
+        ).fetchall()]
+        if not eleicao_ids:
+            return 0
+
+        result = self.loader.execute_query(
+            text(sql).bindparams(bindparam('eleicao_ids', expanding=True)),
+            {'eleicao_ids': eleicao_ids, 'uf': metadata['uf']}
+        )
+        deleted = result.rowcount
+        logger.info(f"{table_name}: {deleted} linhas removidas (UF {metadata['uf']}, eleições {eleicao_ids})")
+        if metadata.get('type') == 'bweb':
+            self.eleicoes_carregadas.update(eleicao_ids)
+        return deleted
 
     def get_or_create_eleicao(self, metadata, row):
         key = (metadata['ano'], metadata['turno'], str(row['CD_ELEICAO']))
         if key in self.cache_eleicoes:
+            self._count_resolve('eleicoes', 1, 0)
             return self.cache_eleicoes[key]
+        self._count_resolve('eleicoes', 0, 1)
 
         query = text("SELECT id FROM eleicoes WHERE ano=:ano AND turno=:turno AND cd_eleicao=:cd_eleicao")
-        result = self.loader.execute_query(query, {'ano': metadata['ano'], 'turno': metadata['turno'], 'cd_eleicao': str(row['CD_ELEICAO'])})
-        row_db = result.first()
+        params = {'ano': metadata['ano'], 'turno': metadata['turno'], 'cd_eleicao': str(row['CD_ELEICAO'])}
+        row_db = self.loader.execute_query(query, params).first()
 
         if row_db:
             self.cache_eleicoes[key] = row_db[0]
@@ -58,9 +314,11 @@ class Transformer:
             except:
                 pass
 
+        # Upsert: a parallel worker may create the same eleição between the SELECT and here
         insert = text("""
             INSERT INTO eleicoes (ano, turno, tipo_eleicao, dt_pleito, ds_eleicao, cd_eleicao)
             VALUES (:ano, :turno, :tipo, :dt_pleito, :ds_eleicao, :cd_eleicao)
+            ON DUPLICATE KEY UPDATE id=id
         """)
 
         self.loader.execute_query(insert, {
@@ -72,15 +330,37 @@ class Transformer:
             'cd_eleicao': str(row['CD_ELEICAO'])
         })
 
-        return self.get_or_create_eleicao(metadata, row)
+        # read back the id (ours, or the one a parallel worker inserted first)
+        row_db = self.loader.execute_query(query, params).first()
+        self.cache_eleicoes[key] = row_db[0]
+        return row_db[0]
 
     def process_chunk(self, chunk, metadata):
         """
         Main method to process a chunk and load it into normalized tables.
+        The whole chunk is one unit of work: every dimension upsert and fact load shares
+        one connection and one commit. On deadlock / lock wait timeout the transaction is
+        rolled back by the server, so the caches are reset and the chunk is repeated.
         """
         if len(chunk) == 0:
             return
 
+        for attempt in range(1, settings.DB_MAX_RETRIES + 1):
+            try:
+                with self.loader.unit_of_work() as uow:
+                    self._process_chunk(chunk, metadata)
+                self.last_chunk_stats = uow.stats()
+                return
+            except Exception as e:
+                # ids cached during the failed transaction point to rows that no longer exist
+                self.reset_caches()
+                if not is_retryable_db_error(e) or attempt == settings.DB_MAX_RETRIES:
+                    raise
+                logger.warning(f"process_chunk: conflito de lock, repetindo o chunk (tentativa {attempt + 1}/{settings.DB_MAX_RETRIES})")
+                time.sleep(min(8, 0.2 * (2 ** (attempt - 1))) + random.uniform(0, 0.4))
+
+    def _process_chunk(self, chunk, metadata):
+
         if metadata.get('type') == 'vagas':
             self.process_vagas_chunk(chunk, metadata)
             return
@@ -95,39 +375,31 @@ class Transformer:
                 eleicao_id = self.get_or_create_eleicao(metadata, first_row)
 
                 # 1. Unique Municipios
-                municipios = group[['SG_UF', 'CD_MUNICIPIO', 'NM_MUNICIPIO']].drop_duplicates()
-                for _, row in municipios.iterrows():
-                    self.ensure_municipio(row)
+                self.resolve_municipios(group[['SG_UF', 'CD_MUNICIPIO', 'NM_MUNICIPIO']].drop_duplicates())
 
                 # 2. Unique Cargos
-                cargos = group[['CD_CARGO_PERGUNTA', 'DS_CARGO_PERGUNTA']].drop_duplicates()
-                for _, row in cargos.iterrows():
-                    self.ensure_cargo(row)
+                self.resolve_cargos(group[['CD_CARGO_PERGUNTA', 'DS_CARGO_PERGUNTA']].drop_duplicates())
 
                 # 3. Unique Partidos
-                partidos = group[['NR_PARTIDO', 'SG_PARTIDO', 'NM_PARTIDO']].drop_duplicates()
-                for _, row in partidos.iterrows():
-                    self.ensure_partido(row)
+                self.resolve_partidos(group[['NR_PARTIDO', 'SG_PARTIDO', 'NM_PARTIDO']].drop_duplicates())
 
                 # 4. Unique Candidatos (por município, pois NR_VOTAVEL se repete entre municípios para Prefeito)
                 candidatos = group[['CD_MUNICIPIO', 'CD_CARGO_PERGUNTA', 'NR_PARTIDO', 'NR_VOTAVEL', 'NM_VOTAVEL']].drop_duplicates()
-                for _, row in candidatos.iterrows():
-                    self.ensure_candidato(eleicao_id, row)
-
-                # 5. Insert Votos Consolidados (Aggregated by Muni, Cargo, Candidato)
-                agg_df = group.groupby(['CD_MUNICIPIO', 'CD_CARGO_PERGUNTA', 'NR_VOTAVEL']).agg({
-                    'QT_VOTOS': 'sum'
-                }).reset_index()
-                self.bulk_insert_consolidados(eleicao_id, agg_df, metadata['uf'])
+                self.resolve_candidatos(eleicao_id, candidatos)
 
-                # 6. Normalization of Zonas, Secoes
+                # 5. Normalization of Zonas, Secoes
                 secoes_df = group[['CD_MUNICIPIO', 'NR_ZONA', 'NR_SECAO', 'NR_LOCAL_VOTACAO', 'QT_APTOS', 'QT_COMPARECIMENTO', 'QT_ABSTENCOES']].drop_duplicates(['CD_MUNICIPIO', 'NR_ZONA', 'NR_SECAO'])
-                for _, row in secoes_df.iterrows():
-                    self.ensure_zona_secao(row, metadata['uf'])
+                self.resolve_zonas_secoes(secoes_df, metadata['uf'])
 
-                # 7. Bulk Insert Votos Secao
+                # 6. Bulk Insert Votos Secao
+                # (votos_consolidados is rebuilt from votos_secao after the load, see
+                # Aggregator.rebuild_votos_consolidados)
                 self.bulk_insert_votos_secao(eleicao_id, group, metadata['uf'])
+                self.eleicoes_carregadas.add(eleicao_id)
 
+            except SQLAlchemyError:
+                # the transaction of the unit of work is no longer usable: fail the whole chunk
+                raise
             except Exception as e:
                 logger.error(f"Erro ao processar grupo CD_ELEICAO={cd_eleicao}: {e}", exc_info=True)
                 # Continua para o próximo grupo sem interromper o chunk inteiro
@@ -143,24 +415,21 @@ class Transformer:
 
                 # 1. Ensure Municipios
                 # In vacancies CSV: SG_UF, SG_UE, NM_UE
-                for _, row in group[['SG_UF', 'SG_UE', 'NM_UE']].drop_duplicates().iterrows():
-                    self.ensure_municipio({
-                        'SG_UF': row['SG_UF'],
-                        'CD_MUNICIPIO': row['SG_UE'],
-                        'NM_MUNICIPIO': row['NM_UE']
-                    })
+                self.resolve_municipios(
+                    group[['SG_UF', 'SG_UE', 'NM_UE']].drop_duplicates(),
+                    cd_col='SG_UE', nm_col='NM_UE'
+                )
 
                 # 2. Ensure Cargos
                 # In vacancies CSV: CD_CARGO, DS_CARGO
-                for _, row in group[['CD_CARGO', 'DS_CARGO']].drop_duplicates().iterrows():
-                    self.ensure_cargo({
-                        'CD_CARGO_PERGUNTA': row['CD_CARGO'],
-                        'DS_CARGO_PERGUNTA': row['DS_CARGO']
-                    })
+                self.resolve_cargos(group[['CD_CARGO', 'DS_CARGO']].drop_duplicates(), cd_col='CD_CARGO', ds_col='DS_CARGO')
 
                 # 3. Bulk Insert Vagas
                 self.bulk_insert_vagas(eleicao_id, group)
 
+            except SQLAlchemyError:
+                # the transaction of the unit of work is no longer usable: fail the whole chunk
+                raise
             except Exception as e:
                 logger.error(f"Erro ao processar vagas para CD_ELEICAO={cd_eleicao}: {e}", exc_info=True)
 
@@ -175,103 +444,78 @@ class Transformer:
 
                 # 1. Ensure Municipios
                 # In candidates CSV: SG_UF, SG_UE, NM_UE
-                for _, row in group[['SG_UF', 'SG_UE', 'NM_UE']].drop_duplicates().iterrows():
-                    self.ensure_municipio({
-                        'SG_UF': row['SG_UF'],
-                        'CD_MUNICIPIO': row['SG_UE'],
-                        'NM_MUNICIPIO': row['NM_UE']
-                    })
+                self.resolve_municipios(
+                    group[['SG_UF', 'SG_UE', 'NM_UE']].drop_duplicates(),
+                    cd_col='SG_UE', nm_col='NM_UE'
+                )
 
                 # 2. Ensure Cargos
                 # In candidates CSV: CD_CARGO, DS_CARGO
-                for _, row in group[['CD_CARGO', 'DS_CARGO']].drop_duplicates().iterrows():
-                    self.ensure_cargo({
-                        'CD_CARGO_PERGUNTA': row['CD_CARGO'],
-                        'DS_CARGO_PERGUNTA': row['DS_CARGO']
-                    })
+                self.resolve_cargos(group[['CD_CARGO', 'DS_CARGO']].drop_duplicates(), cd_col='CD_CARGO', ds_col='DS_CARGO')
 
                 # 3. Ensure Partidos
                 # In candidates CSV: NR_PARTIDO, SG_PARTIDO, NM_PARTIDO
-                for _, row in group[['NR_PARTIDO', 'SG_PARTIDO', 'NM_PARTIDO']].drop_duplicates().iterrows():
-                    self.ensure_partido(row)
+                self.resolve_partidos(group[['NR_PARTIDO', 'SG_PARTIDO', 'NM_PARTIDO']].drop_duplicates())
 
                 # 4. Bulk Insert Candidatos Detalhes
                 self.bulk_insert_candidatos_detalhes(eleicao_id, group)
 
+            except SQLAlchemyError:
+                # the transaction of the unit of work is no longer usable: fail the whole chunk
+                raise
             except Exception as e:
                 logger.error(f"Erro ao processar candidatos para CD_ELEICAO={cd_eleicao}: {e}", exc_info=True)
 
     def bulk_insert_candidatos_detalhes(self, eleicao_id, group_df):
-        data = []
-        for _, row in group_df.iterrows():
-            uf = row['SG_UF']
-            estado_id = self.cache_estados.get(uf)
-            if not estado_id:
-                continue
-
-            cd_mun = str(row['SG_UE'])
-            mun_id = self.cache_municipios.get((estado_id, cd_mun))
-
-            cd_cargo = str(row['CD_CARGO'])
-            cargo_id = self.cache_cargos.get(cd_cargo)
-            if not cargo_id:
-                continue
-
-            nr_partido = str(row['NR_PARTIDO']).strip()
-            partido_id = self.cache_partidos.get(nr_partido)
-
-            dt_nasc = None
-            if pd.notna(row.get('DT_NASCIMENTO')):
-                try:
-                    dt_nasc = datetime.strptime(str(row['DT_NASCIMENTO']), '%d/%m/%Y').date()
-                except:
-                    pass
+        """
+        Column-wise build of the candidatos_detalhes rows: ids come from vectorized cache
+        lookups, DT_NASCIMENTO is parsed in one to_datetime call and the CD_* codes are cast
+        to nullable integers. Rows without a cached estado or cargo are skipped, as before,
+        and so are rows without SQ_CANDIDATO / NR_CANDIDATO (NOT NULL in the table; a NULL
+        would fail the whole chunk's upsert under strict mode).
+        """
+        df = group_df
+        estado_id = self._lookup_ids(self.cache_estados, df['SG_UF'])
+        mun_id = self._lookup_ids(self.cache_municipios, estado_id, df['SG_UE'].astype(str))
+        cargo_id = self._lookup_ids(self.cache_cargos, df['CD_CARGO'].astype(str))
+        partido_id = self._lookup_ids(self.cache_partidos, df['NR_PARTIDO'].astype(str).str.strip())
+
+        valid = pd.notna(estado_id) & pd.notna(cargo_id)
+        for required in ('SQ_CANDIDATO', 'NR_CANDIDATO'):
+            present = df[required].notna().to_numpy() if required in df.columns else np.zeros(len(df), dtype=bool)
+            missing = valid & ~present
+            if missing.any():
+                logger.warning(
+                    f"bulk_insert_candidatos_detalhes: {int(missing.sum())} linha(s) sem {required} ignorada(s) "
+                    f"(eleicao_id={eleicao_id})"
+                )
+            valid &= present
+        if not valid.any():
+            return
 
-            data.append({
-                'eleicao_id': eleicao_id,
-                'municipio_id': mun_id,
-                'cargo_id': cargo_id,
-                'partido_id': partido_id,
-                'sq_candidato': str(row['SQ_CANDIDATO']),
-                'nr_candidato': str(row['NR_CANDIDATO']),
-                'nm_candidato': row.get('NM_CANDIDATO'),
-                'nm_urna_candidato': row.get('NM_URNA_CANDIDATO'),
-                'nm_social_candidato': row.get('NM_SOCIAL_CANDIDATO'),
-                'nr_cpf_candidato': row.get('NR_CPF_CANDIDATO'),
-                'ds_email': row.get('DS_EMAIL'),
-                'cd_situacao_candidatura': int(row['CD_SITUACAO_CANDIDATURA']) if pd.notna(row.get('CD_SITUACAO_CANDIDATURA')) else None,
-                'ds_situacao_candidatura': row.get('DS_SITUACAO_CANDIDATURA'),
-                'tp_agremiacao': row.get('TP_AGREMIACAO'),
-                'nr_partido': str(row['NR_PARTIDO']),
-                'sg_partido': row.get('SG_PARTIDO'),
-                'nm_partido': row.get('NM_PARTIDO'),
-                'nr_federacao': str(row.get('NR_FEDERACAO')),
-                'nm_federacao': row.get('NM_FEDERACAO'),
-                'sg_federacao': row.get('SG_FEDERACAO'),
-                'ds_composicao_federacao': row.get('DS_COMPOSICAO_FEDERACAO'),
-                'sq_coligacao': str(row.get('SQ_COLIGACAO')),
-                'nm_coligacao': row.get('NM_COLIGACAO'),
-                'ds_composicao_coligacao': row.get('DS_COMPOSICAO_COLIGACAO'),
-                'sg_uf_nascimento': row.get('SG_UF_NASCIMENTO'),
-                'dt_nascimento': dt_nasc,
-                'nr_titulo_eleitoral_candidato': row.get('NR_TITULO_ELEITORAL_CANDIDATO'),
-                'cd_genero': int(row['CD_GENERO']) if pd.notna(row.get('CD_GENERO')) else None,
-                'ds_genero': row.get('DS_GENERO'),
-                'cd_grau_instrucao': int(row['CD_GRAU_INSTRUCAO']) if pd.notna(row.get('CD_GRAU_INSTRUCAO')) else None,
-                'ds_grau_instrucao': row.get('DS_GRAU_INSTRUCAO'),
-                'cd_estado_civil': int(row['CD_ESTADO_CIVIL']) if pd.notna(row.get('CD_ESTADO_CIVIL')) else None,
-                'ds_estado_civil': row.get('DS_ESTADO_CIVIL'),
-                'cd_cor_raca': int(row['CD_COR_RACA']) if pd.notna(row.get('CD_COR_RACA')) else None,
-                'ds_cor_raca': row.get('DS_COR_RACA'),
-                'cd_ocupacao': int(row['CD_OCUPACAO']) if pd.notna(row.get('CD_OCUPACAO')) else None,
-                'ds_ocupacao': row.get('DS_OCUPACAO'),
-                'cd_sit_tot_turno': int(row['CD_SIT_TOT_TURNO']) if pd.notna(row.get('CD_SIT_TOT_TURNO')) else None,
-                'ds_sit_tot_turno': row.get('DS_SIT_TOT_TURNO')
-            })
+        def column(name):
+            # absent columns become NULL, like row.get() did
+            if name in df.columns:
+                return df[name].to_numpy()[valid]
+            return pd.array([None] * int(valid.sum()), dtype=object)
+
+        data = {
+            'eleicao_id': eleicao_id,
+            'municipio_id': mun_id[valid],
+            'cargo_id': cargo_id[valid].astype('int64'),
+            'partido_id': partido_id[valid],
+        }
+        for target, source, kind in CANDIDATOS_DETALHES_COLUMNS:
+            if kind == 'int':
+                values = pd.to_numeric(pd.Series(column(source)), errors='coerce').astype('Int64').array
+            elif kind == 'date':
+                values = pd.to_datetime(pd.Series(column(source)), format='%d/%m/%Y', errors='coerce').dt.date
+                values = values.astype(object).where(values.notna(), None).to_numpy()
+            else:
+                values = column(source)
+            data[target] = values
 
-        if data:
-            df_insert = pd.DataFrame(data)
-            self.loader.load_df(df_insert, 'candidatos_detalhes')
+        self.loader.load_df(pd.DataFrame(data, index=range(int(valid.sum()))), 'candidatos_detalhes')
 
     def bulk_insert_vagas(self, eleicao_id, group_df):
         data = []
@@ -304,276 +548,342 @@ class Transformer:
             self.loader.load_df(df_insert, 'vagas')
 
     def ensure_zona_secao(self, row, uf):
+        self.resolve_zonas_secoes(pd.DataFrame([row]), uf)
+
+    def resolve_zonas_secoes(self, secoes_df, uf):
+        """
+        Batch get-or-create of zonas and then secoes for the distinct
+        (CD_MUNICIPIO, NR_ZONA, NR_SECAO) of a chunk.
+        """
         estado_id = self.cache_estados.get(uf)
-        if not estado_id:
+        if not estado_id or len(secoes_df) == 0:
             return
 
-        cd_mun = str(row['CD_MUNICIPIO'])
-        mun_id = self.cache_municipios.get((estado_id, cd_mun))
-        if not mun_id:
+        df = pd.DataFrame({
+            'cd_mun': secoes_df['CD_MUNICIPIO'].astype(str),
+            'nr_zona': secoes_df['NR_ZONA'].astype(str),
+            'nr_secao': secoes_df['NR_SECAO'].astype(str),
+            'nr_local': secoes_df['NR_LOCAL_VOTACAO'].astype(str) if 'NR_LOCAL_VOTACAO' in secoes_df else '',
+        })
+        df['mun_id'] = [self.cache_municipios.get((estado_id, cd)) for cd in df['cd_mun']]
+        df = df[df['mun_id'].notna()]
+        if len(df) == 0:
             return
-
-        nr_zona = str(row['NR_ZONA'])
-        if (mun_id, nr_zona) not in self.cache_zonas:
-            res = self.loader.execute_query(
-                text("SELECT id FROM zonas WHERE municipio_id=:mid AND nr_zona=:nr"),
-                {'mid': mun_id, 'nr': nr_zona}
-            ).first()
-            if res:
-                self.cache_zonas[(mun_id, nr_zona)] = res[0]
-            else:
-                self.loader.execute_query(
-                    text("INSERT INTO zonas (municipio_id, nr_zona) VALUES (:mid, :nr)"),
-                    {'mid': mun_id, 'nr': nr_zona}
-                )
-                self.cache_zonas[(mun_id, nr_zona)] = self.loader.execute_query(
-                    text("SELECT id FROM zonas WHERE municipio_id=:mid AND nr_zona=:nr"),
-                    {'mid': mun_id, 'nr': nr_zona}
-                ).first()[0]
-
-        zona_id = self.cache_zonas[(mun_id, nr_zona)]
-
-        nr_secao = str(row['NR_SECAO'])
-        if (zona_id, nr_secao) not in self.cache_secoes:
-            res = self.loader.execute_query(
-                text("SELECT id FROM secoes WHERE zona_id=:zid AND nr_secao=:nr"),
-                {'zid': zona_id, 'nr': nr_secao}
-            ).first()
-            if res:
-                self.cache_secoes[(zona_id, nr_secao)] = res[0]
-            else:
-                self.loader.execute_query(
-                    text("INSERT INTO secoes (zona_id, nr_secao, nr_local_votacao) VALUES (:zid, :nr, :loc)"),
-                    {'zid': zona_id, 'nr': nr_secao, 'loc': str(row.get('NR_LOCAL_VOTACAO', ''))}
-                )
-                self.cache_secoes[(zona_id, nr_secao)] = self.loader.execute_query(
-                    text("SELECT id FROM secoes WHERE zona_id=:zid AND nr_secao=:nr"),
-                    {'zid': zona_id, 'nr': nr_secao}
-                ).first()[0]
+        df['mun_id'] = df['mun_id'].astype('int64')
+
+        zonas = df[['mun_id', 'nr_zona']].drop_duplicates()
+        self._resolve_batch(
+            'zonas', ['municipio_id', 'nr_zona'],
+            {(int(m), z): {} for m, z in zip(zonas['mun_id'], zonas['nr_zona'])},
+            self.cache_zonas,
+        )
+
+        df['zona_id'] = [self.cache_zonas.get((int(m), z)) for m, z in zip(df['mun_id'], df['nr_zona'])]
+        df = df[df['zona_id'].notna()].drop_duplicates(['zona_id', 'nr_secao'])
+        self._resolve_batch(
+            'secoes', ['zona_id', 'nr_secao'],
+            {(int(zid), nr): {'nr_local_votacao': loc}
+             for zid, nr, loc in zip(df['zona_id'], df['nr_secao'], df['nr_local'])},
+            self.cache_secoes,
+        )
+
+    def _cache_view(self, cache):
+        """
+        Series view of an id cache (MultiIndex for tuple keys), for vectorized lookups.
+        Caches only grow, so the view is rebuilt only when the cache size changed.
+        """
+        cached = self._cache_views.get(id(cache))
+        if cached is not None and cached[0] == len(cache):
+            return cached[1]
+        keys = list(cache.keys())
+        if keys and isinstance(keys[0], tuple):
+            index = pd.MultiIndex.from_tuples(keys)
+        else:
+            index = pd.Index(keys, dtype=object)
+        view = pd.Series(list(cache.values()), index=index, dtype='Int64')
+        self._cache_views[id(cache)] = (len(cache), view)
+        return view
+
+    def _lookup_ids(self, cache, *key_columns):
+        """
+        Maps key columns (aligned Series/arrays, one per key part) to cached ids.
+        Returns an Int64 array with <NA> where the key is missing from the cache.
+        """
+        if isinstance(cache, CompactIdCache):
+            return cache.lookup_many(*key_columns)
+        view = self._cache_view(cache)
+        n = len(key_columns[0])
+        if len(view) == 0:
+            return pd.array([pd.NA] * n, dtype='Int64')
+        if len(key_columns) == 1:
+            index = pd.Index(key_columns[0], dtype=object)
+        else:
+            index = pd.MultiIndex.from_arrays([pd.Index(k, dtype=object) for k in key_columns])
+        return view.reindex(index).array
+
+    def _refetch_evicted(self, cache, table_name, key_cols, ids, *key_columns, nullable=()):
+        """
+        A bounded (LRU) compact cache may have evicted keys that exist in the database.
+        Re-reads the ids of the keys the lookup missed, one SELECT per batch, so fact rows
+        are not dropped for a cache miss. Keys with None in a column outside `nullable`
+        cannot exist and are not queried; None in a nullable column matches IS NULL.
+        Returns ids with the re-read ones filled in (and stored back in the cache).
+        """
+        if not cache.evictions:
+            return ids
+        missed = [i for i, value in enumerate(ids) if pd.isna(value)]
+        if not missed:
+            return ids
+
+        columns = [pd.Series(col).astype(object).to_numpy() for col in key_columns]
+        row_keys = {}
+        for i in missed:
+            key = tuple(None if pd.isna(col[i]) else col[i] for col in columns)
+            key = tuple(int(v) if isinstance(v, (int, np.integer)) else v for v in key)
+            if all(v is not None or c in nullable for v, c in zip(key, key_cols)):
+                row_keys[i] = key
+        if not row_keys:
+            return ids
+
+        # SQL tuple IN never matches NULL: keys are grouped by which parts are None
+        by_nulls = {}
+        for key in set(row_keys.values()):
+            by_nulls.setdefault(tuple(v is None for v in key), []).append(key)
+
+        tbl = sql_table(table_name, *(sql_column(c) for c in ['id', *key_cols]))
+        found = {}
+        for nulls, keys in by_nulls.items():
+            present = [c for c, is_null in zip(key_cols, nulls) if not is_null]
+            exprs = [tbl.c[c] for c in present]
+            stmt = select(tbl.c.id, *exprs).where(
+                *(tbl.c[c].is_(None) for c, is_null in zip(key_cols, nulls) if is_null)
+            )
+            for start in range(0, len(keys), RESOLVE_BATCH_SIZE):
+                batch = [tuple(v for v in k if v is not None) for k in keys[start:start + RESOLVE_BATCH_SIZE]]
+                for r in self.loader.execute_query(stmt.where(tuple_(*exprs).in_(batch))).fetchall():
+                    values = iter(r[1:])
+                    found[tuple(None if is_null else next(values) for is_null in nulls)] = r[0]
+        if not found:
+            return ids
+
+        cache.update(found.items())
+        ids = ids.copy()
+        for i, key in row_keys.items():
+            if key in found:
+                ids[i] = found[key]
+        logger.debug(f"{cache.name}: {len(found)} chave(s) relidas do banco após evicção do cache")
+        return ids
+
+    @staticmethod
+    def _count_column(df, col):
+        """QT_* column as int64 (0 where absent or null)."""
+        if col not in df:
+            return 0
+        return pd.to_numeric(df[col]).fillna(0).astype('int64').to_numpy()
 
     def bulk_insert_votos_secao(self, eleicao_id, group_df, uf):
-        data = []
         estado_id = self.cache_estados.get(uf)
         if not estado_id:
             return
 
-        skipped = 0
-        for _, row in group_df.iterrows():
-            cd_mun = str(row['CD_MUNICIPIO'])
-            mun_id = self.cache_municipios.get((estado_id, cd_mun))
-            if not mun_id:
-                skipped += 1
-                continue
-
-            nr_zona = str(row['NR_ZONA'])
-            zona_id = self.cache_zonas.get((mun_id, nr_zona))
-            if not zona_id:
-                skipped += 1
-                continue
-
-            nr_secao = str(row['NR_SECAO'])
-            secao_id = self.cache_secoes.get((zona_id, nr_secao))
-            if not secao_id:
-                skipped += 1
-                continue
-
-            cd_cargo = str(row['CD_CARGO_PERGUNTA'])
-            cargo_id = self.cache_cargos.get(cd_cargo)
-            if not cargo_id:
-                skipped += 1
-                continue
-
-            nr_votavel = str(row['NR_VOTAVEL'])
-            candidato_id = self.cache_candidatos.get((eleicao_id, mun_id, cargo_id, nr_votavel))
-            if not candidato_id:
-                skipped += 1
-                continue
-
-            data.append({
-                'eleicao_id': eleicao_id,
-                'secao_id': secao_id,
-                'cargo_id': cargo_id,
-                'candidato_id': candidato_id,
-                'qt_votos': int(row['QT_VOTOS']),
-                'qt_aptos': int(row['QT_APTOS']) if pd.notna(row.get('QT_APTOS')) else 0,
-                'qt_comparecimento': int(row['QT_COMPARECIMENTO']) if pd.notna(row.get('QT_COMPARECIMENTO')) else 0,
-                'qt_abstencoes': int(row['QT_ABSTENCOES']) if pd.notna(row.get('QT_ABSTENCOES')) else 0
-            })
-
+        n = len(group_df)
+        mun_id = self._lookup_ids(self.cache_municipios, [estado_id] * n, group_df['CD_MUNICIPIO'].astype(str))
+        zona_id = self._lookup_ids(self.cache_zonas, mun_id, group_df['NR_ZONA'].astype(str))
+        nr_secao = group_df['NR_SECAO'].astype(str)
+        secao_id = self._lookup_ids(self.cache_secoes, zona_id, nr_secao)
+        secao_id = self._refetch_evicted(
+            self.cache_secoes, 'secoes', ['zona_id', 'nr_secao'], secao_id, zona_id, nr_secao
+        )
+        cargo_id = self._lookup_ids(self.cache_cargos, group_df['CD_CARGO_PERGUNTA'].astype(str))
+        candidato_keys = ([eleicao_id] * n, mun_id, cargo_id, group_df['NR_VOTAVEL'].astype(str))
+        candidato_id = self._lookup_ids(self.cache_candidatos, *candidato_keys)
+        candidato_id = self._refetch_evicted(
+            self.cache_candidatos, 'candidatos', ['eleicao_id', 'municipio_id', 'cargo_id', 'nr_votavel'],
+            candidato_id, *candidato_keys, nullable=('municipio_id',)
+        )
+
+        valid = pd.notna(secao_id) & pd.notna(cargo_id) & pd.notna(candidato_id)
+        skipped = int(n - valid.sum())
         if skipped > 0:
             logger.warning(f"bulk_insert_votos_secao: {skipped} linhas ignoradas por falta de referência no cache (eleicao_id={eleicao_id}, uf={uf})")
 
-        if data:
-            df_insert = pd.DataFrame(data)
-            self.loader.load_df(df_insert, 'votos_secao')
-
-    def ensure_municipio(self, row):
-        uf = row['SG_UF']
-        if pd.isna(uf) if not isinstance(uf, str) else not uf:
-            logger.warning(f"ensure_municipio: SG_UF inválido para CD_MUNICIPIO={row.get('CD_MUNICIPIO')}")
+        if not valid.any():
             return
 
-        if uf not in self.cache_estados:
-            res = self.loader.execute_query(text("SELECT id FROM estados WHERE sigla=:sigla"), {'sigla': uf}).first()
-            if res:
-                self.cache_estados[uf] = res[0]
-            else:
-                self.loader.execute_query(text("INSERT INTO estados (sigla) VALUES (:sigla)"), {'sigla': uf})
-                self.cache_estados[uf] = self.loader.execute_query(
-                    text("SELECT id FROM estados WHERE sigla=:sigla"), {'sigla': uf}
-                ).first()[0]
-
-        estado_id = self.cache_estados[uf]
-        cd_mun = str(row['CD_MUNICIPIO'])
-
-        if (estado_id, cd_mun) not in self.cache_municipios:
-            res = self.loader.execute_query(
-                text("SELECT id FROM municipios WHERE estado_id=:eid AND codigo_tse=:cd"),
-                {'eid': estado_id, 'cd': cd_mun}
-            ).first()
-            if res:
-                self.cache_municipios[(estado_id, cd_mun)] = res[0]
-            else:
-                self.loader.execute_query(
-                    text("INSERT INTO municipios (estado_id, codigo_tse, nome) VALUES (:eid, :cd, :nm)"),
-                    {'eid': estado_id, 'cd': cd_mun, 'nm': row['NM_MUNICIPIO']}
-                )
-                self.cache_municipios[(estado_id, cd_mun)] = self.loader.execute_query(
-                    text("SELECT id FROM municipios WHERE estado_id=:eid AND codigo_tse=:cd"),
-                    {'eid': estado_id, 'cd': cd_mun}
-                ).first()[0]
+        rows = group_df[valid]
+        df_insert = pd.DataFrame({
+            'eleicao_id': eleicao_id,
+            'secao_id': secao_id[valid].astype('int64'),
+            'cargo_id': cargo_id[valid].astype('int64'),
+            'candidato_id': candidato_id[valid].astype('int64'),
+            'qt_votos': pd.to_numeric(rows['QT_VOTOS']).astype('int64').to_numpy(),
+            'qt_aptos': self._count_column(rows, 'QT_APTOS'),
+            'qt_comparecimento': self._count_column(rows, 'QT_COMPARECIMENTO'),
+            'qt_abstencoes': self._count_column(rows, 'QT_ABSTENCOES'),
+        })
+        self.loader.load_df(df_insert, 'votos_secao')
 
-    def ensure_cargo(self, row):
-        cd = str(row['CD_CARGO_PERGUNTA'])
-        if not cd or cd == 'None':
+    def _resolve_batch(self, table_name, key_cols, records, cache, scalar_key=False):
+        """
+        Set-based get-or-create for a dimension table.
+        records maps each key tuple (values of key_cols, in order) to the extra columns
+        written when the key is new. Keys missing from cache are upserted with a single
+        multi-row INSERT ... ON DUPLICATE KEY UPDATE and their ids are read back in one
+        SELECT per batch. With scalar_key the cache is keyed by the single key value.
+        """
+        to_cache_key = (lambda k: k[0]) if scalar_key else (lambda k: k)
+        # Sorted so concurrent workers take the unique-key locks in the same order (fewer deadlocks)
+        missing = sorted((k for k in records if to_cache_key(k) not in cache), key=str)
+        self._count_resolve(table_name, len(records) - len(missing), len(missing))
+        if not missing:
             return
 
-        if cd not in self.cache_cargos:
-            res = self.loader.execute_query(text("SELECT id FROM cargos WHERE codigo=:cd"), {'cd': cd}).first()
-            if res:
-                self.cache_cargos[cd] = res[0]
-            else:
-                self.loader.execute_query(
-                    text("INSERT INTO cargos (codigo, descricao) VALUES (:cd, :ds)"),
-                    {'cd': cd, 'ds': row['DS_CARGO_PERGUNTA']}
-                )
-                self.cache_cargos[cd] = self.loader.execute_query(
-                    text("SELECT id FROM cargos WHERE codigo=:cd"), {'cd': cd}
-                ).first()[0]
-
-    def ensure_partido(self, row):
-        nr_raw = row['NR_PARTIDO']
-        # Trata None/NaN que vem do cleaner (converte #NULO# → None)
-        if nr_raw is None or (not isinstance(nr_raw, str) and pd.isna(nr_raw)):
-            return
-        nr = str(nr_raw).strip()
-        if nr in ('-1', '#NULO#', 'None', ''):
+        extra_cols = sorted({c for k in missing for c in records[k]})
+        tbl = sql_table(table_name, *(sql_column(c) for c in ['id', *key_cols, *extra_cols]))
+        key_exprs = [tbl.c[c] for c in key_cols]
+
+        for start in range(0, len(missing), RESOLVE_BATCH_SIZE):
+            batch = missing[start:start + RESOLVE_BATCH_SIZE]
+            rows = [{**dict(zip(key_cols, k)), **{c: records[k].get(c) for c in extra_cols}} for k in batch]
+            stmt = mysql_insert(tbl).values(rows)
+            self.loader.execute_query(stmt.on_duplicate_key_update(id=tbl.c.id))
+
+            result = self.loader.execute_query(
+                select(tbl.c.id, *key_exprs).where(tuple_(*key_exprs).in_(batch))
+            ).fetchall()
+            cache.update((to_cache_key(tuple(r[1:])), r[0]) for r in result)
+
+    def resolve_estados(self, siglas):
+        self._resolve_batch(
+            'estados', ['sigla'], {(uf,): {} for uf in siglas}, self.cache_estados, scalar_key=True
+        )
+
+    def resolve_municipios(self, df, uf_col='SG_UF', cd_col='CD_MUNICIPIO', nm_col='NM_MUNICIPIO'):
+        """Batch get-or-create of estados and municipios for the distinct municipios of a chunk."""
+        ufs = df[uf_col]
+        valid = ufs.notna() & (ufs.astype(str) != '')
+        if not valid.all():
+            logger.warning(f"resolve_municipios: {int((~valid).sum())} linha(s) com SG_UF inválido ignorada(s)")
+        df = df[valid]
+        if len(df) == 0:
             return
 
-        if nr not in self.cache_partidos:
-            res = self.loader.execute_query(text("SELECT id FROM partidos WHERE numero=:nr"), {'nr': nr}).first()
-            if res:
-                self.cache_partidos[nr] = res[0]
-            else:
-                self.loader.execute_query(
-                    text("INSERT INTO partidos (numero, sigla, nome) VALUES (:nr, :sg, :nm)"),
-                    {'nr': nr, 'sg': row['SG_PARTIDO'], 'nm': row['NM_PARTIDO']}
-                )
-                self.cache_partidos[nr] = self.loader.execute_query(
-                    text("SELECT id FROM partidos WHERE numero=:nr"), {'nr': nr}
-                ).first()[0]
+        self.resolve_estados(df[uf_col].unique())
 
-    def ensure_candidato(self, eleicao_id, row):
-        try:
-            cd_cargo_raw = row['CD_CARGO_PERGUNTA']
-            if cd_cargo_raw is None or (not isinstance(cd_cargo_raw, str) and pd.isna(cd_cargo_raw)):
-                logger.warning(f"ensure_candidato: CD_CARGO_PERGUNTA ausente para NR_VOTAVEL={row.get('NR_VOTAVEL')}")
-                return
+        codes = df[cd_col].astype(str)
+        names = df[nm_col].astype(object).where(df[nm_col].notna(), None)
+        records = {}
+        for uf, cd, nm in zip(df[uf_col], codes, names):
+            records.setdefault((self.cache_estados[uf], cd), {'nome': nm})
+        self._resolve_batch('municipios', ['estado_id', 'codigo_tse'], records, self.cache_municipios)
 
-            cargo_id = self.cache_cargos.get(str(cd_cargo_raw))
-            if not cargo_id:
-                logger.warning(f"ensure_candidato: cargo_id não encontrado no cache para CD_CARGO={cd_cargo_raw}, NR_VOTAVEL={row.get('NR_VOTAVEL')}")
-                return
+    def resolve_cargos(self, df, cd_col='CD_CARGO_PERGUNTA', ds_col='DS_CARGO_PERGUNTA'):
+        records = {}
+        for cd, ds in zip(df[cd_col].astype(str), df[ds_col]):
+            if cd and cd != 'None':
+                records.setdefault((cd,), {'descricao': ds})
+        self._resolve_batch('cargos', ['codigo'], records, self.cache_cargos, scalar_key=True)
 
-            # Resolver municipio_id (necessário para diferenciar candidatos a Prefeito entre municípios)
-            cd_mun = str(row['CD_MUNICIPIO'])
-            estado_ids = list(self.cache_estados.values())
-            municipio_id = None
-            for eid in estado_ids:
-                municipio_id = self.cache_municipios.get((eid, cd_mun))
+    def resolve_partidos(self, df):
+        nr = df['NR_PARTIDO']
+        # Trata None/NaN que vem do cleaner (converte #NULO# → None)
+        nr_str = nr.astype(str).str.strip()
+        valid = nr.notna() & ~nr_str.isin(['-1', '#NULO#', 'None', ''])
+        records = {}
+        for numero, sg, nm in zip(nr_str[valid], df.loc[valid, 'SG_PARTIDO'], df.loc[valid, 'NM_PARTIDO']):
+            records.setdefault((numero,), {'sigla': sg, 'nome': nm})
+        self._resolve_batch('partidos', ['numero'], records, self.cache_partidos, scalar_key=True)
+
+    def resolve_candidatos(self, eleicao_id, df):
+        """
+        Batch get-or-create of candidatos (eleicao, municipio, cargo, nr_votavel) for a chunk.
+        Candidatos without a resolved municipio (municipio_id NULL) are handled apart:
+        NULLs never collide on uk_candidato, so they are looked up before inserting.
+        """
+        cargo_raw = df['CD_CARGO_PERGUNTA']
+        missing_cargo = cargo_raw.isna()
+        if missing_cargo.any():
+            logger.warning(f"resolve_candidatos: {int(missing_cargo.sum())} linha(s) sem CD_CARGO_PERGUNTA")
+        df = df[~missing_cargo]
+
+        cargo_ids = [self.cache_cargos.get(str(cd)) for cd in df['CD_CARGO_PERGUNTA']]
+        no_cargo = sum(1 for c in cargo_ids if not c)
+        if no_cargo:
+            logger.warning(f"resolve_candidatos: {no_cargo} linha(s) com cargo fora do cache")
+
+        # Resolver municipio_id (necessário para diferenciar candidatos a Prefeito entre municípios)
+        mun_by_code = {}
+        for cd in df['CD_MUNICIPIO'].astype(str).unique():
+            for eid in self.cache_estados.values():
+                municipio_id = self.cache_municipios.get((eid, cd))
                 if municipio_id:
+                    mun_by_code[cd] = municipio_id
                     break
 
-            nr_partido_raw = row['NR_PARTIDO']
-            nr_partido = str(nr_partido_raw).strip() if nr_partido_raw is not None else 'None'
-            partido_id = self.cache_partidos.get(nr_partido)
-
-            nr_votavel = str(row['NR_VOTAVEL'])
-            key = (eleicao_id, municipio_id, cargo_id, nr_votavel)
-
-            if key not in self.cache_candidatos:
-                res = self.loader.execute_query(
-                    text("SELECT id FROM candidatos WHERE eleicao_id=:eid AND municipio_id=:mid AND cargo_id=:cid AND nr_votavel=:nr"),
-                    {'eid': eleicao_id, 'mid': municipio_id, 'cid': cargo_id, 'nr': nr_votavel}
-                ).first()
-                if res:
-                    self.cache_candidatos[key] = res[0]
-                else:
-                    self.loader.execute_query(
-                        text("INSERT INTO candidatos (eleicao_id, municipio_id, cargo_id, partido_id, nr_votavel, nome) VALUES (:eid, :mid, :cid, :pid, :nr, :nm)"),
-                        {'eid': eleicao_id, 'mid': municipio_id, 'cid': cargo_id, 'pid': partido_id, 'nr': nr_votavel, 'nm': row['NM_VOTAVEL']}
-                    )
-                    self.cache_candidatos[key] = self.loader.execute_query(
-                        text("SELECT id FROM candidatos WHERE eleicao_id=:eid AND municipio_id=:mid AND cargo_id=:cid AND nr_votavel=:nr"),
-                        {'eid': eleicao_id, 'mid': municipio_id, 'cid': cargo_id, 'nr': nr_votavel}
-                    ).first()[0]
-        except Exception as e:
-            logger.error(f"ensure_candidato: erro ao processar NR_VOTAVEL={row.get('NR_VOTAVEL')}, NM_VOTAVEL={row.get('NM_VOTAVEL')}: {e}", exc_info=True)
-
-    def bulk_insert_consolidados(self, eleicao_id, agg_df, uf_metadata):
-        data_to_insert = []
-
-        if uf_metadata not in self.cache_estados:
-            res = self.loader.execute_query(
-                text("SELECT id FROM estados WHERE sigla=:sigla"), {'sigla': uf_metadata}
-            ).first()
-            if res:
-                self.cache_estados[uf_metadata] = res[0]
-
-        estado_id = self.cache_estados.get(uf_metadata)
-        if not estado_id:
+        records = {}
+        sem_municipio = {}
+        for cd_mun, cargo_id, nr_partido, nr_votavel, nome in zip(
+            df['CD_MUNICIPIO'].astype(str), cargo_ids, df['NR_PARTIDO'],
+            df['NR_VOTAVEL'].astype(str), df['NM_VOTAVEL'],
+        ):
+            if not cargo_id:
+                continue
+            nr_partido = str(nr_partido).strip() if nr_partido is not None else 'None'
+            extra = {'partido_id': self.cache_partidos.get(nr_partido), 'nome': nome}
+            municipio_id = mun_by_code.get(cd_mun)
+            if municipio_id is None:
+                sem_municipio.setdefault((eleicao_id, cargo_id, nr_votavel), extra)
+            else:
+                records.setdefault((eleicao_id, municipio_id, cargo_id, nr_votavel), extra)
+
+        self._resolve_batch(
+            'candidatos', ['eleicao_id', 'municipio_id', 'cargo_id', 'nr_votavel'], records, self.cache_candidatos
+        )
+        if sem_municipio:
+            self._resolve_candidatos_sem_municipio(sem_municipio)
+
+    def _resolve_candidatos_sem_municipio(self, records):
+        missing = [k for k in records if (k[0], None, k[1], k[2]) not in self.cache_candidatos]
+        self._count_resolve('candidatos', len(records) - len(missing), len(missing))
+        if not missing:
             return
+        tbl = sql_table('candidatos', *(sql_column(c) for c in
+                        ['id', 'eleicao_id', 'municipio_id', 'cargo_id', 'partido_id', 'nr_votavel', 'nome']))
+        key_exprs = [tbl.c.eleicao_id, tbl.c.cargo_id, tbl.c.nr_votavel]
+
+        def fetch(keys):
+            result = self.loader.execute_query(
+                select(tbl.c.id, *key_exprs)
+                .where(tbl.c.municipio_id.is_(None))
+                .where(tuple_(*key_exprs).in_(keys))
+            ).fetchall()
+            self.cache_candidatos.update(((r[1], None, r[2], r[3]), r[0]) for r in result)
+
+        # uk_candidato does not protect NULL municipio_id: the lookup and the insert are
+        # serialized across parallel workers with a named lock
+        with self.loader.named_lock('candidatos_sem_municipio'):
+            for start in range(0, len(missing), RESOLVE_BATCH_SIZE):
+                batch = missing[start:start + RESOLVE_BATCH_SIZE]
+                fetch(batch)
+                new = [k for k in batch if (k[0], None, k[1], k[2]) not in self.cache_candidatos]
+                if new:
+                    self.loader.execute_query(mysql_insert(tbl).values([
+                        {'eleicao_id': e, 'municipio_id': None, 'cargo_id': c, 'nr_votavel': nr, **records[(e, c, nr)]}
+                        for e, c, nr in new
+                    ]))
+                    fetch(new)
 
-        skipped = 0
-        for _, row in agg_df.iterrows():
-            cd_mun = str(row['CD_MUNICIPIO'])
-            cd_cargo = str(row['CD_CARGO_PERGUNTA'])
-            nr_votavel = str(row['NR_VOTAVEL'])
+    def ensure_municipio(self, row):
+        self.resolve_municipios(pd.DataFrame([row]))
 
-            mun_id = self.cache_municipios.get((estado_id, cd_mun))
-            cargo_id = self.cache_cargos.get(cd_cargo)
-            candidato_id = self.cache_candidatos.get((eleicao_id, mun_id, cargo_id, nr_votavel))
-
-            if mun_id and cargo_id and candidato_id:
-                data_to_insert.append({
-                    'eleicao_id': eleicao_id,
-                    'municipio_id': mun_id,
-                    'cargo_id': cargo_id,
-                    'candidato_id': candidato_id,
-                    'total_votos': int(row['QT_VOTOS'])
-                })
-            else:
-                skipped += 1
-                logger.warning(
-                    f"bulk_insert_consolidados: linha ignorada — "
-                    f"CD_MUNICIPIO={cd_mun} (mun_id={mun_id}), "
-                    f"CD_CARGO={cd_cargo} (cargo_id={cargo_id}), "
-                    f"NR_VOTAVEL={nr_votavel} (candidato_id={candidato_id})"
-                )
+    def ensure_cargo(self, row):
+        self.resolve_cargos(pd.DataFrame([row]))
 
-        if skipped > 0:
-            logger.warning(f"bulk_insert_consolidados: total de {skipped} linhas ignoradas (eleicao_id={eleicao_id})")
+    def ensure_partido(self, row):
+        self.resolve_partidos(pd.DataFrame([row]))
 
-        if data_to_insert:
-            df_insert = pd.DataFrame(data_to_insert)
-            self.loader.load_df(df_insert, 'votos_consolidados')
+    def ensure_candidato(self, eleicao_id, row):
+        try:
+            self.resolve_candidatos(eleicao_id, pd.DataFrame([row]))
+        except Exception as e:
+            logger.error(f"ensure_candidato: erro ao processar NR_VOTAVEL={row.get('NR_VOTAVEL')}, NM_VOTAVEL={row.get('NM_VOTAVEL')}: {e}", exc_info=True)
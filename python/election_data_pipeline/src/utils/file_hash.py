@@ -0,0 +1,81 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:  # optional dependency: without it content digests use BLAKE2b
+    HAS_XXHASH = False
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Algorithm of new content digests; stored digests carry their own ('algoritmo:hex')
+CONTENT_HASH_ALGORITHM = 'xxh3_128' if HAS_XXHASH else 'blake2b'
+
+# Background hashing threads (created on first use, so never inherited by worker processes)
+_executor = None
+
+
+def _new_hash(algorithm):
+    if algorithm == 'xxh3_128' and HAS_XXHASH:
+        return xxhash.xxh3_128()
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=16)
+    return None
+
+
+def content_digest(file_path, algorithm=CONTENT_HASH_ALGORITHM, block_size=HASH_BLOCK_SIZE):
+    """
+    Streaming digest tagged with its algorithm, e.g. 'xxh3_128:9f0c...'.
+    Returns None when the algorithm is not available here.
+    """
+    h = _new_hash(algorithm)
+    if h is None:
+        return None
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return f"{algorithm}:{h.hexdigest()}"
+
+
+def _hash_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='file-hash')
+    return _executor
+
+
+class FileFingerprint:
+    """
+    Size, mtime and content digest of a file. The digest is computed in a background
+    thread (hashing releases the GIL), started by start() so it overlaps with parsing;
+    digest() waits for it.
+    """
+
+    def __init__(self, file_path):
+        self.path = file_path
+        stat = os.stat(file_path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self._future = None
+
+    def start(self):
+        if self._future is None:
+            self._future = _hash_executor().submit(content_digest, self.path)
+        return self
+
+    def digest(self):
+        return self.start()._future.result()
+
+    def same_stat(self, size, mtime):
+        return size == self.size and mtime == self.mtime
+
+    def matches(self, stored_digest):
+        """Whether the contents equal a stored digest (rehashing if it used another algorithm)."""
+        if not stored_digest:
+            return False
+        algorithm = stored_digest.split(':', 1)[0]
+        if algorithm == CONTENT_HASH_ALGORITHM:
+            return self.digest() == stored_digest
+        return content_digest(self.path, algorithm) == stored_digest
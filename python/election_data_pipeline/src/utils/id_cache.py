@@ -0,0 +1,250 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Pending inserts merged into the sorted arrays once this many accumulate
+MERGE_THRESHOLD = 65536
+
+
+class CompactIdCache:
+    """
+    Memory-compact replacement for a dict of composite keys -> database id.
+
+    Each key tuple is packed into one 64-bit integer following `fields`, a list of
+    (kind, bits) per key part:
+      - 'int':    non-negative integer ids; stored as value + 1 so None packs to 0;
+      - 'digits': digit strings (NR_SECAO, NR_VOTAVEL); packed as int('1' + s) so
+                  leading zeros survive ('0012' != '12').
+    Keys that do not fit (non-digit strings, values wider than their field) go to a
+    small overflow dict, so lookup semantics are exactly those of the original dict.
+
+    Unbounded caches keep packed keys in sorted numpy arrays (16 bytes per entry)
+    plus a small pending dict for recent inserts. With max_size, entries live in an
+    LRU OrderedDict of packed keys and the least recently used are evicted.
+    """
+
+    def __init__(self, fields, max_size=None, name=''):
+        self.fields = list(fields)
+        if sum(bits for _, bits in self.fields) > 64:
+            raise ValueError(f"{name}: key fields need more than 64 bits")
+        self.name = name
+        self.max_size = max_size
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._vals = np.empty(0, dtype=np.int64)
+        self._pending = {}
+        self._lru = OrderedDict() if max_size else None
+        self._overflow = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- key packing -------------------------------------------------------
+
+    def _pack(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) != len(self.fields):
+            return None
+        packed = 0
+        for value, (kind, bits) in zip(key, self.fields):
+            if kind == 'int':
+                if value is None:
+                    part = 0
+                elif isinstance(value, (int, np.integer)) and not isinstance(value, bool) and value >= 0:
+                    part = int(value) + 1
+                else:
+                    return None
+            else:
+                if not isinstance(value, str) or not value.isdigit() or not value.isascii():
+                    return None
+                part = int('1' + value)
+            if part >= 1 << bits:
+                return None
+            packed = (packed << bits) | part
+        return packed
+
+    def _unpack(self, packed):
+        parts = []
+        for kind, bits in reversed(self.fields):
+            part = packed & ((1 << bits) - 1)
+            packed >>= bits
+            if kind == 'int':
+                parts.append(None if part == 0 else part - 1)
+            else:
+                parts.append(str(part)[1:])
+        parts.reverse()
+        return tuple(parts) if len(parts) > 1 else parts[0]
+
+    # --- storage -----------------------------------------------------------
+
+    def _merge_pending(self):
+        if not self._pending:
+            return
+        new_keys = np.fromiter(self._pending.keys(), dtype=np.uint64, count=len(self._pending))
+        new_vals = np.fromiter(self._pending.values(), dtype=np.int64, count=len(self._pending))
+        keys = np.concatenate([self._keys, new_keys])
+        vals = np.concatenate([self._vals, new_vals])
+        order = np.argsort(keys, kind='stable')
+        keys, vals = keys[order], vals[order]
+        # a pending value replaces an older one for the same key (stable sort keeps it last)
+        last = np.append(keys[1:] != keys[:-1], True)
+        self._keys, self._vals = keys[last], vals[last]
+        self._pending = {}
+
+    def _find(self, packed):
+        if self._lru is not None:
+            value = self._lru.get(packed)
+            if value is not None:
+                self._lru.move_to_end(packed)
+            return value
+        value = self._pending.get(packed)
+        if value is not None:
+            return value
+        i = np.searchsorted(self._keys, np.uint64(packed))
+        if i < len(self._keys) and self._keys[i] == packed:
+            return int(self._vals[i])
+        return None
+
+    def _store(self, packed, value):
+        if self._lru is not None:
+            self._lru[packed] = value
+            self._lru.move_to_end(packed)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+                self.evictions += 1
+            return
+        self._pending[packed] = value
+        if len(self._pending) >= MERGE_THRESHOLD:
+            self._merge_pending()
+
+    # --- dict interface ----------------------------------------------------
+
+    def get(self, key, default=None):
+        packed = self._pack(key)
+        value = self._overflow.get(key) if packed is None else self._find(packed)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        packed = self._pack(key)
+        if packed is None:
+            self._overflow[key] = int(value)
+        else:
+            self._store(packed, int(value))
+
+    def update(self, items):
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            self[key] = value
+
+    def __len__(self):
+        if self._lru is not None:
+            return len(self._lru) + len(self._overflow)
+        self._merge_pending()
+        return len(self._keys) + len(self._overflow)
+
+    def items(self):
+        if self._lru is not None:
+            packed_items = list(self._lru.items())
+        else:
+            self._merge_pending()
+            packed_items = zip(self._keys.tolist(), self._vals.tolist())
+        for packed, value in packed_items:
+            yield self._unpack(packed), value
+        yield from self._overflow.items()
+
+    def keys(self):
+        return (k for k, _ in self.items())
+
+    def values(self):
+        return (v for _, v in self.items())
+
+    def __iter__(self):
+        return self.keys()
+
+    # --- vectorized lookup -------------------------------------------------
+
+    def _pack_columns(self, key_columns):
+        """Packs aligned key columns; returns (packed uint64 array, mask of packable rows)."""
+        n = len(key_columns[0])
+        packed = np.zeros(n, dtype=np.uint64)
+        ok = np.ones(n, dtype=bool)
+        for column, (kind, bits) in zip(key_columns, self.fields):
+            if kind == 'int':
+                values = pd.array(column, dtype='Int64')
+                part = values.fillna(-1).to_numpy(dtype=np.int64) + 1
+                ok &= part >= 0
+            else:
+                s = pd.Series(column, dtype=object).astype(str)
+                digits = s.str.fullmatch(r'[0-9]+').to_numpy(dtype=bool) & (s.str.len().to_numpy() < 19)
+                part = np.zeros(n, dtype=np.int64)
+                part[digits] = pd.to_numeric('1' + s[digits]).to_numpy(dtype=np.int64)
+                ok &= digits
+            ok &= part < (1 << bits)
+            packed = (packed << np.uint64(bits)) | np.where(ok, part, 0).astype(np.uint64)
+        return packed, ok
+
+    def lookup_many(self, *key_columns):
+        """
+        Vectorized get over aligned key columns (one per key part).
+        Returns an Int64 array with <NA> for keys not in the cache.
+        """
+        n = len(key_columns[0])
+        if self._lru is not None or self._overflow:
+            columns = [[None if pd.isna(v) else v for v in col] for col in key_columns]
+        if self._lru is not None:
+            keys = list(zip(*columns)) if len(columns) > 1 else columns[0]
+            return pd.array([self.get(k) for k in keys], dtype='Int64')
+
+        self._merge_pending()
+        packed, ok = self._pack_columns(key_columns)
+        result = np.zeros(n, dtype=np.int64)
+        found = np.zeros(n, dtype=bool)
+        if len(self._keys):
+            pos = np.searchsorted(self._keys, packed)
+            pos_ok = pos < len(self._keys)
+            hit = ok & pos_ok
+            hit[hit] = self._keys[pos[hit]] == packed[hit]
+            result[hit] = self._vals[pos[hit]]
+            found |= hit
+        if self._overflow:
+            for i in np.flatnonzero(~ok):
+                key = tuple(col[i] for col in columns) if len(columns) > 1 else columns[0][i]
+                value = self._overflow.get(key)
+                if value is not None:
+                    result[i] = value
+                    found[i] = True
+        hits = int(found.sum())
+        self.hits += hits
+        self.misses += n - hits
+        return pd.arrays.IntegerArray(result, ~found)
+
+    def stats(self):
+        entries = len(self)
+        if self._lru is not None:
+            approx_bytes = entries * 100  # OrderedDict node + two small ints
+        else:
+            approx_bytes = self._keys.nbytes + self._vals.nbytes + len(self._overflow) * 200
+        return {
+            'name': self.name,
+            'size': entries,
+            'overflow': len(self._overflow),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'approx_bytes': approx_bytes,
+        }
@@ -0,0 +1,13 @@
+"""
+The Parquet cache is shared with the root importers and lives in the repository root
+(parquet_cache.py), so they stay standalone scripts. This module re-exports it for the pipeline.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from parquet_cache import *  # noqa: E402,F401,F403
+from parquet_cache import HAS_PYARROW, ensure_parquet, read_csv_chunks, read_parquet_chunks  # noqa: E402,F401
@@ -0,0 +1,118 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _diff(after, before):
+    """Counter deltas of two (possibly nested) snapshots."""
+    if isinstance(after, dict):
+        return {k: _diff(v, before.get(k, 0 if not isinstance(v, dict) else {})) for k, v in after.items()}
+    return after - before
+
+
+class FileProfiler:
+    """
+    Per-file instrumentation of run_pipeline.
+
+    Wall time is split per chunk into stages:
+      - extract:    waiting on the CSVExtractor generator (parsing);
+      - clean:      Cleaner.clean_chunk;
+      - dimensoes:  time inside MySQLLoader.execute_query (dimension lookups/upserts);
+      - load_df:    time inside MySQLLoader.load_df (fact inserts);
+      - transform:  the rest of Transformer.process_chunk (pandas work, cache lookups).
+    DB round trips, commits and the resolver hit/miss counters are taken as deltas of
+    the loader's / transformer's counters between the start and the end of the file.
+    """
+
+    def __init__(self, file_path, metadata, loader, transformer):
+        self.file_path = file_path
+        self.metadata = metadata
+        self.loader = loader
+        self.transformer = transformer
+        self.stages = {'extract': 0.0, 'clean': 0.0, 'dimensoes': 0.0, 'load_df': 0.0, 'transform': 0.0}
+        self.chunk_seconds = []
+        self.rows = 0
+        self._chunk_started = None
+        self._started = time.perf_counter()
+        self._loader_before = loader.metrics()
+        self._dims_before = transformer.dimension_stats()
+
+    def iterate(self, chunks):
+        """Wraps the extractor generator, timing each chunk's parse as 'extract'."""
+        iterator = iter(chunks)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            self._chunk_started = inicio
+            self.stages['extract'] += time.perf_counter() - inicio
+            yield chunk
+
+    @contextmanager
+    def stage(self, name):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - inicio
+
+    @contextmanager
+    def transform(self):
+        """Times process_chunk, attributing the loader's own time to dimensoes / load_df."""
+        before = self.loader.metrics()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - inicio
+            delta = _diff(self.loader.metrics(), before)
+            self.stages['dimensoes'] += delta['query_seconds']
+            self.stages['load_df'] += delta['load_seconds']
+            self.stages['transform'] += max(0.0, elapsed - delta['query_seconds'] - delta['load_seconds'])
+
+    def end_chunk(self, rows):
+        self.rows += rows
+        if self._chunk_started is not None:
+            self.chunk_seconds.append(time.perf_counter() - self._chunk_started)
+            self._chunk_started = None
+
+    def summary(self, status):
+        seconds = time.perf_counter() - self._started
+        latencies = np.array(self.chunk_seconds) * 1000 if self.chunk_seconds else np.zeros(1)
+        db = _diff(self.loader.metrics(), self._loader_before)
+        return {
+            'file': self.file_path,
+            'type': self.metadata.get('type'),
+            'uf': self.metadata.get('uf'),
+            'ano': self.metadata.get('ano'),
+            'status': status,
+            'rows': self.rows,
+            'chunks': len(self.chunk_seconds),
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(self.rows / seconds, 1) if seconds > 0 else None,
+            'stages_seconds': {k: round(v, 3) for k, v in self.stages.items()},
+            'chunk_latency_ms': {
+                'p50': round(float(np.percentile(latencies, 50)), 1),
+                'p95': round(float(np.percentile(latencies, 95)), 1),
+                'max': round(float(latencies.max()), 1),
+            },
+            'db': {k: round(v, 3) if isinstance(v, float) else v for k, v in db.items()},
+            'dimensions': _diff(self.transformer.dimension_stats(), self._dims_before),
+        }
+
+    def report(self, status, output_path=None):
+        """Logs the JSON summary and appends it to output_path (JSON lines) when given."""
+        summary = self.summary(status)
+        line = json.dumps(summary, ensure_ascii=False)
+        logger.info(f"Profile: {line}")
+        if output_path:
+            with open(output_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        return summary
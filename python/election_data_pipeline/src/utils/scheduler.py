@@ -0,0 +1,43 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Execution stages, in order, by FileParser type. A stage only starts once the previous
+# one finished, so the dimensions written by consulta_cand (municipios, cargos, partidos)
+# are in the database before any fact load looks them up.
+STAGES = [
+    ('dimensoes', ('candidatos',)),
+    ('fatos', ('bweb', 'vagas')),
+]
+
+
+def file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def plan_stages(files):
+    """
+    Groups discovered (file_path, metadata) pairs into STAGES.
+    Inside a stage files are ordered largest first: with several workers the long files
+    start early and the small ones fill the gaps at the end, shortening wall-clock time.
+    Files of an unknown type run in a last stage of their own.
+    """
+    by_type = {}
+    for file_path, metadata in files:
+        by_type.setdefault(metadata.get('type'), []).append((file_path, metadata))
+
+    plan = []
+    for name, types in STAGES:
+        stage_files = [f for t in types for f in by_type.pop(t, [])]
+        if stage_files:
+            plan.append((name, sorted(stage_files, key=lambda f: file_size(f[0]), reverse=True)))
+
+    leftover = [f for group in by_type.values() for f in group]
+    if leftover:
+        logger.warning(f"{len(leftover)} arquivo(s) de tipo desconhecido processados por último")
+        plan.append(('outros', sorted(leftover, key=lambda f: file_size(f[0]), reverse=True)))
+    return plan
@@ -73,7 +73,7 @@ logger.info(f"Encontrados {len(files)} arquivos CSV.")
 for file_path, metadata in files:
     logger.info(f"Processando {file_path} (Turno: {metadata['turno']}, UF: {metadata['uf']})")
 
-    file_id, already_processed = loader.register_file(file_path)
+    file_id, already_processed, _ = loader.register_file(file_path)
     if already_processed:
         logger.info(f"Pulando arquivo já processado: {file_path}")
         continue
@@ -102,7 +102,11 @@ CREATE TABLE arquivos_processados (
     hash_md5 VARCHAR(32),
     dt_processamento DATETIME DEFAULT CURRENT_TIMESTAMP,
     status VARCHAR(20), -- 'PROCESSADO', 'ERRO'
-    linhas INT
+    linhas INT,
+    tamanho BIGINT, -- bytes, junto com mtime evita recalcular o hash de arquivos inalterados
+    mtime DOUBLE,
+    hash_conteudo VARCHAR(80), -- 'algoritmo:hex' (xxh3_128 ou blake2b)
+    INDEX idx_arquivos_tamanho (tamanho)
 );
 
 -- Fato Principal: Votos por Seção
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# Pipeline modules are imported as in run_pipeline.py (src.…, config.…)
+PIPELINE = ROOT / "python" / "election_data_pipeline"
+if str(PIPELINE) not in sys.path:
+    sys.path.append(str(PIPELINE))
@@ -0,0 +1,147 @@
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import baixar_fotos_candidatos as fotos
+
+
+class FakeCDN:
+    """Servidor HTTP local no lugar do CDN do TSE: HEAD, ETag, Range e If-Range."""
+
+    def __init__(self) -> None:
+        self.arquivos: dict[str, bytes] = {}
+        self.requisicoes: list[tuple[str, str, str | None]] = []
+        # path -> bytes enviados antes de derrubar a conexão (uma vez)
+        self.cortes: dict[str, int] = {}
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_HEAD(self) -> None:
+                self._responder(corpo=False)
+
+            def do_GET(self) -> None:
+                self._responder(corpo=True)
+
+            def _responder(self, corpo: bool) -> None:
+                cdn.requisicoes.append((self.command, self.path, self.headers.get("Range")))
+                dados = cdn.arquivos.get(self.path)
+                if dados is None:
+                    self.send_error(404)
+                    return
+                etag = '"' + hashlib.md5(dados).hexdigest() + '"'
+                inicio = 0
+                intervalo = self.headers.get("Range")
+                if intervalo and self.headers.get("If-Range", etag) == etag:
+                    inicio = int(intervalo.split("=")[1].rstrip("-"))
+                    if inicio >= len(dados):
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {inicio}-{len(dados) - 1}/{len(dados)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(dados) - inicio))
+                self.send_header("ETag", etag)
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                if not corpo:
+                    return
+                corte = cdn.cortes.pop(self.path, None)
+                self.wfile.write(dados[inicio:corte] if corte is not None else dados[inicio:])
+                if corte is not None:
+                    self.close_connection = True
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def template(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/foto_cand{{ano}}_{{uf}}_div.zip"
+
+    def gets(self) -> list[tuple[str, str | None]]:
+        return [(path, intervalo) for metodo, path, intervalo in self.requisicoes if metodo == "GET"]
+
+
+class BaixarFotosTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cdn = FakeCDN()
+        self.cdn.thread.start()
+        self.addCleanup(self.cdn.server.server_close)
+        self.addCleanup(self.cdn.server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.destino = Path(tmp.name)
+        for uf in ("AC", "GO", "SP"):
+            self.cdn.arquivos[f"/foto_cand2024_{uf}_div.zip"] = uf.encode() * 300_000
+
+    def baixar(self, ufs=("AC", "GO", "SP"), **kwargs):
+        resultados = fotos.baixar_todos([2024], list(ufs), self.destino, workers=3,
+                                        template=self.cdn.template, bloco=64 * 1024, **kwargs)
+        return {r.uf: r for r in resultados}
+
+    def zip(self, uf: str) -> Path:
+        return self.destino / "2024" / f"foto_cand2024_{uf}_div.zip"
+
+    def test_downloads_every_archive_and_writes_metadata(self) -> None:
+        resultados = self.baixar()
+        self.assertEqual({r.status for r in resultados.values()}, {"baixado"})
+        for uf in ("AC", "GO", "SP"):
+            self.assertEqual(self.zip(uf).read_bytes(), uf.encode() * 300_000)
+            self.assertFalse(fotos.caminho_parcial(self.zip(uf)).exists())
+            meta = fotos.ler_meta(self.zip(uf))
+            self.assertTrue(meta["completo"])
+            self.assertEqual(meta["tamanho"], 600_000)
+
+    def test_rerun_only_fetches_changed_archives(self) -> None:
+        self.baixar()
+        self.cdn.requisicoes.clear()
+        self.cdn.arquivos["/foto_cand2024_GO_div.zip"] = b"novo" * 1000
+
+        resultados = self.baixar()
+
+        self.assertEqual(resultados["AC"].status, "pulado")
+        self.assertEqual(resultados["SP"].status, "pulado")
+        self.assertEqual(resultados["GO"].status, "baixado")
+        self.assertEqual(self.cdn.gets(), [("/foto_cand2024_GO_div.zip", None)])
+        self.assertEqual(self.zip("GO").read_bytes(), b"novo" * 1000)
+
+    def test_interrupted_download_resumes_with_range(self) -> None:
+        self.cdn.cortes["/foto_cand2024_GO_div.zip"] = 250_000
+
+        resultados = self.baixar(ufs=["GO"], tentativas=1)
+        self.assertEqual(resultados["GO"].status, "erro")
+        self.assertFalse(self.zip("GO").exists())
+        self.assertEqual(fotos.caminho_parcial(self.zip("GO")).stat().st_size, 250_000)
+
+        resultados = self.baixar(ufs=["GO"])
+        self.assertEqual(resultados["GO"].status, "baixado")
+        self.assertEqual(self.cdn.gets()[-1], ("/foto_cand2024_GO_div.zip", "bytes=250000-"))
+        self.assertEqual(self.zip("GO").read_bytes(), b"GO" * 300_000)
+
+    def test_partial_file_of_an_old_version_is_restarted(self) -> None:
+        self.cdn.cortes["/foto_cand2024_GO_div.zip"] = 250_000
+        self.baixar(ufs=["GO"], tentativas=1)
+        self.cdn.arquivos["/foto_cand2024_GO_div.zip"] = b"v2" * 200_000
+
+        resultados = self.baixar(ufs=["GO"])
+
+        self.assertEqual(resultados["GO"].status, "baixado")
+        self.assertEqual(self.cdn.gets()[-1], ("/foto_cand2024_GO_div.zip", None))
+        self.assertEqual(self.zip("GO").read_bytes(), b"v2" * 200_000)
+
+    def test_missing_archive_is_reported_without_leaving_files(self) -> None:
+        resultados = self.baixar(ufs=["RR"])
+        self.assertEqual(resultados["RR"].status, "erro")
+        self.assertEqual(resultados["RR"].mensagem, "HTTP 404")
+        self.assertEqual(list((self.destino / "2024").iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
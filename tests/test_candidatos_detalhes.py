@@ -0,0 +1,77 @@
+import unittest
+
+import pandas as pd
+
+from src.transformers.cleaner import Cleaner
+from src.transformers.normalizer import Transformer
+
+
+class CapturingLoader:
+    """Guarda os DataFrames passados a load_df (o Transformer só usa isso aqui)."""
+
+    def __init__(self):
+        self.loaded = {}
+
+    def load_df(self, df, table_name):
+        self.loaded.setdefault(table_name, []).append(df)
+
+
+def consulta_cand_chunk(**overrides):
+    data = {
+        'SG_UF': ['GO', 'GO', 'GO', 'GO'],
+        'SG_UE': ['100', '100', '100', '100'],
+        'CD_CARGO': ['11', '11', '13', '13'],
+        'NR_PARTIDO': ['22', '13', '22', '22'],
+        'SQ_CANDIDATO': ['900001', '900002', '900003', '900004'],
+        'NR_CANDIDATO': ['22', '13', '22123', '22456'],
+        'NM_CANDIDATO': ['A', 'B', 'C', 'D'],
+        'DT_NASCIMENTO': ['01/02/1970', '#NULO#', '31/12/1980', ''],
+        'CD_GENERO': ['2', '4', '-1', '2'],
+    }
+    data.update(overrides)
+    return pd.DataFrame(data)
+
+
+class CandidatosDetalhesTest(unittest.TestCase):
+    def setUp(self):
+        self.loader = CapturingLoader()
+        self.transformer = Transformer(self.loader)
+        self.transformer.cache_estados['GO'] = 1
+        self.transformer.cache_municipios[(1, '100')] = 10
+        self.transformer.cache_cargos.update({'11': 5, '13': 6})
+        self.transformer.cache_partidos.update({'22': 7, '13': 8})
+
+    def load(self, chunk):
+        Cleaner.clean_chunk(chunk)
+        self.transformer.bulk_insert_candidatos_detalhes(3, chunk)
+        return pd.concat(self.loader.loaded.get('candidatos_detalhes', [pd.DataFrame()]))
+
+    def test_rows_without_nr_candidato_are_skipped(self):
+        chunk = consulta_cand_chunk(NR_CANDIDATO=['22', '#NULO#', None, '22456'])
+        with self.assertLogs('src.transformers.normalizer', level='WARNING'):
+            out = self.load(chunk)
+        self.assertEqual(list(out['sq_candidato']), ['900001', '900004'])
+        self.assertFalse(out['nr_candidato'].isna().any())
+
+    def test_rows_without_sq_candidato_are_skipped(self):
+        out = self.load(consulta_cand_chunk(SQ_CANDIDATO=['900001', '#NE#', '900003', '900004']))
+        self.assertEqual(list(out['nr_candidato']), ['22', '22123', '22456'])
+
+    def test_values_and_ids(self):
+        out = self.load(consulta_cand_chunk())
+        self.assertEqual(list(out['cargo_id']), [5, 5, 6, 6])
+        self.assertEqual(list(out['partido_id']), [7, 8, 7, 7])
+        self.assertEqual(list(out['municipio_id']), [10, 10, 10, 10])
+        self.assertEqual([None if pd.isna(v) else int(v) for v in out['cd_genero']], [2, 4, None, 2])
+        self.assertEqual(str(out['dt_nascimento'].iloc[0]), '1970-02-01')
+        self.assertIsNone(out['dt_nascimento'].iloc[1])
+
+    def test_missing_nr_candidato_column_skips_everything(self):
+        chunk = consulta_cand_chunk().drop(columns=['NR_CANDIDATO'])
+        with self.assertLogs('src.transformers.normalizer', level='WARNING'):
+            out = self.load(chunk)
+        self.assertTrue(out.empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.utils.id_cache import CompactIdCache
+
+SECOES = [('int', 42), ('digits', 22)]
+CANDIDATOS = [('int', 12), ('int', 22), ('int', 8), ('digits', 22)]
+
+
+class PackingTest(unittest.TestCase):
+    def test_none_packs_to_zero(self):
+        cache = CompactIdCache([('int', 8), ('int', 8)])
+        self.assertEqual(cache._pack((None, None)), 0)
+        self.assertEqual(cache._pack((0, None)), 1 << 8)
+        self.assertEqual(cache._unpack(cache._pack((None, 5))), (None, 5))
+
+    def test_leading_zeros_are_distinct_keys(self):
+        cache = CompactIdCache(SECOES)
+        self.assertNotEqual(cache._pack((1, '0012')), cache._pack((1, '12')))
+        self.assertEqual(cache._unpack(cache._pack((1, '0012'))), (1, '0012'))
+        cache[(1, '0012')] = 10
+        cache[(1, '12')] = 20
+        self.assertEqual(cache[(1, '0012')], 10)
+        self.assertEqual(cache[(1, '12')], 20)
+        self.assertEqual(cache.get((1, '012')), None)
+
+    def test_values_wider_than_their_field_overflow(self):
+        cache = CompactIdCache([('int', 4), ('digits', 8)])
+        self.assertIsNone(cache._pack((15, '1')))       # 15 + 1 needs 5 bits
+        self.assertIsNone(cache._pack((1, '1234')))     # int('11234') needs 14 bits
+        cache[(15, '1')] = 1
+        cache[(1, '1234')] = 2
+        self.assertEqual(len(cache._overflow), 2)
+        self.assertEqual(cache[(15, '1')], 1)
+        self.assertEqual(cache[(1, '1234')], 2)
+
+    def test_non_packable_keys_overflow(self):
+        cache = CompactIdCache(CANDIDATOS)
+        for key in [(1, None, 2, 'ABC'), (1, None, 2, ''), (1, -1, 2, '10'), (1, 2, 3, '１２')]:
+            self.assertIsNone(cache._pack(key), key)
+        cache[(1, None, 2, 'ABC')] = 7
+        self.assertEqual(cache[(1, None, 2, 'ABC')], 7)
+        self.assertIn((1, None, 2, 'ABC'), cache)
+
+    def test_fields_wider_than_64_bits_rejected(self):
+        with self.assertRaises(ValueError):
+            CompactIdCache([('int', 40), ('digits', 25)])
+
+
+class LookupManyTest(unittest.TestCase):
+    def _fill(self, cache):
+        cache.update({
+            (1, '0012'): 10,
+            (1, '12'): 20,
+            (None, '5'): 30,
+            (2, 'X1'): 40,                  # overflow
+            ((1 << 42) - 1, '7'): 50,       # zona_id wider than its field: overflow
+        }.items())
+
+    def test_matches_get(self):
+        for max_size in (None, 100):
+            cache = CompactIdCache(SECOES, max_size=max_size)
+            self._fill(cache)
+            zonas = pd.array([1, 1, None, 2, (1 << 42) - 1, 1, 3], dtype='Int64')
+            secoes = pd.Series(['0012', '12', '5', 'X1', '7', '012', '12'])
+            result = cache.lookup_many(zonas, secoes)
+            expected = [10, 20, 30, 40, 50, None, None]
+            self.assertEqual([None if pd.isna(v) else int(v) for v in result], expected, max_size)
+
+    def test_sorted_arrays_after_merge(self):
+        cache = CompactIdCache(SECOES)
+        cache.update(((z, str(s)), z * 1000 + s) for z in range(50) for s in range(50))
+        zonas = np.repeat(np.arange(50), 50)
+        secoes = [str(s) for s in range(50)] * 50
+        result = cache.lookup_many(zonas, secoes).to_numpy(dtype=np.int64)
+        np.testing.assert_array_equal(result, zonas * 1000 + np.tile(np.arange(50), 50))
+
+    def test_lru_evicts_least_recent(self):
+        cache = CompactIdCache(SECOES, max_size=2)
+        cache[(1, '1')] = 1
+        cache[(1, '2')] = 2
+        cache.get((1, '1'))
+        cache[(1, '3')] = 3
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get((1, '2')))
+        self.assertEqual(cache.get((1, '1')), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
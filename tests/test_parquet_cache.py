@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import parquet_cache
+
+
+@unittest.skipUnless(parquet_cache.HAS_PYARROW, 'pyarrow not installed')
+class StaleCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, name, body):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='latin1') as f:
+            f.write(body)
+        return path
+
+    def test_changed_csv_replaces_only_its_own_cache(self):
+        x = self._write('x.csv', 'SG_UF;QT_VOTOS\nGO;1\n')
+        x2t = self._write('x.2t.csv', 'SG_UF;QT_VOTOS\nGO;2\n')
+        old = parquet_cache.ensure_parquet(x)
+        other = parquet_cache.ensure_parquet(x2t)
+
+        self._write('x.csv', 'SG_UF;QT_VOTOS\nGO;3\n')
+        os.utime(x, (0, 0))
+        new = parquet_cache.ensure_parquet(x)
+
+        self.assertNotEqual(old, new)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        self.assertTrue(os.path.exists(other))
+
+    def test_other_parse_options_are_kept(self):
+        x = self._write('x.csv', 'SG_UF;QT_VOTOS\nGO;1\n')
+        typed = parquet_cache.ensure_parquet(x)
+        latin = parquet_cache.ensure_parquet(x, encoding='utf-8')
+        self.assertNotEqual(typed, latin)
+        self.assertTrue(os.path.exists(typed))
+        self.assertTrue(os.path.exists(latin))
+
+
+if __name__ == '__main__':
+    unittest.main()